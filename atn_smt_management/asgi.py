@@ -5,3 +5,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'atn_smt_management.settings')
 
 application = get_asgi_application()
+
+# connect the shelfs in the background once the application is loaded
+from smt_management_app.shelf_warmup import start_warmup  # noqa: E402
+
+start_warmup()
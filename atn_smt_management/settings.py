@@ -46,6 +46,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "smt_management_app.middleware.ShelfBackendUnavailableMiddleware",
 ]
 
 ROOT_URLCONF = "atn_smt_management.urls"
@@ -76,6 +77,9 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # file based test database, an in-memory one locks whole tables between
+        # threads instead of waiting like the production database does
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 
@@ -136,3 +140,14 @@ REST_FRAMEWORK = {
         "rest_framework.authentication.TokenAuthentication",
     ],
 }
+
+# "host:port" of the LED device service (manage.py runscript led_service). Unset,
+# every process drives the shelfs itself, which only works with a single worker.
+LED_SERVICE_ADDRESS = os.environ.get("LED_SERVICE_ADDRESS") or None
+
+# seconds the Sophia (XGate) handler waits before each row command on the bus,
+# see shelf_handlers/xgate_handler.py. Unset keeps the waits of the old handler.
+if os.environ.get("XGATE_ROW_DELAY"):
+    XGATE_ROW_DELAY = float(os.environ["XGATE_ROW_DELAY"])
+if os.environ.get("XGATE_CLEAR_ROW_DELAY"):
+    XGATE_CLEAR_ROW_DELAY = float(os.environ["XGATE_CLEAR_ROW_DELAY"])
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class SmtManagementAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'smt_management_app'
+
+    def ready(self):
+        # connect the shelfs in the background, requests are served meanwhile
+        from .shelf_warmup import should_warm_up, start_warmup
+
+        if should_warm_up():
+            start_warmup()
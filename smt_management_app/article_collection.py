@@ -0,0 +1,81 @@
+from .models import ArticleCollection, StorageSlot
+from .utils.led_shelf_dispatcher import get_dispatcher
+
+# Collecting by article lights every stored carrier of the article. The collection
+# remembers these slots, so confirming or cancelling it switches off exactly its
+# lamps, other operators' pick lights and uninvolved shelfs are left alone.
+
+
+def start_article_collection(article_name, slots, station=None):
+    """
+    Record the slots lit for collecting an article.
+
+    Args:
+        article_name: Name of the collected article
+        slots: StorageSlot instances that were lit
+        station: Optional name of the station collecting the article
+
+    Returns:
+        ArticleCollection
+    """
+    collection = ArticleCollection.objects.create(
+        article_id=article_name, station=station
+    )
+    collection.slots.add(*slots)
+    return collection
+
+
+def get_article_collections(request, article_name=None, slot=None):
+    """
+    The open collections a request refers to: the one given by ?collection=,
+    otherwise those that lit slot, otherwise all collections of the article.
+
+    Returns:
+        ArticleCollection queryset
+    """
+    collections = ArticleCollection.objects.all()
+    try:
+        return collections.filter(pk=int(request.GET["collection"]))
+    except (KeyError, ValueError):
+        pass
+    if slot is not None:
+        return collections.filter(slots=slot)
+    return collections.filter(article_id=article_name)
+
+
+def end_article_collections(collections):
+    """
+    Switch off the lamps of article collections and delete them. Slots another
+    open collection lit as well stay on. Every shelf gets one _LED_Off_Control.
+
+    Args:
+        collections: ArticleCollection queryset
+
+    Returns:
+        list: The switched off slots
+    """
+    collection_ids = list(collections.values_list("pk", flat=True))
+    if not collection_ids:
+        return []
+
+    slots = list(
+        StorageSlot.objects.filter(article_collections__in=collection_ids)
+        .exclude(
+            article_collections__in=ArticleCollection.objects.exclude(
+                pk__in=collection_ids
+            )
+        )
+        .select_related("storage")
+        .distinct()
+    )
+    ArticleCollection.objects.filter(pk__in=collection_ids).delete()
+    StorageSlot.set_led_state(slots, 0)
+
+    storages = {}
+    lamps_by_storage = {}
+    for slot in slots:
+        storages.setdefault(slot.storage_id, slot.storage)
+        lamps_by_storage.setdefault(slot.storage_id, []).append(slot.name)
+    for storage_name, lamps in lamps_by_storage.items():
+        get_dispatcher(storages[storage_name]).submit("_LED_Off_Control", lamps=lamps)
+    return slots
@@ -0,0 +1,200 @@
+import time
+
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Carrier, CollectQueueEntry
+
+# The collect queue as its own table. Every change gets the next queue version, so
+# a client that sends the version it has seen (?since=) only gets the entries that
+# changed after it instead of the whole queue with every scan response.
+
+# two stations changing the queue at once may pick the same next version, and on
+# sqlite a transaction that read before writing fails at once ("database is locked")
+# while another connection (e.g. a shelf worker storing its lighthouse) commits
+VERSION_RETRIES = 5
+
+
+def _carrier_names(carriers):
+    if hasattr(carriers, "values_list"):
+        return list(carriers.values_list("name", flat=True))
+    return [carrier.name for carrier in carriers]
+
+
+def current_queue_version():
+    return CollectQueueEntry.objects.aggregate(version=Max("version"))["version"] or 0
+
+
+def _change_entries(carriers, collecting, station=None, progressive=False):
+    """
+    Queue (collecting) or unqueue carriers and set Carrier.collecting accordingly.
+
+    Returns:
+        list: Names of the carriers whose queue state changed
+    """
+    names = _carrier_names(carriers)
+    if not names:
+        return []
+
+    for retry in range(VERSION_RETRIES):
+        try:
+            with transaction.atomic():
+                changed = _write_entries(names, collecting, station, progressive)
+            break
+        except IntegrityError:
+            if retry == VERSION_RETRIES - 1:
+                raise
+        except OperationalError as e:
+            if "locked" not in str(e) or retry == VERSION_RETRIES - 1:
+                raise
+            time.sleep(0.01 * (retry + 1))
+
+    if not hasattr(carriers, "values_list"):
+        for carrier in carriers:
+            carrier.collecting = collecting
+            carrier._loaded_collecting = collecting
+    return changed
+
+
+def _write_entries(names, collecting, station, progressive):
+    now = timezone.now()
+    entries = {
+        entry.carrier_name: entry
+        for entry in CollectQueueEntry.objects.filter(carrier_name__in=names)
+    }
+    version = current_queue_version()
+    created = []
+    updated = []
+    for name in dict.fromkeys(names):
+        entry = entries.get(name)
+        queued = entry is not None and entry.removed_at is None
+        if queued == collecting:
+            continue
+        version += 1
+        if entry is None:
+            entry = CollectQueueEntry(carrier_name=name, carrier_id=name)
+            created.append(entry)
+        else:
+            updated.append(entry)
+        entry.version = version
+        if collecting:
+            entry.carrier_id = name
+            entry.station = station
+            entry.progressive = progressive
+            entry.position = version
+            entry.queued_at = now
+            entry.removed_at = None
+        else:
+            entry.removed_at = now
+
+    CollectQueueEntry.objects.bulk_create(created)
+    CollectQueueEntry.objects.bulk_update(
+        updated,
+        [
+            "carrier",
+            "station",
+            "progressive",
+            "position",
+            "version",
+            "queued_at",
+            "removed_at",
+        ],
+    )
+    Carrier.objects.filter(name__in=names).exclude(collecting=collecting).update(
+        collecting=collecting
+    )
+    return [entry.carrier_name for entry in created + updated]
+
+
+def enqueue_carriers(carriers, station=None, progressive=False):
+    """
+    Add carriers to the end of the collect queue, already queued carriers keep
+    their place.
+
+    Args:
+        carriers: Carrier queryset or iterable of Carrier instances, the instances
+            get collecting=True as well
+        station: Optional name of the station that queued them
+        progressive: The carriers are lit pick by pick, see collect_job?next=
+
+    Returns:
+        list: Names of the newly queued carriers
+    """
+    return _change_entries(carriers, True, station, progressive)
+
+
+def dequeue_carriers(carriers):
+    """Remove carriers from the collect queue, see enqueue_carriers."""
+    return _change_entries(carriers, False)
+
+
+def _queue_item(carrier_name, storage_name, slot_qr_value):
+    return {"carrier": carrier_name, "storage": storage_name, "slot": slot_qr_value}
+
+
+def get_collect_queue(since=None):
+    """
+    Return the collect queue in one joined query.
+
+    Args:
+        since: Optional queue version the client has seen
+
+    Returns:
+        dict: {"queue_version": ..., "queue": [...]} or, with since, only the
+        changes {"queue_version": ..., "queue_delta": {"since": ..., "added":
+        [...], "removed": [carrier names]}}
+    """
+    version = current_queue_version()
+    if since is None or since > version:
+        # a client ahead of the server (e.g. a reset database) gets the full queue
+        rows = (
+            CollectQueueEntry.objects.filter(
+                removed_at__isnull=True,
+                carrier__archived=False,
+                carrier__storage_slot__isnull=False,
+            )
+            .order_by("position")
+            .values_list(
+                "carrier_name",
+                "carrier__storage_slot__storage_id",
+                "carrier__storage_slot__qr_value",
+            )
+        )
+        return {
+            "queue_version": version,
+            "queue": [_queue_item(*row) for row in rows],
+        }
+
+    added = []
+    removed = []
+    rows = (
+        CollectQueueEntry.objects.filter(version__gt=since)
+        .order_by("position")
+        .values_list(
+            "carrier_name",
+            "removed_at",
+            "carrier__archived",
+            "carrier__storage_slot__storage_id",
+            "carrier__storage_slot__qr_value",
+        )
+    )
+    for carrier_name, removed_at, archived, storage_name, slot_qr_value in rows:
+        # same filter as the full queue: archived or unstored carriers are not listed
+        if removed_at is None and archived is False and storage_name is not None:
+            added.append(_queue_item(carrier_name, storage_name, slot_qr_value))
+        else:
+            removed.append(carrier_name)
+    return {
+        "queue_version": version,
+        "queue_delta": {"since": since, "added": added, "removed": removed},
+    }
+
+
+def collect_queue_fields(request):
+    """get_collect_queue() for the ?since= parameter of a request."""
+    try:
+        since = int(request.GET["since"])
+    except (KeyError, ValueError):
+        since = None
+    return get_collect_queue(since)
@@ -1,5 +1,6 @@
-from threading import Thread, Timer
+import json
 
+from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 from django.db.models import Q
 
@@ -8,6 +9,7 @@ from .models import (
     Provider,
     Article,
     Carrier,
+    CollectQueueEntry,
     Machine,
     MachineSlot,
     Storage,
@@ -18,8 +20,60 @@ from .models import (
     LocalFile,
 )
 
-from .utils.led_shelf_dispatcher import LED_shelf_dispatcher
+from .utils.led_shelf_dispatcher import get_dispatcher
 from .helpers import find_slot_by_qr_code, slot_matches_qr_code
+from .collect_queue import collect_queue_fields, dequeue_carriers, enqueue_carriers
+from .article_collection import (
+    end_article_collections,
+    get_article_collections,
+    start_article_collection,
+)
+from .pick_path import pick_list, sequence_picks
+from .slot_index import carriers_moved
+
+# slot fields of a pick, see pick_path.sequence_picks
+PICK_FIELDS = (
+    "storage_slot__storage_id",
+    "storage_slot__name",
+    "storage_slot__qr_value",
+    "name",
+)
+
+
+def light_next_pick(storage, collected):
+    """
+    Light a next pick of a storage for every collected carrier that collect_job
+    queued with ?next=N, so N picks stay lit. The next picks are the queued
+    carriers of such jobs that are not lit yet, in pick path order. Carriers
+    collected without ?next= light nothing.
+
+    Args:
+        storage: Storage the carriers were collected from
+        collected: Names of the collected (already dequeued) carriers
+    """
+    count = CollectQueueEntry.objects.filter(
+        carrier_name__in=collected, progressive=True
+    ).count()
+    if not count:
+        return
+    picks = sequence_picks(
+        Carrier.objects.filter(
+            collecting=True,
+            archived=False,
+            collect_queue_entry__progressive=True,
+            storage_slot__storage=storage,
+            storage_slot__led_state=0,
+        ).values_list(*PICK_FIELDS)
+    )[:count]
+    if not picks:
+        return
+    lamps = [lamp for _, lamp, _, _ in picks]
+    StorageSlot.set_led_state(
+        StorageSlot.objects.filter(storage=storage, name__in=lamps), 1
+    )
+    get_dispatcher(storage).submit(
+        "_LED_On_Control", lights_dict={"lamps": {lamp: "blue" for lamp in lamps}}
+    )
 
 
 def collect_single_carrier(request, carrier_name):
@@ -59,13 +113,11 @@ def collect_single_carrier(request, carrier_name):
     # TODO add carrier to the collect queue
 
     # Turn on the LED for the carrier's storage slot.
-    carrier.storage_slot.led_state = 1
-    carrier.storage_slot.save()
+    StorageSlot.set_led_state([carrier.storage_slot], 1)
 
-    Thread(
-        target=LED_shelf_dispatcher(carrier.storage_slot.storage).led_on,
-        kwargs={"lamp": carrier.storage_slot.name, "color": "blue"},
-    ).start()
+    get_dispatcher(carrier.storage_slot.storage).submit(
+        "led_on", lamp=carrier.storage_slot.name, color="blue"
+    )
 
     return JsonResponse(
         {
@@ -106,23 +158,14 @@ def collect_single_carrier_confirm(request, carrier_name):
 
     # Clear the carrier's storage slot and turn off LED and working_light
     slot = carrier.storage_slot
-    slot.led_state = 1
-    slot.save()
+    # the green confirmation light does not select the slot
+    StorageSlot.set_led_state([slot], 0)
 
     carrier.storage_slot = None
     carrier.save()
 
-    led_dispatcher = LED_shelf_dispatcher(slot.storage)
-    Thread(
-        target=led_dispatcher.led_on, kwargs={"lamp": slot.name, "color": "green"}
-    ).start()
-    slot.led_state = 0
-    slot.save()
-    Timer(
-        interval=2,
-        function=led_dispatcher.led_off,
-        kwargs={"lamp": slot.name},
-    ).start()
+    led_dispatcher = get_dispatcher(slot.storage)
+    led_dispatcher.flash(slot.name, "green")
 
     return JsonResponse({"success": True})
 
@@ -145,21 +188,10 @@ def collect_single_carrier_cancel(request, carrier_name):
 
     # turn off LED
     slot = carrier.storage_slot
+    StorageSlot.set_led_state([slot], 0)
 
-    slot.led_state = 1
-    slot.save()
-
-    led_dispatcher = LED_shelf_dispatcher(slot.storage)
-    Thread(
-        target=led_dispatcher.led_on, kwargs={"lamp": slot.name, "color": "red"}
-    ).start()
-    slot.led_state = 0
-    slot.save()
-    Timer(
-        interval=2,
-        function=led_dispatcher.led_off,
-        kwargs={"lamp": slot.name},
-    ).start()
+    led_dispatcher = get_dispatcher(slot.storage)
+    led_dispatcher.flash(slot.name, "red")
 
     return JsonResponse({"success": True})
 
@@ -175,6 +207,7 @@ def collect_carrier(request, carrier_name):
 
     Returns:
         JsonResponse: A JSON response indicating the success or failure of the operation, along with relevant messages and the current collection queue.
+        With ?since=<queue_version> only the queue changes since that version are returned.
     """
 
     # Strip leading and trailing whitespace from the carrier name.
@@ -196,39 +229,21 @@ def collect_carrier(request, carrier_name):
         return JsonResponse({"success": False, "message": "Already in queue."})
 
     # add carrier to the queue
-    carrier.collecting = True
-    carrier.save()
+    enqueue_carriers([carrier], station=request.GET.get("station"))
 
     # turn on the LED
-    carrier.storage_slot.led_state = 1
-    carrier.storage_slot.save()
+    StorageSlot.set_led_state([carrier.storage_slot], 1)
 
-    led_dispatcher = LED_shelf_dispatcher(carrier.storage_slot.storage)
+    led_dispatcher = get_dispatcher(carrier.storage_slot.storage)
 
-    Thread(
-        target=led_dispatcher.led_on,
-        kwargs={"lamp": carrier.storage_slot.name, "color": "blue"},
-    ).start()
-
-    # FIXED: Filter out carriers without storage_slot
-    queued_carriers = Carrier.objects.filter(
-        collecting=True, archived=False, storage_slot__isnull=False
-    )
-    collection_queue = [
-        {
-            "carrier": queued_carrier.name,
-            "storage": queued_carrier.storage_slot.storage.name,
-            "slot": queued_carrier.storage_slot.qr_value,
-        }
-        for queued_carrier in queued_carriers
-    ]
+    led_dispatcher.submit("led_on", lamp=carrier.storage_slot.name, color="blue")
 
     response_message = {
         "success": True,
-        "storage": carrier.storage_slot.storage.name,
+        "storage": carrier.storage_slot.storage_id,
         "slot": carrier.storage_slot.qr_value,
         "carrier": carrier.name,
-        "queue": collection_queue,
+        **collect_queue_fields(request),
     }
 
     return JsonResponse(response_message)
@@ -277,52 +292,23 @@ def collect_carrier_confirm(request, carrier_name, storage_name, slot_name):
             }
         )
 
-    led_dispatcher = LED_shelf_dispatcher(carrier.storage_slot.storage)
-    carrier.storage_slot.led_state = 1
-    carrier.storage_slot.save()
-
-    Thread(
-        target=led_dispatcher.led_on, kwargs={"lamp": slot.name, "color": "green"}
-    ).start()
-    carrier.storage_slot.led_state = 0
-    carrier.storage_slot.save()
-
-    Timer(
-        interval=2,
-        function=led_dispatcher.led_off,
-        kwargs={"lamp": slot.name},
-    ).start()
-
-    # FIXED: Build queue BEFORE clearing storage_slot
-    # Get current queue before modifications
-    collect_queue_queryset = Carrier.objects.filter(
-        collecting=True, archived=False, storage_slot__isnull=False
-    ).exclude(
-        pk=carrier.pk
-    )  # Exclude current carrier
-
-    collect_queue = [
-        {
-            "carrier": c.name,
-            "storage": c.storage_slot.storage.name,
-            "slot": c.storage_slot.qr_value,
-        }
-        for c in collect_queue_queryset
-    ]
+    led_dispatcher = get_dispatcher(carrier.storage_slot.storage)
+    StorageSlot.set_led_state([carrier.storage_slot], 0)
 
-    # Clear the carriers storage slot
-    turned_off_slot = carrier.storage_slot
+    led_dispatcher.flash(slot.name, "green")
 
+    # Clear the carriers storage slot and remove it from the queue
     carrier.storage_slot = None
-    carrier.collecting = False
     carrier.save()
+    dequeue_carriers([carrier])
+    light_next_pick(slot.storage, [carrier.name])
 
     response_message = {
         "success": True,
         "storage": None,
         "slot": None,
         "carrier": carrier.name,
-        "queue": collect_queue,
+        **collect_queue_fields(request),
     }
 
     return JsonResponse(response_message)
@@ -342,59 +328,163 @@ def collect_carrier_cancel(request, carrier_name):
 
     # Turn off the LED for the carrier's storage slot.
 
-    led_dispatcher = LED_shelf_dispatcher(carrier.storage_slot.storage)
-    carrier.storage_slot.led_state = 1
-    carrier.storage_slot.save()
-    Thread(
-        target=led_dispatcher.led_on, kwargs={"lamp": slot.name, "color": "red"}
-    ).start()
-    carrier.storage_slot.led_state = 0
-    carrier.storage_slot.save()
-    Timer(
-        interval=2,
-        function=led_dispatcher.led_off,
-        kwargs={"lamp": slot.name},
-    ).start()
-
-    carrier.collecting = False
-    carrier.save()
-
-    # FIXED: Filter out carriers without storage_slot
-    collect_queue_queryset = Carrier.objects.filter(
-        collecting=True, archived=False, storage_slot__isnull=False
-    )
+    led_dispatcher = get_dispatcher(carrier.storage_slot.storage)
+    StorageSlot.set_led_state([slot], 0)
+    led_dispatcher.flash(slot.name, "red")
 
-    collect_queue = [
-        {
-            "carrier": c.name,
-            "storage": c.storage_slot.storage.name,
-            "slot": c.storage_slot.qr_value,
-        }
-        for c in collect_queue_queryset
-    ]
+    dequeue_carriers([carrier])
+    light_next_pick(slot.storage, [carrier.name])
 
     response_message = {
         "success": True,
         "storage": None,
         "slot": None,
         "carrier": carrier.name,
-        "queue": collect_queue,
+        **collect_queue_fields(request),
     }
 
     return JsonResponse(response_message)
 
 
+def get_carrier_confirm_error(carrier, storage_name, slot_name):
+    """
+    Return why a collected carrier can not be confirmed, None if it can.
+
+    Args:
+        carrier: Carrier with its storage slot loaded
+        storage_name: Scanned storage name, empty to skip the check
+        slot_name: Scanned slot QR code, empty to skip the check
+    """
+    if carrier.archived:
+        return "Carrier has been archived."
+    if not carrier.collecting:
+        return f"Carrier {carrier} is not in the collect queue."
+    slot = carrier.storage_slot
+    if slot is None:
+        return f"Carrier {carrier.name} is not stored."
+    if storage_name and slot.storage_id != storage_name:
+        return f"Carrier {carrier.name} is in storage {slot.storage_id} not in storage {storage_name}"
+    if slot_name and not slot_matches_qr_code(slot, slot_name):
+        return (
+            f"Carrier {carrier.name} is in slot {slot.qr_value} not in slot {slot_name}"
+        )
+    return None
+
+
+@csrf_exempt
+def collect_carriers_confirm_batch(request):
+    """
+    Confirm a whole cart of collected carriers at once.
+
+    Expects a JSON body {"carriers": [...]} with a carrier name or a
+    {"carrier": name, "slot": slot QR code, "storage": storage name} object per
+    scanned carrier, slot and storage are optional. All carriers are validated with
+    one query, the confirmed ones leave their slots with one update and every shelf
+    flashes its confirmed slots green with one LED command.
+
+    Returns:
+        JsonResponse with the confirmed and the rejected carriers and the collect
+        queue (see ?since=)
+    """
+    try:
+        body = json.loads(request.body or "{}")
+        items = [
+            item if isinstance(item, dict) else {"carrier": item}
+            for item in body["carriers"]
+        ]
+        items = [
+            {
+                field: (item.get(field) or "").strip()
+                for field in ("carrier", "storage", "slot")
+            }
+            for item in items
+        ]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse(
+            {"success": False, "message": "Expected a JSON list of carriers."}
+        )
+
+    carriers_by_name = {
+        carrier.name: carrier
+        for carrier in Carrier.objects.filter(
+            name__in=[item["carrier"] for item in items]
+        ).select_related("storage_slot__storage")
+    }
+
+    confirmed = {}
+    rejected = []
+    for item in items:
+        carrier = carriers_by_name.get(item["carrier"])
+        if carrier is None:
+            error = "Carrier not found."
+        elif carrier.name in confirmed:
+            error = f"Carrier {carrier.name} was scanned twice."
+        else:
+            error = get_carrier_confirm_error(carrier, item["storage"], item["slot"])
+        if error:
+            rejected.append({"carrier": item["carrier"], "message": error})
+        else:
+            confirmed[carrier.name] = carrier
+
+    slots = [carrier.storage_slot for carrier in confirmed.values()]
+    if confirmed:
+        Carrier.objects.filter(name__in=confirmed).update(
+            storage_slot=None, storage=None, storage_slot_qr_value=None
+        )
+        moves = []
+        for carrier in confirmed.values():
+            carrier.storage_slot = None
+            carrier.storage = None
+            carrier.storage_slot_qr_value = None
+            moves.append((carrier._loaded_slots, carrier._slots()))
+            carrier._loaded_slots = carrier._slots()
+        carriers_moved(moves)
+        dequeue_carriers(list(confirmed.values()))
+        # after the queue transaction, the workers write the lighthouse meanwhile
+        StorageSlot.set_led_state(slots, 0)
+
+    storages = {}
+    lamps_by_storage = {}
+    carriers_by_storage = {}
+    for carrier_name, slot in zip(confirmed, slots):
+        storages.setdefault(slot.storage_id, slot.storage)
+        lamps_by_storage.setdefault(slot.storage_id, []).append(slot.name)
+        carriers_by_storage.setdefault(slot.storage_id, []).append(carrier_name)
+    for storage_name, lamps in lamps_by_storage.items():
+        storage = storages[storage_name]
+        get_dispatcher(storage).flash_lamps(lamps, "green")
+        # as many next picks as single confirms of these carriers would light
+        light_next_pick(storage, carriers_by_storage[storage_name])
+
+    return JsonResponse(
+        {
+            "success": bool(confirmed),
+            "confirmed": [
+                {
+                    "carrier": carrier.name,
+                    "storage": slot.storage_id,
+                    "slot": slot.qr_value,
+                }
+                for carrier, slot in zip(confirmed.values(), slots)
+            ],
+            "rejected": rejected,
+            **collect_queue_fields(request),
+        }
+    )
+
+
 def collect_carrier_by_article(request, article_name):
     """
     Collects a carrier by article from a storage unit.
-    Lights up slots containing the specified article.
+    Lights up slots containing the specified article and records them as an
+    article collection, confirm and cancel switch off exactly these lamps.
 
     Args:
-    - request: HTTP request object
+    - request: HTTP request object (optional ?station=)
     - article: Article number to collect
 
     Returns:
-    - JsonResponse indicating success or failure
+    - JsonResponse indicating success or failure, with the collection id
     """
     article_name = article_name.strip()
     slot_queryset = StorageSlot.objects.filter(
@@ -417,7 +507,7 @@ def collect_carrier_by_article(request, article_name):
 
     storage_names = slot_queryset.values_list("storage", flat=True).distinct()
     storages = Storage.objects.filter(pk__in=storage_names)
-    dispatchers = {storage.name: LED_shelf_dispatcher(storage) for storage in storages}
+    dispatchers = {storage.name: get_dispatcher(storage) for storage in storages}
     slots_by_storage = {storage.name: [] for storage in storages}
 
     for slot in slot_queryset:
@@ -425,24 +515,33 @@ def collect_carrier_by_article(request, article_name):
 
     for storage_name, slots in slots_by_storage.items():
         lights_dict = {"lamps": {slot.name: "blue" for slot in slots}}
-        StorageSlot.objects.filter(id__in=[slot.id for slot in slots]).update(
-            led_state=1
-        )
-        Thread(
-            target=dispatchers[storage_name]._LED_On_Control,
-            kwargs={"lights_dict": lights_dict},
-        ).start()
+        StorageSlot.set_led_state(slots, 1)
+        dispatchers[storage_name].submit("_LED_On_Control", lights_dict=lights_dict)
 
-    return JsonResponse({"success": True})
+    collection = start_article_collection(
+        article_name,
+        [slot for slots in slots_by_storage.values() for slot in slots],
+        station=request.GET.get("station"),
+    )
+
+    # the lit slots in the order of a walk along the shelfs
+    picks = sequence_picks(
+        Carrier.objects.filter(storage_slot__in=slot_queryset).values_list(*PICK_FIELDS)
+    )
+    return JsonResponse(
+        {"success": True, "collection": collection.pk, "picks": pick_list(picks)}
+    )
 
 
 def collect_carrier_by_article_confirm(request, carrier_name):
     """
     Confirms carrier by article from a storage unit.
-    Empties the slot and resets LEDs upon carrier confirmation.
+    Empties the slot and ends its article collection, only the lamps the
+    collection lit are switched off.
 
     Args:
-    - request: HTTP request object
+    - request: HTTP request object (optional ?collection=, defaults to the
+      collections that lit the carrier's slot)
 
     - article: Article number of the carrier
     - carrier: Carrier name to confirm
@@ -472,29 +571,15 @@ def collect_carrier_by_article_confirm(request, carrier_name):
     carrier.storage = None
     carrier.save()
 
-    storages = Storage.objects.all()
-    dispatchers = {storage.name: LED_shelf_dispatcher(storage) for storage in storages}
-    # Update LED state for all storage slots to off
-    StorageSlot.objects.update(led_state=0)
-
-    # Reset LEDs after carrier confirmation
-    for storage in storages:
-        Thread(target=dispatchers[storage.name].reset_leds).start()
-
-    collected_slot.led_state = 1
-    collected_slot.save()
-    # turn on collected_slot for a short duration
-    Thread(
-        target=dispatchers[collected_slot.storage.name].led_on,
-        kwargs={"lamp": collected_slot.name, "color": "green"},
-    ).start()
-    collected_slot.led_state = 0
-    collected_slot.save()
-    Timer(
-        interval=2,
-        function=dispatchers[collected_slot.storage.name].led_off,
-        kwargs={"lamp": collected_slot.name},
-    ).start()
+    # switch off the lamps of this collection, not every shelf
+    switched_off = end_article_collections(
+        get_article_collections(request, slot=collected_slot)
+    )
+    if collected_slot not in switched_off:
+        StorageSlot.set_led_state([collected_slot], 0)
+
+    # turn on collected_slot for a short duration, its led_state is already 0
+    get_dispatcher(collected_slot.storage).flash(collected_slot.name, "green")
 
     return JsonResponse({"success": True})
 
@@ -514,42 +599,22 @@ def collect_carrier_by_article_select(request, article_name, carrier_name, led_s
     if not carrier.storage_slot:
         return JsonResponse({"success": False, "message": "Carrier is not stored."})
     # Light up or turn off the selected carrier's slot
-    carrier.storage_slot.led_state = int(led_state)
-    carrier.storage_slot.save()
-    led_dispatcher = LED_shelf_dispatcher(carrier.storage_slot.storage)
+    StorageSlot.set_led_state([carrier.storage_slot], int(led_state))
+    led_dispatcher = get_dispatcher(carrier.storage_slot.storage)
     if led_state:
-        Thread(
-            target=led_dispatcher.led_on,
-            kwargs={"lamp": carrier.storage_slot.name, "color": "yellow"},
-        ).start()
+        led_dispatcher.submit("led_on", lamp=carrier.storage_slot.name, color="yellow")
     else:
-        Thread(
-            target=led_dispatcher.led_off,
-            kwargs={"lamp": carrier.storage_slot.name},
-        ).start()
+        led_dispatcher.submit("led_off", lamp=carrier.storage_slot.name)
     return JsonResponse({"success": True})
 
 
 def collect_carrier_by_article_cancel(request, article_name):
     # TODO handle collecting status of carriers
-    # get all slots that are turned on and have carrier with article_name and filter down to list of storages that need to be reset
-    stored_carriers_with_article = Carrier.objects.filter(
-        article__name=article_name, storage_slot__isnull=False
+    # switch off the lamps of the article's collections (or of ?collection=) only
+    end_article_collections(
+        get_article_collections(request, article_name=article_name.strip())
     )
 
-    slot_ids = stored_carriers_with_article.values_list("storage_slot__pk", flat=True)
-    slot_queryset = StorageSlot.objects.filter(pk__in=slot_ids)
-
-    storage_names = slot_queryset.values_list("storage", flat=True).distinct()
-    storages = Storage.objects.filter(pk__in=storage_names)
-
-    dispatchers = {storage.name: LED_shelf_dispatcher(storage) for storage in storages}
-    # Update LED state for all storage slots to off
-    slot_queryset.update(led_state=0)
-    # Reset LEDs
-    for storage in storages:
-        Thread(target=dispatchers[storage.name].reset_leds).start()
-
     return JsonResponse({"success": True})
 
 
@@ -613,18 +678,18 @@ def collect_carrier_by_article_select(request, article_name, carrier_name, led_s
     
     # Get the storage slot and LED dispatcher
     slot = carrier.storage_slot
-    led_dispatcher = LED_shelf_dispatcher(slot.storage)
+    led_dispatcher = get_dispatcher(slot.storage)
     
     # Handle LED state change
     if led_state == 'true':
         # Turn on LED (select carrier)
-        slot.led_state = 1
-        slot.save()
+        StorageSlot.set_led_state([slot], 1)
+        # confirm and cancel of the collection switch it off again
+        collection = get_article_collections(request, article_name=article_name).last()
+        if collection is not None:
+            collection.slots.add(slot)
         
-        Thread(
-            target=led_dispatcher.led_on,
-            kwargs={"lamp": slot.name, "color": "blue"}
-        ).start()
+        led_dispatcher.submit("led_on", lamp=slot.name, color="blue")
         
         response_message = {
             "success": True,
@@ -639,13 +704,12 @@ def collect_carrier_by_article_select(request, article_name, carrier_name, led_s
         
     else:  # led_state == 'false'
         # Turn off LED (deselect carrier)
-        slot.led_state = 0
-        slot.save()
+        StorageSlot.set_led_state([slot], 0)
+        slot.article_collections.remove(
+            *get_article_collections(request, article_name=article_name)
+        )
         
-        Thread(
-            target=led_dispatcher.led_off,
-            kwargs={"lamp": slot.name}
-        ).start()
+        led_dispatcher.submit("led_off", lamp=slot.name)
         
         response_message = {
             "success": True,
@@ -662,49 +726,78 @@ def collect_carrier_by_article_select(request, article_name, carrier_name, led_s
 
 
 def collect_job(request, job_name):
-    # TODO handle collecting status of carriers
+    """
+    Queue and light the stored carriers of a job.
+
+    Carriers, their slots (with the combined group lamps) and storages come from one
+    joined query, collecting and led_state are written with one bulk update each
+    and every shelf gets one pre-expanded lamp map, so the number of queries does
+    not grow with the size of the job.
+
+    Query parameters:
+        station: Optional name of the station that collects the job
+        next: Only light the next N picks of every storage, see light_next_pick
+    """
     job_name = job_name.strip()
 
-    job_queryset = Job.objects.filter(name=job_name, archived=False)
-    if not job_queryset:
+    job = Job.objects.filter(name=job_name, archived=False).first()
+    if job is None:
         return JsonResponse({"success": False, "message": "Job does not exist"})
-
-    job = job_queryset.first()
     if job.status == 0:
         return JsonResponse({"success": False, "message": "Job is not fully prepared."})
     if job.status == 2:
         return JsonResponse({"success": False, "message": "Job is already complete."})
 
-    stored_carriers_of_job = job.carriers.filter(storage_slot__isnull=False)
-
-    number_of_carriers_of_job = job.carriers.all().count()
-    number_of_stored_carriers_of_job = stored_carriers_of_job.count()
-
-    storage_names = stored_carriers_of_job.values_list(
-        "storage_slot__storage__name", flat=True
-    ).distinct()
+    carriers = list(job.carriers.select_related("storage_slot__storage"))
+    stored_carriers = {
+        carrier.name: carrier for carrier in carriers if carrier.storage_slot
+    }
+    number_of_carriers_of_job = len(carriers)
+    number_of_stored_carriers_of_job = len(stored_carriers)
+
+    # with ?next=N only the next N picks of every storage light up, confirming or
+    # cancelling a carrier lights the following one, see light_next_pick
+    try:
+        next_picks = int(request.GET["next"])
+    except (KeyError, ValueError):
+        next_picks = None
+    enqueue_carriers(
+        list(stored_carriers.values()),
+        station=request.GET.get("station"),
+        progressive=next_picks is not None,
+    )
 
-    storages = Storage.objects.filter(pk__in=storage_names)
-    dispatchers = {storage.name: LED_shelf_dispatcher(storage) for storage in storages}
+    picks = sequence_picks(
+        (
+            carrier.storage_slot.storage_id,
+            carrier.storage_slot.name,
+            carrier.storage_slot.qr_value,
+            carrier.name,
+        )
+        for carrier in stored_carriers.values()
+    )
 
-    stored_carriers_of_job.update(collecting=True)
+    slots_by_storage = {}
+    for storage_name, _, _, carrier_name in picks:
+        slots = slots_by_storage.setdefault(storage_name, [])
+        if next_picks is None or len(slots) < next_picks:
+            slots.append(stored_carriers[carrier_name].storage_slot)
 
-    slot_ids = stored_carriers_of_job.values_list("storage_slot__id", flat=True)
-    slots = StorageSlot.objects.filter(pk__in=slot_ids)
-    slots.update(led_state=1)
-    slots_by_storage = {
-        storage: list(slots.filter(Q(storage=storage))) for storage in storages
-    }
-
-    for storage, slots_in_that_storage in slots_by_storage.items():
-        Thread(
-            target=dispatchers[storage.name]._LED_On_Control,
-            kwargs={
-                "lights_dict": {
-                    "lamps": {slot.name: "blue" for slot in slots_in_that_storage}
-                }
-            },
-        ).start()
+    StorageSlot.set_led_state(
+        [slot for slots in slots_by_storage.values() for slot in slots], 1
+    )
+    for slots in slots_by_storage.values():
+        if not slots:
+            continue
+        # the related names of combined slots come with the slot rows
+        lamps = {
+            lamp: "blue"
+            for slot in slots
+            for lamp in [slot.name] + list(slot.related_names or [])
+        }
+        get_dispatcher(slots[0].storage).submit(
+            "_LED_On_Control", lights_dict={"lamps": lamps}, expanded=True
+        )
     return JsonResponse(
         {
             "success": True,
@@ -713,5 +806,6 @@ def collect_job(request, job_name):
                 if number_of_stored_carriers_of_job != number_of_carriers_of_job
                 else f"{number_of_carriers_of_job} carriers to be collected."
             ),
+            "picks": pick_list(picks),
         }
     )
@@ -1,5 +1,3 @@
-from threading import Thread
-
 from django.views.decorators.csrf import csrf_exempt
 
 from django.http import JsonResponse
@@ -19,17 +17,8 @@ from .models import (
     LocalFile,
 )
 
-from .utils.led_shelf_dispatcher import LED_shelf_dispatcher
-
-try:
-    storages = Storage.objects.all()
-    if storages:
-        # initialize the dispatchers for all shelfs to turn on the working lights to green
-        dispatchers = {
-            storage.name: LED_shelf_dispatcher(storage) for storage in storages
-        }
-except Exception:
-    pass
+from .shelf_warmup import collect_shelf_health
+from .utils.led_shelf_dispatcher import get_dispatcher
 
 
 @csrf_exempt
@@ -71,16 +60,10 @@ def change_slot_color(request, storage_name, slot_name, color):
         )
 
     slot = slot_queryset.first()
-    slot.led_state = 1
-    slot.save()
+    StorageSlot.set_led_state([slot], 1)
 
-    led_dispatcher = LED_shelf_dispatcher(slot.storage)
-    Thread(
-        target=led_dispatcher.led_on,
-        kwargs={"lamp": slot.name, "color": color},
-    ).start()
-    slot.led_state = 1
-    slot.save()
+    led_dispatcher = get_dispatcher(slot.storage)
+    led_dispatcher.submit("led_on", lamp=slot.name, color=color)
 
     return JsonResponse({"success": True})
 
@@ -90,10 +73,7 @@ def test_leds(request):
     # only used for messe demonstrations, hidden from the frontend
     storage_queryset = Storage.objects.all()
     for storage in storage_queryset:
-        led_dispatcher = LED_shelf_dispatcher(storage)
-        Thread(
-            target=led_dispatcher.test_leds(),
-        ).start()
+        get_dispatcher(storage).submit("test_leds")
     return JsonResponse({"test_led": True})
 
 
@@ -110,15 +90,32 @@ def reset_leds(request, storage_name):
     - JsonResponse: JSON response indicating LED reset status.
     """
     storage = Storage.objects.get(name=storage_name)
-    led_dispatcher = LED_shelf_dispatcher(storage)
-    # Start a new thread to reset LEDs with working_light set to True
-    Thread(target=led_dispatcher.reset_leds, kwargs={"working_light": True}).start()
-    Thread(
-        target=led_dispatcher._LED_On_Control,
-        kwargs={"lights_dict": {"status": {"A": "green", "B": "green"}}},
+    led_dispatcher = get_dispatcher(storage)
+    # Queue the LED reset with working_light set to True, followed by the green working lights
+    led_dispatcher.submit("reset_leds", working_light=True)
+    led_dispatcher.submit(
+        "_LED_On_Control", lights_dict={"status": {"A": "green", "B": "green"}}
     )
     # Update LED state for all storage slots to 0
-    StorageSlot.objects.filter(storage=storage).update(led_state=0)
+    StorageSlot.set_led_state(StorageSlot.objects.filter(storage=storage), 0)
 
     # Return JSON response indicating LED reset for the given storage
     return JsonResponse({"reset_led": storage.name})
+
+
+def shelf_health(request):
+    """
+    Readiness of the shelf devices.
+
+    Args:
+    - request: HTTP request object
+
+    Returns:
+    - JsonResponse with the state ("pending", "connecting", "ready" or "failed"),
+      error, init_duration and device of every storage. The status is 503 while
+      a storage is still connecting.
+    """
+    ready, storages = collect_shelf_health()
+    return JsonResponse(
+        {"ready": ready, "storages": storages}, status=200 if ready else 503
+    )
@@ -5,10 +5,11 @@ import qrcode
 from django.http import FileResponse, JsonResponse
 from django.views.decorators.csrf import requires_csrf_token, csrf_exempt
 from django.middleware.csrf import get_token
-from django.db.models import Q
+from django.db.models import Count, Q
 
 
 from .utils.brother import BrotherQLHandler
+from .collect_queue import collect_queue_fields
 from .models import (
     Manufacturer,
     Provider,
@@ -18,6 +19,7 @@ from .models import (
     MachineSlot,
     Storage,
     StorageSlot,
+    SlotQRCode,
     Job,
     Board,
     BoardArticle,
@@ -255,24 +257,8 @@ def archive_carrier(request, carrier_name):
 
 
 def get_collect_queue(request):
-    # FIXED: Filter out carriers without storage_slot to prevent crashes
-    queued_carriers = Carrier.objects.filter(
-        collecting=True, archived=False, storage_slot__isnull=False
-    )
-    collection_queue = [
-        {
-            "carrier": queued_carrier.name,
-            "storage": queued_carrier.storage_slot.storage.name,
-            "slot": queued_carrier.storage_slot.qr_value,
-        }
-        for queued_carrier in queued_carriers
-    ]
-
-    response_message = {
-        "queue": collection_queue,
-    }
-
-    return JsonResponse(response_message)
+    # only the changes since the client's queue version with ?since=<queue_version>
+    return JsonResponse(collect_queue_fields(request))
 
 
 def find_slot_by_qr_code(qr_code, storage_name=None):
@@ -281,40 +267,18 @@ def find_slot_by_qr_code(qr_code, storage_name=None):
 
     Args:
         qr_code: The QR code to search for
-        storage_name: Optional storage name to narrow search
+        storage_name: Optional storage name to narrow search, without it the
+            slot of the first storage (by name) owning the code is returned
 
     Returns:
         StorageSlot instance or None
     """
-    from django.db.utils import NotSupportedError
-
-    query = Q(qr_value=qr_code)
+    entries = SlotQRCode.objects.filter(code=qr_code)
     if storage_name:
-        query &= Q(storage__name=storage_name)
+        entries = entries.filter(storage_id=storage_name)
 
-    try:
-        # Attempt to use JSONField __contains lookup
-        query |= Q(qr_codes__contains=qr_code)
-        slot = StorageSlot.objects.filter(query).first()
-    except NotSupportedError:
-        # Fall back to manual filtering for backends like PostgreSQL
-        base_qs = StorageSlot.objects.filter(Q(qr_value=qr_code))
-        if storage_name:
-            base_qs = base_qs.filter(storage__name=storage_name)
-
-        base_qs = list(base_qs)  # force evaluation
-        matching_slots = base_qs[:]
-
-        for slot in StorageSlot.objects.all():
-            if slot.qr_codes and qr_code in slot.qr_codes:
-                if storage_name is None or (
-                    slot.storage and slot.storage.name == storage_name
-                ):
-                    matching_slots.append(slot)
-
-        slot = matching_slots[0] if matching_slots else None
-
-    return slot
+    entry = entries.select_related("slot__storage").order_by("storage_id").first()
+    return entry.slot if entry else None
 
 
 def slot_matches_qr_code(slot, qr_code):
@@ -349,7 +313,12 @@ def assign_carrier_to_job(request, job_name, carrier_name):
         job.carriers.add(carrier)
         print("Carrier added to job")
 
-        if job.carriers.count() == job.board.articles.count():
+        # both counts in one query instead of recounting the board separately
+        counts = Job.objects.filter(pk=job.pk).aggregate(
+            carriers=Count("carriers", distinct=True),
+            articles=Count("board__articles", distinct=True),
+        )
+        if counts["carriers"] == counts["articles"]:
             job.status = 1
             print("Job status updated to 1")
 
@@ -0,0 +1,23 @@
+from django.http import JsonResponse
+
+from .utils.led_shelf_dispatcher import ShelfBackendUnavailable
+
+
+class ShelfBackendUnavailableMiddleware:
+    """
+    Answer requests that touch a storage whose device backend cannot be loaded
+    on this machine with a JSON error instead of a server error page.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, ShelfBackendUnavailable):
+            return JsonResponse(
+                {"success": False, "message": str(exception)}, status=503
+            )
+        return None
@@ -0,0 +1,78 @@
+# Generated by Django 5.0.1 on 2026-10-18 12:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_slot_qr_codes(apps, schema_editor):
+    """Register qr_value and qr_codes of all existing slots, primary codes first."""
+    StorageSlot = apps.get_model("smt_management_app", "StorageSlot")
+    SlotQRCode = apps.get_model("smt_management_app", "SlotQRCode")
+
+    entries = {}
+    slots = list(StorageSlot.objects.order_by("pk"))
+    for slot in slots:
+        if slot.qr_value:
+            entries.setdefault((slot.storage_id, slot.qr_value), (slot.pk, True))
+    for slot in slots:
+        for code in slot.qr_codes or []:
+            if code:
+                entries.setdefault((slot.storage_id, code), (slot.pk, False))
+
+    SlotQRCode.objects.bulk_create(
+        [
+            SlotQRCode(
+                storage_id=storage_id, code=code, slot_id=slot_id, is_primary=is_primary
+            )
+            for (storage_id, code), (slot_id, is_primary) in entries.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("smt_management_app", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlotQRCode",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("code", models.CharField(db_index=True, max_length=5000)),
+                ("is_primary", models.BooleanField(default=True)),
+                (
+                    "slot",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="qr_code_entries",
+                        to="smt_management_app.storageslot",
+                    ),
+                ),
+                (
+                    "storage",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="smt_management_app.storage",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="slotqrcode",
+            constraint=models.UniqueConstraint(
+                fields=("storage", "code"), name="unique_qr_code_per_storage"
+            ),
+        ),
+        migrations.RunPython(backfill_slot_qr_codes, migrations.RunPython.noop),
+    ]
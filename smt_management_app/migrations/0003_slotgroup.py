@@ -0,0 +1,101 @@
+# Generated by Django 5.0.1 on 2026-10-18 12:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_slot_groups(apps, schema_editor):
+    """Create a SlotGroup for every connected set of slots linked by related_names."""
+    StorageSlot = apps.get_model("smt_management_app", "StorageSlot")
+    SlotGroup = apps.get_model("smt_management_app", "SlotGroup")
+
+    slots_by_storage = {}
+    for slot in StorageSlot.objects.exclude(related_names=[]).order_by("pk"):
+        slots_by_storage.setdefault(slot.storage_id, []).append(slot)
+
+    for storage_id, combined_slots in slots_by_storage.items():
+        rows = {
+            slot.name: slot
+            for slot in StorageSlot.objects.filter(storage_id=storage_id).order_by(
+                "-pk"
+            )
+        }
+
+        # union find over lamp names
+        parents = {}
+
+        def find(name):
+            parents.setdefault(name, name)
+            while parents[name] != name:
+                parents[name] = parents[parents[name]]
+                name = parents[name]
+            return name
+
+        for slot in combined_slots:
+            for related_name in slot.related_names:
+                parents[find(related_name)] = find(slot.name)
+
+        components = {}
+        for name in list(parents):
+            components.setdefault(find(name), []).append(name)
+
+        for lamps in components.values():
+            members = [rows[name] for name in sorted(lamps) if name in rows]
+            if not members:
+                continue
+            group = SlotGroup.objects.create(
+                storage_id=storage_id,
+                lamps=sorted(lamps),
+                diameter=max((slot.diameter or 0) for slot in members) or None,
+                width=max((slot.width or 0) for slot in members) or None,
+            )
+            StorageSlot.objects.filter(pk__in=[slot.pk for slot in members]).update(
+                group=group
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("smt_management_app", "0002_slotqrcode"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlotGroup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("diameter", models.IntegerField(blank=True, null=True)),
+                ("width", models.IntegerField(blank=True, null=True)),
+                ("lamps", models.JSONField(blank=True, default=list)),
+                (
+                    "storage",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="slot_groups",
+                        to="smt_management_app.storage",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="storageslot",
+            name="group",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="slots",
+                to="smt_management_app.slotgroup",
+            ),
+        ),
+        migrations.RunPython(backfill_slot_groups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.1 on 2026-10-18 13:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("smt_management_app", "0003_slotgroup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="storage",
+            name="ATNPTL_transport",
+            field=models.CharField(
+                choices=[("bridge", "bridge"), ("serial", "serial")],
+                default="bridge",
+                max_length=10,
+            ),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.0.1 on 2026-10-18 13:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_collect_queue(apps, schema_editor):
+    """Queue entries for the carriers that are collecting, in name order."""
+    Carrier = apps.get_model("smt_management_app", "Carrier")
+    CollectQueueEntry = apps.get_model("smt_management_app", "CollectQueueEntry")
+
+    now = timezone.now()
+    CollectQueueEntry.objects.bulk_create(
+        CollectQueueEntry(
+            carrier_name=name,
+            carrier_id=name,
+            position=version,
+            version=version,
+            queued_at=now,
+        )
+        for version, name in enumerate(
+            Carrier.objects.filter(collecting=True)
+            .order_by("name")
+            .values_list("name", flat=True),
+            start=1,
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("smt_management_app", "0004_storage_atnptl_transport"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CollectQueueEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("carrier_name", models.CharField(max_length=50, unique=True)),
+                ("station", models.CharField(blank=True, max_length=50, null=True)),
+                ("position", models.PositiveBigIntegerField(default=0)),
+                ("version", models.PositiveBigIntegerField(unique=True)),
+                ("queued_at", models.DateTimeField(blank=True, null=True)),
+                ("removed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "carrier",
+                    models.OneToOneField(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="collect_queue_entry",
+                        to="smt_management_app.carrier",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ("position",),
+                "indexes": [
+                    models.Index(
+                        fields=["removed_at", "position"],
+                        name="smt_managem_removed_8b9e51_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_collect_queue, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.0.1 on 2026-10-18 14:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("smt_management_app", "0005_collectqueueentry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArticleCollection",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("station", models.CharField(blank=True, max_length=50, null=True)),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "article",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="collections",
+                        to="smt_management_app.article",
+                    ),
+                ),
+                (
+                    "slots",
+                    models.ManyToManyField(
+                        related_name="article_collections",
+                        to="smt_management_app.storageslot",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ("started_at",),
+            },
+        ),
+    ]
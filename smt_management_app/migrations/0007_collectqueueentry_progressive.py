@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 14:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("smt_management_app", "0006_articlecollection"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="collectqueueentry",
+            name="progressive",
+            field=models.BooleanField(default=False),
+        ),
+    ]
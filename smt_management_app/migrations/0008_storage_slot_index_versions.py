@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("smt_management_app", "0007_collectqueueentry_progressive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="storage",
+            name="slot_layout_version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="storage",
+            name="slot_occupancy_version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -1,6 +1,8 @@
 import os
 from django.db import models
 from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.forms import ValidationError
 from django.urls import reverse
 
@@ -69,6 +71,11 @@ class Storage(AbstractBaseModel):
     COM_baudrate = models.PositiveIntegerField(null=True, blank=True)
     COM_timeout = models.FloatField(null=True, blank=True)
     ATNPTL_shelf_id = models.PositiveIntegerField(null=True, blank=True)
+    # "bridge" goes through the HTTP serial bridge, "serial" opens COM_address itself
+    ATNPTL_TRANSPORT_CHOICES = [("bridge", "bridge"), ("serial", "serial")]
+    ATNPTL_transport = models.CharField(
+        max_length=10, choices=ATNPTL_TRANSPORT_CHOICES, default="bridge"
+    )
     ip_address = models.CharField(max_length=15, null=True, blank=True)
     ip_port = models.PositiveIntegerField(null=True, blank=True)
 
@@ -77,9 +84,44 @@ class Storage(AbstractBaseModel):
     lighthouse_B_green = models.BooleanField(default=False)
     lighthouse_B_yellow = models.BooleanField(default=False)
 
+    # bumped by every change of the slot layout / of the carriers in the slots, the
+    # slot indexes of other processes rebuild once they see a newer version
+    slot_layout_version = models.PositiveIntegerField(default=0, editable=False)
+    slot_occupancy_version = models.PositiveIntegerField(default=0, editable=False)
+    SLOT_INDEX_VERSION_FIELDS = ("slot_layout_version", "slot_occupancy_version")
+
     def get_absolute_url(self):
         return reverse("smt_management_app:storage-detail", kwargs={"name": self.name})
 
+    def save(self, *args, **kwargs):
+        # the versions are only written with F() updates, a row loaded before a
+        # bump must not write the old value back
+        if (
+            not self._state.adding
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+        ):
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.SLOT_INDEX_VERSION_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+
+@receiver(post_delete, sender=Storage)
+def storage_deleted(sender, instance, **kwargs):
+    """
+    Drop the warm LED dispatcher and the slot indexes of a deleted storage. A
+    signal, so queryset deletes and cascades clean up as well as instance deletes.
+    """
+    from .slot_index import invalidate_slot_index
+    from .utils.led_shelf_dispatcher import discard_dispatcher
+
+    discard_dispatcher(instance.name)
+    invalidate_slot_index(instance.name)
+
 
 class Manufacturer(models.Model):
     name = models.CharField(primary_key=True, max_length=50, null=False, blank=False)
@@ -223,6 +265,48 @@ class Carrier(AbstractBaseModel):
 
         super(Carrier, self).save(*args, **kwargs)
 
+        slots = self._slots()
+        if getattr(self, "_loaded_slots", (None, None)) != slots:
+            from .slot_index import carrier_slots_changed
+
+            carrier_slots_changed(getattr(self, "_loaded_slots", (None, None)), slots)
+            self._loaded_slots = slots
+
+        # keep the collect queue in sync with collecting set by other code paths
+        if getattr(self, "_loaded_collecting", False) != self.collecting:
+            from .collect_queue import dequeue_carriers, enqueue_carriers
+
+            if self.collecting:
+                enqueue_carriers([self])
+            else:
+                dequeue_carriers([self])
+
+    def delete(self, *args, **kwargs):
+        from .slot_index import carrier_slots_changed
+
+        if self.collecting or getattr(self, "_loaded_collecting", False):
+            from .collect_queue import dequeue_carriers
+
+            dequeue_carriers([self])
+        slots = getattr(self, "_loaded_slots", self._slots())
+        result = super().delete(*args, **kwargs)
+        carrier_slots_changed(slots, (None, None))
+        return result
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the loaded slots to keep the occupancy index in sync on save
+        instance._loaded_slots = instance._slots()
+        instance._loaded_collecting = instance.__dict__.get("collecting")
+        return instance
+
+    def _slots(self):
+        return (
+            self.__dict__.get("storage_slot_id"),
+            self.__dict__.get("nominated_for_slot_id"),
+        )
+
     def get_absolute_url(self):
         return reverse("smt_management_app:carrier-detail", kwargs={"name": self.name})
 
@@ -235,6 +319,41 @@ class Carrier(AbstractBaseModel):
         ]
 
 
+class CollectQueueEntry(models.Model):
+    """
+    A carrier in the collect queue. Every carrier has at most one entry, it stays
+    after the carrier left the queue (removed_at set) so clients can ask for the
+    changes since the queue version they have seen.
+    """
+
+    carrier_name = models.CharField(max_length=50, unique=True)
+    # null once the carrier was deleted, carrier_name still reports its removal
+    carrier = models.OneToOneField(
+        Carrier,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="collect_queue_entry",
+    )
+    # station that queued the carrier, e.g. ?station=line1
+    station = models.CharField(max_length=50, blank=True, null=True)
+    # queued by collect_job?next=N, its picks are lit one after another
+    progressive = models.BooleanField(default=False)
+    # queue version at which the carrier was queued, orders the queue
+    position = models.PositiveBigIntegerField(default=0)
+    # queue version of the last change of this entry
+    version = models.PositiveBigIntegerField(unique=True)
+    queued_at = models.DateTimeField(null=True, blank=True)
+    removed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.carrier_name
+
+    class Meta:
+        ordering = ("position",)
+        indexes = [models.Index(fields=["removed_at", "position"])]
+
+
 class Machine(AbstractBaseModel):
     capacity = models.IntegerField()
     location = models.CharField(max_length=50, null=True, blank=True)
@@ -252,6 +371,46 @@ class MachineSlot(AbstractBaseModel):
         )
 
 
+class SlotGroup(models.Model):
+    """
+    Combined slot group. All slots of a group share it, so group membership and
+    occupancy are one indexed join instead of walking related_names.
+    """
+
+    storage = models.ForeignKey(
+        Storage, on_delete=models.CASCADE, related_name="slot_groups"
+    )
+    # largest dimensions of the member slots
+    diameter = models.IntegerField(null=True, blank=True)
+    width = models.IntegerField(null=True, blank=True)
+    # all LED positions of the group, including merged slots without a row
+    lamps = models.JSONField(default=list, blank=True)
+
+    def __str__(self):
+        return f"{self.storage_id} {self.lamps}"
+
+    def refresh(self):
+        """
+        Recompute lamps and dimensions from the member slots, delete the group if
+        it has no members left.
+
+        Returns:
+            The group or None if it was deleted
+        """
+        members = list(self.slots.all())
+        if not members:
+            self.delete()
+            return None
+
+        self.lamps = sorted(
+            {name for slot in members for name in slot.get_all_slot_names()}
+        )
+        self.diameter = max((slot.diameter or 0) for slot in members) or None
+        self.width = max((slot.width or 0) for slot in members) or None
+        self.save()
+        return self
+
+
 class StorageSlot(models.Model):
     name = models.PositiveIntegerField()
     STATE_CHOICES = [(0, "off"), (1, "on")]
@@ -270,6 +429,13 @@ class StorageSlot(models.Model):
         blank=True,
         help_text="Related slot LED positions for combined slots",
     )
+    group = models.ForeignKey(
+        SlotGroup,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="slots",
+    )
 
     def get_absolute_url(self):
         return reverse(
@@ -279,6 +445,24 @@ class StorageSlot(models.Model):
     def __str__(self):
         return str(self.name)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the loaded slot layout and qr codes to detect changes on save
+        instance._loaded_layout = instance._layout()
+        instance._loaded_qr_codes = instance._qr_state()
+        instance._loaded_led_state = instance.__dict__.get("led_state")
+        return instance
+
+    def _qr_state(self):
+        return (self.__dict__.get("qr_value"), self.__dict__.get("qr_codes"))
+
+    def _layout(self):
+        return tuple(
+            self.__dict__.get(field)
+            for field in ("name", "related_names", "diameter", "width")
+        )
+
     def get_all_qr_codes(self):
         """Return primary qr_value + qr_codes list, deduplicated"""
         all_codes = []
@@ -301,6 +485,48 @@ class StorageSlot(models.Model):
         """Return bool(self.related_names)"""
         return bool(self.related_names)
 
+    @classmethod
+    def set_led_state(cls, slots, state):
+        """
+        Write led_state with one UPDATE. save() would write every column and run
+        the combined slot validation queries, neither is needed to toggle a light.
+        The dispatchers of the affected storages get the changed slots for their
+        lighthouse counters.
+
+        Args:
+            slots: StorageSlot queryset or iterable of StorageSlot instances, the
+                instances get the new state as well
+            state: 0 (off) or 1 (on)
+
+        Returns:
+            int: Number of updated rows
+        """
+        from .utils.led_shelf_dispatcher import notify_led_state
+
+        if isinstance(slots, models.QuerySet):
+            # only slots that actually change, a storage wide reset touches few rows
+            changed = list(
+                slots.exclude(led_state=state).values_list("storage_id", "name")
+            )
+            updated = slots.update(led_state=state)
+        else:
+            slots = [slot for slot in slots if slot is not None]
+            changed = []
+            for slot in slots:
+                slot.led_state = state
+                slot._loaded_led_state = state
+                changed.append((slot.storage_id, slot.name))
+            updated = cls.objects.filter(pk__in=[slot.pk for slot in slots]).update(
+                led_state=state
+            )
+
+        names_by_storage = {}
+        for storage_name, name in changed:
+            names_by_storage.setdefault(storage_name, []).append(name)
+        for storage_name, names in names_by_storage.items():
+            notify_led_state(storage_name, names, state)
+        return updated
+
     def validate_combined_slot_consistency(self):
         """
         Validate that combined slot configuration is consistent.
@@ -345,7 +571,7 @@ class StorageSlot(models.Model):
         # Check if any related slots are occupied
         try:
             related_occupied = StorageSlot.objects.filter(
-                storage=self.storage, name__in=self.related_names, carrier__isnull=False
+                carrier__isnull=False, **self.group_members_filter()
             ).exclude(pk=self.pk)
 
             if related_occupied.exists():
@@ -433,8 +659,214 @@ class StorageSlot(models.Model):
                     f"Error during combined slot validation for slot {self.name}: {str(e)}"
                 )
 
+        loaded_qr_codes = getattr(self, "_loaded_qr_codes", (None, None))
+        qr_codes_changed = loaded_qr_codes != self._qr_state()
+        if loaded_qr_codes[0] != self.qr_value:
+            self.validate_unique_qr_value()
+
+        layout_changed = getattr(self, "_loaded_layout", None) != self._layout()
+        led_state_changed = getattr(self, "_loaded_led_state", 0) != self.led_state
         super().save(*args, **kwargs)
 
+        if led_state_changed:
+            from .utils.led_shelf_dispatcher import notify_led_state
+
+            notify_led_state(self.storage_id, [self.name], self.led_state)
+            self._loaded_led_state = self.led_state
+
+        if qr_codes_changed:
+            self.sync_qr_code_entries()
+            self._loaded_qr_codes = self._qr_state()
+
+        if layout_changed:
+            from .slot_index import invalidate_slot_index
+
+            self.sync_slot_group()
+            invalidate_slot_index(self.storage_id)
+            self._loaded_layout = self._layout()
+
+    def delete(self, *args, **kwargs):
+        from .slot_index import invalidate_slot_index
+
+        storage_name = self.storage_id
+        qr_codes = self.get_all_qr_codes()
+        group = self.group
+        result = super().delete(*args, **kwargs)
+        if group:
+            group.refresh()
+
+        # slots listing a code of this slot as additional code can take it over now
+        if qr_codes:
+            for slot in StorageSlot.objects.filter(storage_id=storage_name).exclude(
+                qr_codes=[]
+            ):
+                if set(slot.qr_codes) & set(qr_codes):
+                    slot.sync_qr_code_entries()
+
+        invalidate_slot_index(storage_name)
+        return result
+
+    def group_members_filter(self):
+        """Return the filter kwargs selecting all slot rows of this slot's group."""
+        if self.group_id:
+            return {"group_id": self.group_id}
+        return {"storage_id": self.storage_id, "name__in": self.get_all_slot_names()}
+
+    def sync_slot_group(self):
+        """
+        Put this slot and every slot it references into one SlotGroup, joining
+        groups they already belong to, or leave the group if it has no related
+        slots anymore.
+        """
+        if not self.related_names:
+            if self.group_id:
+                group = self.group
+                StorageSlot.objects.filter(pk=self.pk).update(group=None)
+                self.group = None
+                group.refresh()
+            return
+
+        members = StorageSlot.objects.filter(
+            storage_id=self.storage_id, name__in=self.get_all_slot_names()
+        )
+        group_ids = sorted(
+            set(members.exclude(group=None).values_list("group_id", flat=True))
+        )
+        if group_ids:
+            group = SlotGroup.objects.get(pk=group_ids[0])
+        else:
+            group = SlotGroup.objects.create(storage_id=self.storage_id)
+
+        StorageSlot.objects.filter(
+            Q(pk__in=members.values("pk")) | Q(group_id__in=group_ids)
+        ).update(group=group)
+        SlotGroup.objects.filter(pk__in=group_ids).exclude(pk=group.pk).delete()
+        self.group = group
+        group.refresh()
+
+    def validate_unique_qr_value(self):
+        """
+        Validate that no other slot of the storage uses qr_value as its primary code.
+
+        Raises:
+            ValidationError: If the primary QR code is taken already
+        """
+        if not self.qr_value:
+            return
+
+        taken = SlotQRCode.objects.filter(
+            storage_id=self.storage_id, code=self.qr_value, is_primary=True
+        )
+        if self.pk:
+            taken = taken.exclude(slot_id=self.pk)
+        taken_by = taken.values_list("slot__name", flat=True)[:1]
+        if taken_by:
+            raise ValidationError(
+                f"QR code {self.qr_value} is already used by slot {taken_by[0]} "
+                f"of storage {self.storage_id}"
+            )
+
+    def sync_qr_code_entries(self):
+        """
+        Bring the SlotQRCode rows of this slot in line with qr_value and qr_codes.
+
+        A code is owned by one slot per storage. Primary codes win over additional
+        codes, between additional codes the slot that registered it first keeps it.
+        """
+        from django.db import transaction
+
+        codes = self.get_all_qr_codes()
+        entries = list(
+            SlotQRCode.objects.filter(
+                Q(slot_id=self.pk) | Q(storage_id=self.storage_id, code__in=codes)
+            )
+        )
+        stale = [
+            entry.pk
+            for entry in entries
+            if entry.slot_id == self.pk
+            and (entry.storage_id != self.storage_id or entry.code not in codes)
+        ]
+        owners = {
+            entry.code: entry
+            for entry in entries
+            if entry.storage_id == self.storage_id and entry.pk not in stale
+        }
+
+        new_entries = []
+        changed_entries = []
+        for code in codes:
+            is_primary = code == self.qr_value
+            entry = owners.get(code)
+            if entry is None:
+                new_entries.append(
+                    SlotQRCode(
+                        storage_id=self.storage_id,
+                        slot=self,
+                        code=code,
+                        is_primary=is_primary,
+                    )
+                )
+            elif entry.slot_id == self.pk:
+                if entry.is_primary != is_primary:
+                    entry.is_primary = is_primary
+                    changed_entries.append(entry)
+            elif is_primary and not entry.is_primary:
+                entry.slot = self
+                entry.is_primary = True
+                changed_entries.append(entry)
+
+        if not (stale or new_entries or changed_entries):
+            return
+        with transaction.atomic():
+            if stale:
+                SlotQRCode.objects.filter(pk__in=stale).delete()
+            if changed_entries:
+                SlotQRCode.objects.bulk_update(changed_entries, ["slot", "is_primary"])
+            SlotQRCode.objects.bulk_create(new_entries)
+
+
+class SlotQRCode(models.Model):
+    """Indexed QR code -> slot lookup, covering primary and additional slot codes."""
+
+    code = models.CharField(max_length=5000, db_index=True)
+    storage = models.ForeignKey(Storage, on_delete=models.CASCADE)
+    slot = models.ForeignKey(
+        StorageSlot, on_delete=models.CASCADE, related_name="qr_code_entries"
+    )
+    is_primary = models.BooleanField(default=True)
+
+    def __str__(self):
+        return self.code
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["storage", "code"], name="unique_qr_code_per_storage"
+            )
+        ]
+
+
+class ArticleCollection(models.Model):
+    """
+    The slots one collect_carrier_by_article request lit. Confirming or cancelling
+    the collection switches off exactly these lamps instead of every shelf.
+    """
+
+    article = models.ForeignKey(
+        Article, on_delete=models.CASCADE, related_name="collections"
+    )
+    # station that started the collection, e.g. ?station=line1
+    station = models.CharField(max_length=50, blank=True, null=True)
+    slots = models.ManyToManyField(StorageSlot, related_name="article_collections")
+    started_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.article_id} {self.pk}"
+
+    class Meta:
+        ordering = ("started_at",)
+
 
 class Job(AbstractBaseModel):
     STATUS_CHOICES = [
@@ -599,4 +1031,102 @@ def merge_storage_slots(primary_slot, *additional_slots):
         for slot in additional_slots:
             slot.delete()
 
+        # the codes of the deleted slots belong to the primary slot now
+        primary_slot.sync_qr_code_entries()
+
     return primary_slot
+
+
+def group_storage_slots(slots):
+    """
+    Combine slots into one symmetric group, keeping every slot row.
+    Slots already in a group bring the rest of their group along.
+
+    Args:
+        slots: StorageSlot instances of one storage
+
+    Returns:
+        The SlotGroup of the combined slots
+
+    Raises:
+        ValueError: If slots are from different storages or if any slot is occupied
+    """
+    from django.db import transaction
+    from .slot_index import invalidate_slot_index
+
+    slots = list(slots)
+    storage_ids = {slot.storage_id for slot in slots}
+    if len(storage_ids) != 1:
+        raise ValueError(f"Cannot group slots from different storages: {storage_ids}")
+    storage_id = storage_ids.pop()
+
+    with transaction.atomic():
+        old_group_ids = {slot.group_id for slot in slots} - {None}
+        slots = list(
+            StorageSlot.objects.filter(
+                Q(pk__in=[slot.pk for slot in slots]) | Q(group_id__in=old_group_ids)
+            )
+        )
+
+        busy = Carrier.objects.filter(
+            Q(storage_slot__in=slots) | Q(nominated_for_slot__in=slots)
+        ).first()
+        if busy:
+            raise ValueError(
+                f"Cannot group slots, carrier {busy.name} is stored in or nominated for one of them"
+            )
+
+        names = sorted(slot.name for slot in slots)
+        qr_codes = sorted(
+            {code.strip() for slot in slots for code in slot.get_all_qr_codes()} - {""}
+        )
+
+        # the members keep their own dimensions, group.refresh() aggregates them
+        group = SlotGroup.objects.create(storage_id=storage_id)
+        for slot in slots:
+            slot.related_names = [name for name in names if name != slot.name]
+            slot.qr_codes = [code for code in qr_codes if code != slot.qr_value]
+            slot.group = group
+        StorageSlot.objects.bulk_update(slots, ["related_names", "qr_codes", "group"])
+        SlotGroup.objects.filter(pk__in=old_group_ids).delete()
+
+        for slot in slots:
+            slot.sync_qr_code_entries()
+            slot._loaded_layout = slot._layout()
+            slot._loaded_qr_codes = slot._qr_state()
+        group.refresh()
+
+    invalidate_slot_index(storage_id)
+    return group
+
+
+def split_slot_group(group):
+    """
+    Turn every slot of a group back into a single slot.
+    Slots deleted by merge_storage_slots are not restored.
+
+    Args:
+        group: SlotGroup to dissolve
+
+    Returns:
+        List of the now single StorageSlot instances
+    """
+    from django.db import transaction
+    from .slot_index import invalidate_slot_index
+
+    with transaction.atomic():
+        slots = list(group.slots.all())
+        for slot in slots:
+            slot.related_names = []
+            slot.qr_codes = []
+            slot.group = None
+        StorageSlot.objects.bulk_update(slots, ["related_names", "qr_codes", "group"])
+        group.delete()
+
+        for slot in slots:
+            slot.sync_qr_code_entries()
+            slot._loaded_layout = slot._layout()
+            slot._loaded_qr_codes = slot._qr_state()
+
+    invalidate_slot_index(group.storage_id)
+    return slots
@@ -0,0 +1,136 @@
+import re
+from collections import namedtuple
+
+# Pick ordering for collecting several carriers from a shelf. Slots get walking
+# coordinates from their naming scheme, the picks of a storage are then sorted
+# along an S-shaped walk: along the first side with rising position, around the
+# shelf end and back along the other side. The operator no longer walks the shelf
+# back and forth between lit slots in arbitrary order.
+
+# side 0/1 (front/back face), row (height, no walking) and position along the shelf
+SlotCoordinates = namedtuple("SlotCoordinates", ["side", "row", "position"])
+
+# Sophia: side letter, row and position, A1-001 on the label, L1607A1001 as barcode
+SIDE_ROW_POSITION = re.compile(r"([AB])(\d)-?(\d{3})$")
+# NeoLight and SD shelfs: <shelf>-<row>-<position>, e.g. 002-01-001 or S11501-06-099
+ROW_POSITION = re.compile(r"-(\d+)-(\d+)$")
+# ATNPTL: row * 1000 + position, rows 1-4 are on the first side, 5-8 on the second
+ATNPTL_ROWS_PER_SIDE = 4
+
+
+def slot_coordinates(name, qr_value=None):
+    """
+    Return the walking coordinates of a slot.
+
+    Args:
+        name: Slot name (lamp address)
+        qr_value: Primary QR code of the slot
+
+    Returns:
+        SlotCoordinates, slots without a known scheme are ordered by name on side 0
+    """
+    code = (qr_value or "").strip()
+    match = SIDE_ROW_POSITION.search(code)
+    if match:
+        side, row, position = match.groups()
+        return SlotCoordinates("AB".index(side), int(row), int(position))
+    match = ROW_POSITION.search(code)
+    if match:
+        row, position = match.groups()
+        return SlotCoordinates(0, int(row), int(position))
+    if name >= 1000:
+        # ATNPTL codes, the lamp address is the physical position (the printed
+        # codes of some shelfs have their sides swapped)
+        row, position = divmod(name, 1000)
+        side, row = divmod(row - 1, ATNPTL_ROWS_PER_SIDE)
+        return SlotCoordinates(side, row + 1, position)
+    return SlotCoordinates(0, 0, name)
+
+
+def order_picks(picks):
+    """
+    Sort the picks of one storage along the walking path.
+
+    The walk starts at position 0 of the first side that has picks. Every further
+    side with picks is walked in the opposite direction, so the operator never
+    walks back along a side. Rows at the same position are picked in row order.
+
+    Args:
+        picks: Iterable of (SlotCoordinates, item)
+
+    Returns:
+        list: The items in pick order
+    """
+    picks = list(picks)
+    sides = sorted({coordinates.side for coordinates, _ in picks})
+    direction = {side: 1 if index % 2 == 0 else -1 for index, side in enumerate(sides)}
+    picks.sort(
+        key=lambda pick: (
+            pick[0].side,
+            direction[pick[0].side] * pick[0].position,
+            pick[0].row,
+        )
+    )
+    return [item for _, item in picks]
+
+
+def path_length(coordinates, shelf_length):
+    """
+    Walking distance in slot positions from position 0 of side 0 through the
+    picks in the given order and back. Changing sides goes around the nearer shelf
+    end.
+
+    Args:
+        coordinates: SlotCoordinates in pick order
+        shelf_length: Highest slot position of the shelf
+    """
+    side, position = 0, 0
+    total = 0
+    for pick in list(coordinates) + [SlotCoordinates(0, 0, 0)]:
+        if pick.side == side:
+            total += abs(pick.position - position)
+        else:
+            total += min(
+                position + pick.position, 2 * shelf_length - position - pick.position
+            )
+        side, position = pick.side, pick.position
+    return total
+
+
+def sequence_picks(rows):
+    """
+    Order picks per storage (storages by name) along their walking paths.
+
+    Args:
+        rows: Iterable of (storage name, slot name, slot qr_value, carrier name)
+
+    Returns:
+        list: The rows in pick order
+    """
+    rows_by_storage = {}
+    for row in rows:
+        rows_by_storage.setdefault(row[0], []).append(row)
+    sequenced = []
+    for storage_name in sorted(rows_by_storage):
+        sequenced.extend(
+            order_picks(
+                (slot_coordinates(row[1], row[2]), row)
+                for row in rows_by_storage[storage_name]
+            )
+        )
+    return sequenced
+
+
+def pick_list(sequenced_rows):
+    """Response items for the rows returned by sequence_picks, numbered from 1."""
+    return [
+        {
+            "sequence": sequence,
+            "carrier": carrier_name,
+            "storage": storage_name,
+            "slot": qr_value,
+        }
+        for sequence, (storage_name, _, qr_value, carrier_name) in enumerate(
+            sequenced_rows, start=1
+        )
+    ]
@@ -0,0 +1,28 @@
+"""
+Run the LED device service, see smt_management_app/utils/led_service.py.
+
+    python manage.py runscript led_service --script-args 127.0.0.1:8765
+
+The web workers need LED_SERVICE_ADDRESS = "127.0.0.1:8765" in their settings (or
+the environment variable of the same name).
+"""
+
+from smt_management_app.shelf_warmup import warm_up_dispatchers
+from smt_management_app.utils import led_shelf_dispatcher
+from smt_management_app.utils.led_service import make_server
+
+
+def run(*args):
+    address = args[0] if args else "127.0.0.1:8765"
+    led_shelf_dispatcher.serve_devices_locally()
+    server = make_server(address)
+    print(f"LED service listening on {server.address}")
+    # connect every shelf now instead of on the first command
+    warm_up_dispatchers()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        led_shelf_dispatcher.discard_local_dispatcher()
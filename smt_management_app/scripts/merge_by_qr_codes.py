@@ -1,9 +1,8 @@
 # Save as: smt_management_app/scripts/bulletproof_merge_by_qr_codes.py
 
-from smt_management_app.models import StorageSlot, Storage
+from smt_management_app.models import StorageSlot, Storage, group_storage_slots
 from smt_management_app.collecting import find_slot_by_qr_code
 from smt_management_app.utils.led_shelf_dispatcher import LED_shelf_dispatcher
-from django.db import transaction
 from threading import Thread
 import time
 
@@ -46,59 +45,17 @@ def turn_off_slots(slots):
 def get_complete_slot_group(slot):
     """
     Get all slots that are part of a combined slot group.
-    This function follows all relationships to find the complete group.
+    The group is materialized in SlotGroup, so this is a single lookup.
     """
-    visited = set()
-    to_visit = {slot.name}
-    storage = slot.storage
+    print(f"    Looking up group of slot {slot.name}...")
 
-    print(f"    Tracing relationships starting from slot {slot.name}...")
+    if slot.group_id:
+        group_names = set(slot.group.lamps)
+    else:
+        group_names = set(slot.get_all_slot_names())
 
-    while to_visit:
-        current_name = to_visit.pop()
-        if current_name in visited:
-            continue
-
-        visited.add(current_name)
-        print(f"    Checking slot {current_name}...")
-
-        try:
-            current_slot = StorageSlot.objects.get(storage=storage, name=current_name)
-
-            # Add all slots this slot references
-            if current_slot.related_names:
-                print(
-                    f"      Slot {current_name} references: {current_slot.related_names}"
-                )
-                for related_name in current_slot.related_names:
-                    if related_name not in visited:
-                        to_visit.add(related_name)
-            else:
-                print(f"      Slot {current_name} has no related_names")
-
-            # Find all slots that reference this slot by checking all slots
-            referencing_slots = []
-            all_slots_in_storage = StorageSlot.objects.filter(storage=storage)
-            for potential_ref_slot in all_slots_in_storage:
-                if (
-                    potential_ref_slot.related_names
-                    and current_name in potential_ref_slot.related_names
-                ):
-                    referencing_slots.append(potential_ref_slot.name)
-                    if potential_ref_slot.name not in visited:
-                        to_visit.add(potential_ref_slot.name)
-
-            if referencing_slots:
-                print(f"      Slots that reference {current_name}: {referencing_slots}")
-            else:
-                print(f"      No slots reference {current_name}")
-
-        except StorageSlot.DoesNotExist:
-            print(f"    Warning: Referenced slot {current_name} not found")
-            continue
-
-    print(f"    Complete group for slot {slot.name}: {sorted(visited)}")
-    return visited
+    print(f"    Complete group for slot {slot.name}: {sorted(group_names)}")
+    return group_names
 
 
 def bulletproof_merge_storage_slots(primary_slot, additional_slot_names):
@@ -150,58 +107,18 @@ def bulletproof_merge_storage_slots(primary_slot, additional_slot_names):
                 f"Slot {slot.name} has nominated carrier {slot.nominated_carrier.name}"
             )
 
-    with transaction.atomic():
-        # Collect ALL unique QR codes from all slots
-        all_qr_values = {}  # qr_value -> slot_name mapping
-
-        for slot in all_slots:
-            if slot.qr_value and slot.qr_value.strip():
-                all_qr_values[slot.qr_value.strip()] = slot.name
+    # Every slot gets related_names/qr_codes of all other slots and the largest
+    # dimensions, written in one bulk update
+    group = group_storage_slots(all_slots)
 
-            # Also collect from existing qr_codes arrays
-            if slot.qr_codes:
-                for qr in slot.qr_codes:
-                    if qr and qr.strip() and qr.strip() not in all_qr_values:
-                        all_qr_values[qr.strip()] = "from_existing_group"
-
-        # Calculate maximum dimensions
-        max_diameter = max((slot.diameter or 0) for slot in all_slots)
-        max_width = max((slot.width or 0) for slot in all_slots)
-
-        # Sort for consistent ordering
-        all_slot_names_sorted = sorted([slot.name for slot in all_slots])
-        all_qr_codes_sorted = sorted(all_qr_values.keys())
-
-        print(f"Creating bidirectional relationships:")
-        print(f"  Slots: {all_slot_names_sorted}")
-        print(f"  QR codes: {all_qr_codes_sorted}")
-
-        # Update each slot to have relationships with ALL other slots
-        for slot in all_slots:
-            # related_names = all other slot names (excluding this slot)
-            other_slot_names = [
-                name for name in all_slot_names_sorted if name != slot.name
-            ]
-
-            # qr_codes = all other QR codes (excluding this slot's qr_value)
-            other_qr_codes = [qr for qr in all_qr_codes_sorted if qr != slot.qr_value]
-
-            # Update the slot
-            slot.related_names = other_slot_names
-            slot.qr_codes = other_qr_codes
-
-            if max_diameter > 0:
-                slot.diameter = max_diameter
-            if max_width > 0:
-                slot.width = max_width
-
-            slot.save()
-
-            print(
-                f"  Updated slot {slot.name}: related_names={other_slot_names}, qr_codes={other_qr_codes}"
-            )
+    print(f"Creating bidirectional relationships:")
+    print(f"  Slots: {group.lamps}")
+    for slot in group.slots.order_by("name"):
+        print(
+            f"  Updated slot {slot.name}: related_names={slot.related_names}, qr_codes={slot.qr_codes}"
+        )
 
-        print(f"✅ Created bidirectional group of {len(all_slots)} slots")
+    print(f"✅ Created bidirectional group of {len(all_slots)} slots")
 
     return primary_slot
 
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Compare the walking distance of ordered and unordered picking on a synthetic
+1400 slot NeoLight shelf (7 rows of 200 positions, 002-01-001 codes) and on an
+ATNPTL shelf (8 rows of 50 positions, two sides, 1001 codes).
+
+Unordered is the order the carriers were queued in. No database is needed.
+
+    python -m smt_management_app.scripts.pick_path_benchmark --picks 40 --runs 500
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from smt_management_app.pick_path import order_picks, path_length, slot_coordinates
+
+
+def neolight_shelf():
+    return [
+        (
+            row * 200 + position,
+            f"002-{str(row + 1).zfill(2)}-{str(position + 1).zfill(3)}",
+        )
+        for row in range(7)
+        for position in range(200)
+    ]
+
+
+def atnptl_shelf():
+    return [
+        (row * 1000 + position, str(row * 1000 + position))
+        for row in range(1, 9)
+        for position in range(1, 51)
+    ]
+
+
+def benchmark(name, slots, picks, runs, rng):
+    coordinates = [slot_coordinates(*slot) for slot in slots]
+    shelf_length = max(c.position for c in coordinates)
+    unordered = []
+    ordered = []
+    ordering_time = 0
+    for _ in range(runs):
+        sample = rng.sample(coordinates, min(picks, len(coordinates)))
+        unordered.append(path_length(sample, shelf_length))
+        start = time.perf_counter()
+        sequenced = order_picks((c, c) for c in sample)
+        ordering_time += time.perf_counter() - start
+        ordered.append(path_length(sequenced, shelf_length))
+
+    unordered_mean = statistics.mean(unordered)
+    ordered_mean = statistics.mean(ordered)
+    print(f"{name}: {len(slots)} slots, {picks} picks, {runs} runs")
+    print(f"  unordered path: {unordered_mean:.0f} positions")
+    print(
+        f"  ordered path:   {ordered_mean:.0f} positions"
+        f" ({ordered_mean / unordered_mean:.0%} of unordered)"
+    )
+    print(f"  ordering:       {ordering_time / runs * 1000:.3f}ms per pick list")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--picks", type=int, default=40)
+    parser.add_argument("--runs", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    benchmark("NeoLight", neolight_shelf(), args.picks, args.runs, rng)
+    benchmark("ATNPTL", atnptl_shelf(), args.picks, args.runs, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Measure ATNPTL throughput through the serial bridge without hardware.
+
+Starts a fake controller on a pty and the bridge on a free port, then lights
+the same lamps once with one request per lamp and once with one batch request.
+
+    python -m smt_management_app.scripts.ptl_bridge_benchmark --lamps 400
+"""
+
+import argparse
+import threading
+import time
+
+from smt_management_app.utils.shelf_handlers.fake_ptl_serial import FakePTLSerial
+from smt_management_app.utils.shelf_handlers.PTL_handler import PTL_API
+from smt_management_app.utils.shelf_handlers.ptl_bridge import make_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lamps", type=int, default=400)
+    parser.add_argument(
+        "--frame-delay",
+        type=float,
+        default=0.0,
+        help="seconds the fake controller needs per frame",
+    )
+    args = parser.parse_args()
+
+    device = FakePTLSerial(frame_delay=args.frame_delay).start()
+    server = make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api = PTL_API(
+        port=device.port, flask_url=f"http://127.0.0.1:{server.server_address[1]}"
+    )
+
+    codes = [row * 1000 + led for row in range(1, 9) for led in range(1, 51)]
+    lamps = {codes[i % len(codes)]: "blue" for i in range(args.lamps)}
+
+    start = time.perf_counter()
+    for lamp, color in lamps.items():
+        api.led_on(shelf=1, lamp=lamp, color=color)
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    api.leds_on(shelf=1, lamps=lamps)
+    batch = time.perf_counter() - start
+
+    print(f"{len(lamps)} lamps")
+    print(f"one request per lamp: {single:.3f}s ({len(lamps) / single:.0f} frames/s)")
+    print(f"one batch request:    {batch:.3f}s ({len(lamps) / batch:.0f} frames/s)")
+
+    server.shutdown()
+    server.bridge.close()
+    server.server_close()
+    device.stop()
+
+
+if __name__ == "__main__":
+    main()
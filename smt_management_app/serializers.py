@@ -38,12 +38,14 @@ class StorageSlotSerializer(serializers.ModelSerializer):
             # New fields
             "qr_codes",
             "related_names",
+            "group",
             "all_qr_codes",
             "all_slot_names",
             "is_combined",
             "combined_group_size",
         ]
         read_only_fields = [
+            "group",
             "all_qr_codes",
             "all_slot_names",
             "is_combined",
@@ -93,6 +95,7 @@ class StorageSerializer(serializers.ModelSerializer):
             "location",
             "device",
             "ATNPTL_shelf_id",
+            "ATNPTL_transport",
             "lighthouse_A_yellow",
             "lighthouse_B_yellow",
             "archived",
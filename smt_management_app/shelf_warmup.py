@@ -0,0 +1,107 @@
+import os
+import sys
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import Storage
+from .utils.led_shelf_dispatcher import (
+    ShelfBackendUnavailable,
+    get_dispatcher,
+    get_shelf_health,
+)
+
+# manage.py commands that serve requests, every other command skips the warm-up
+SERVING_COMMANDS = ("runserver",)
+
+_unavailable = {}
+
+# runserver imports the WSGI application as well, so apps.ready() and wsgi.py both
+# start the warm-up in one process, only the first call starts a thread
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+
+
+def should_warm_up(argv=None):
+    """
+    Whether this process is a runserver that should connect the shelfs.
+
+    Migrations, tests, scripts and the autoreloader parent of runserver skip it,
+    WSGI/ASGI servers start it from the application module. Set
+    SHELF_WARMUP = False in the settings to disable it.
+    """
+    argv = sys.argv if argv is None else argv
+    if not getattr(settings, "SHELF_WARMUP", True):
+        return False
+    if len(argv) < 2 or not argv[0].endswith("manage.py"):
+        return False
+    if argv[1] not in SERVING_COMMANDS:
+        return False
+    return "--noreload" in argv or os.environ.get("RUN_MAIN") == "true"
+
+
+def warm_up_dispatchers():
+    """
+    Build the dispatcher of every storage. Each dispatcher connects its device on
+    its own worker thread, so all shelfs connect concurrently.
+    """
+    try:
+        for storage in Storage.objects.all():
+            try:
+                get_dispatcher(storage)
+                _unavailable.pop(storage.name, None)
+            except ShelfBackendUnavailable as e:
+                print(e)
+                _unavailable[storage.name] = str(e)
+            except Exception as e:
+                print(f"Warm-up of {storage.name} failed: {e}")
+                _unavailable[storage.name] = str(e)
+    finally:
+        # this thread is not a request, do not leak its db connection
+        close_old_connections()
+
+
+def start_warmup():
+    """Start the warm-up thread of this process once, returns it (None if disabled)."""
+    global _warmup_thread
+    if not getattr(settings, "SHELF_WARMUP", True):
+        return None
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(
+                target=warm_up_dispatchers, name="shelf-warmup", daemon=True
+            )
+            _warmup_thread.start()
+        return _warmup_thread
+
+
+def collect_shelf_health():
+    """
+    Connection state of every storage.
+
+    Returns:
+        tuple: (ready, dict of storage name to state, error, init_duration and
+        device). ready is False while any storage is still pending or connecting.
+    """
+    dispatchers = get_shelf_health()
+    storages = {}
+    for name, device in Storage.objects.values_list("name", "device"):
+        if name in dispatchers:
+            storages[name] = dispatchers[name]
+        elif name in _unavailable:
+            storages[name] = {
+                "state": "failed",
+                "error": _unavailable[name],
+                "init_duration": None,
+                "device": device,
+            }
+        else:
+            storages[name] = {
+                "state": "pending",
+                "error": None,
+                "init_duration": None,
+                "device": device,
+            }
+    ready = all(health["state"] in ("ready", "failed") for health in storages.values())
+    return ready, storages
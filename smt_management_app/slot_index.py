@@ -0,0 +1,416 @@
+import threading
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Storage, StorageSlot
+
+# In-process indexes over the slots of a storage, so hot paths (LED expansion of
+# combined slots, free slot allocation) do not have to query or scan the
+# StorageSlot table on every request.
+#
+# Saves and deletes invalidate the indexes of the process they happen in and bump
+# the slot_layout_version / slot_occupancy_version of the Storage row. Other
+# processes (further web workers, the LED service) rebuild an index once a
+# Storage row passed to the lookup carries a newer version than the index was
+# built at, lookups by storage name never rebuild.
+
+
+def _layout_version(storage):
+    return getattr(storage, "slot_layout_version", 0)
+
+
+def _occupancy_version(storage):
+    return getattr(storage, "slot_occupancy_version", 0)
+
+
+_lamp_groups = {}
+_lamp_groups_lock = threading.Lock()
+
+_occupancy = {}
+_occupancy_lock = threading.RLock()
+
+_lighthouse_zones = {}
+_lighthouse_zones_lock = threading.Lock()
+
+
+def _lamp_key(lamp):
+    # lamps arrive as int slot names from the views and as strings from urls
+    if isinstance(lamp, str) and lamp.isdigit():
+        return int(lamp)
+    return lamp
+
+
+def _build_lamp_groups(storage_name):
+    """
+    Build the lamp -> combined group map of a storage in one query.
+
+    A lamp that has its own slot row maps to that slot's group. Lamps that only
+    exist in the related_names of another slot (slots deleted by a merge) map to the
+    group of the first slot referencing them.
+    """
+    lamp_groups = {}
+    secondary_groups = {}
+    slots = (
+        StorageSlot.objects.filter(storage_id=storage_name)
+        .order_by("pk")
+        .values_list("name", "related_names")
+    )
+    for name, related_names in slots:
+        group = [name] + list(related_names or [])
+        lamp_groups[name] = group
+        for related_name in related_names or []:
+            secondary_groups.setdefault(related_name, group)
+
+    for lamp, group in secondary_groups.items():
+        lamp_groups.setdefault(lamp, group)
+    return lamp_groups
+
+
+def get_lamp_groups(storage):
+    """
+    Return the cached {lamp: [all lamps of its combined group]} map of a storage.
+
+    Args:
+        storage: Storage instance or storage name
+    """
+    storage_name = getattr(storage, "name", storage)
+    cached = _lamp_groups.get(storage_name)
+    if cached is None or cached[0] < _layout_version(storage):
+        cached = (_layout_version(storage), _build_lamp_groups(storage_name))
+        with _lamp_groups_lock:
+            _lamp_groups[storage_name] = cached
+    return cached[1]
+
+
+def get_lamp_group(storage, lamp):
+    """Return all lamps that have to be switched together with lamp."""
+    return get_lamp_groups(storage).get(_lamp_key(lamp), [lamp])
+
+
+def _build_lighthouse_zones(storage_name, capacity):
+    """
+    Map every slot of a storage to its lighthouse side ("A" or "B") in one query.
+
+    Slots numbered 1..capacity are split at capacity // 2. Code style names (e.g.
+    1001-8050, shelf row and position) do not fit that rule, those storages are
+    split at the middle of their sorted slot names.
+    """
+    names = sorted(
+        StorageSlot.objects.filter(storage_id=storage_name).values_list(
+            "name", flat=True
+        )
+    )
+    if all(name <= capacity for name in names):
+        half = capacity // 2
+        return {name: "A" if name <= half else "B" for name in names}
+    half = len(names) // 2
+    return {
+        name: "A" if position < half else "B" for position, name in enumerate(names)
+    }
+
+
+def get_lighthouse_zones(storage):
+    """
+    Return the cached {slot name: lighthouse side} map of a storage. A new map
+    object is built after the slots or the capacity changed.
+
+    Args:
+        storage: Storage instance
+    """
+    cached = _lighthouse_zones.get(storage.name)
+    if (
+        cached is None
+        or cached[0] != storage.capacity
+        or cached[1] < _layout_version(storage)
+    ):
+        cached = (
+            storage.capacity,
+            _layout_version(storage),
+            _build_lighthouse_zones(storage.name, storage.capacity),
+        )
+        with _lighthouse_zones_lock:
+            _lighthouse_zones[storage.name] = cached
+    return cached[2]
+
+
+def lighthouse_zone(storage, lamp, zones=None):
+    """Return the lighthouse side of a lamp, lamps without a slot row split at capacity // 2."""
+    if zones is None:
+        zones = get_lighthouse_zones(storage)
+    lamp = _lamp_key(lamp)
+    zone = zones.get(lamp)
+    if zone is None:
+        if isinstance(lamp, int) and lamp <= storage.capacity // 2:
+            return "A"
+        return "B"
+    return zone
+
+
+class OccupancyIndex:
+    """
+    Occupancy of the slots of one storage kept as bitsets.
+
+    Every slot gets a bit position (ordered by pk, the order the database returns
+    free slots in). Slots are grouped by their (diameter, width) class, so a
+    "what fits" lookup is an OR over the fitting classes followed by masking out
+    the occupied slots and the slots whose combined group holds a carrier.
+    """
+
+    def __init__(self, storage_name, layout_version=0, occupancy_version=0):
+        self.storage_name = storage_name
+        # versions of the Storage row the slots were read after
+        self.layout_version = layout_version
+        self.occupancy_version = occupancy_version
+        self.slot_ids = []
+        self.positions = {}
+        self.class_masks = {}
+        self.group_masks = []
+        self.member_masks = []
+        self.occupied = 0
+        self.nominated = 0
+        self.blocked = 0
+
+    def older_than(self, storage):
+        return self.layout_version < _layout_version(
+            storage
+        ) or self.occupancy_version < _occupancy_version(storage)
+
+    @classmethod
+    def build(cls, storage):
+        storage_name = getattr(storage, "name", storage)
+        index = cls(storage_name, _layout_version(storage), _occupancy_version(storage))
+        slots = list(
+            StorageSlot.objects.filter(storage_id=storage_name)
+            .order_by("pk")
+            .values_list(
+                "pk",
+                "name",
+                "related_names",
+                "diameter",
+                "width",
+                "carrier",
+                "nominated_carrier",
+            )
+        )
+        name_positions = {}
+        for position, (pk, name, *_) in enumerate(slots):
+            index.slot_ids.append(pk)
+            index.positions[pk] = position
+            name_positions.setdefault(name, position)
+
+        index.member_masks = [0] * len(slots)
+        for position, slot in enumerate(slots):
+            pk, name, related_names, diameter, width, carrier, nominated = slot
+            if diameter is not None and width is not None:
+                dimension_class = (diameter, width)
+                index.class_masks[dimension_class] = index.class_masks.get(
+                    dimension_class, 0
+                ) | (1 << position)
+
+            # related names without a slot row can never hold a carrier
+            group_mask = 1 << position
+            for related_name in related_names or []:
+                if related_name in name_positions:
+                    group_mask |= 1 << name_positions[related_name]
+            index.group_masks.append(group_mask)
+            for member in _positions_of(group_mask):
+                index.member_masks[member] |= 1 << position
+
+            if carrier is not None:
+                index.occupied |= 1 << position
+            if nominated is not None:
+                index.nominated |= 1 << position
+
+        for position in range(len(slots)):
+            if index.group_masks[position] & index.occupied:
+                index.blocked |= 1 << position
+        return index
+
+    def set_occupied(self, slot_id, occupied):
+        position = self.positions.get(slot_id)
+        if position is None:
+            return False
+        if occupied:
+            self.occupied |= 1 << position
+        else:
+            self.occupied &= ~(1 << position)
+        # only groups containing this slot can change their blocked state
+        for member in _positions_of(self.member_masks[position]):
+            if self.group_masks[member] & self.occupied:
+                self.blocked |= 1 << member
+            else:
+                self.blocked &= ~(1 << member)
+        return True
+
+    def set_nominated(self, slot_id, nominated):
+        position = self.positions.get(slot_id)
+        if position is None:
+            return False
+        if nominated:
+            self.nominated |= 1 << position
+        else:
+            self.nominated &= ~(1 << position)
+        return True
+
+    def free_mask(self, min_diameter, min_width, exclude_nominated=False):
+        min_diameter = min_diameter or 0
+        min_width = min_width or 0
+        fitting = 0
+        for (diameter, width), mask in self.class_masks.items():
+            if diameter >= min_diameter and width >= min_width:
+                fitting |= mask
+        free = fitting & ~self.occupied & ~self.blocked
+        if exclude_nominated:
+            free &= ~self.nominated
+        return free
+
+    def free_slot_ids(self, min_diameter, min_width, exclude_nominated=False):
+        free = self.free_mask(min_diameter, min_width, exclude_nominated)
+        return [self.slot_ids[position] for position in _positions_of(free)]
+
+    def first_free_slot_id(self, min_diameter, min_width, exclude_nominated=False):
+        free = self.free_mask(min_diameter, min_width, exclude_nominated)
+        if not free:
+            return None
+        return self.slot_ids[(free & -free).bit_length() - 1]
+
+
+def _positions_of(mask):
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
+
+
+def get_occupancy_index(storage):
+    """
+    Return the occupancy index of a storage, building it from the database once
+    and again when storage carries a newer version.
+
+    Args:
+        storage: Storage instance, ideally freshly loaded, or storage name
+    """
+    storage_name = getattr(storage, "name", storage)
+    with _occupancy_lock:
+        index = _occupancy.get(storage_name)
+        if index is None or index.older_than(storage):
+            index = OccupancyIndex.build(storage)
+            _occupancy[storage_name] = index
+        return index
+
+
+def rebuild_occupancy_index(storage):
+    """Drop and rebuild the occupancy index of a storage, e.g. after a mismatch."""
+    storage_name = getattr(storage, "name", storage)
+    with _occupancy_lock:
+        _occupancy.pop(storage_name, None)
+        return get_occupancy_index(storage)
+
+
+def find_free_slot_ids(storage, min_diameter, min_width, exclude_nominated=False):
+    """Return the ids of all free slots fitting the given dimensions, in pk order."""
+    with _occupancy_lock:
+        return get_occupancy_index(storage).free_slot_ids(
+            min_diameter, min_width, exclude_nominated
+        )
+
+
+def find_first_free_slot_id(storage, min_diameter, min_width, exclude_nominated=False):
+    """Return the id of the first free slot fitting the given dimensions or None."""
+    with _occupancy_lock:
+        return get_occupancy_index(storage).first_free_slot_id(
+            min_diameter, min_width, exclude_nominated
+        )
+
+
+def carrier_slots_changed(old_slots, new_slots):
+    """
+    Update the occupancy indexes after a carrier moved.
+
+    Args:
+        old_slots: (storage_slot_id, nominated_for_slot_id) before the save
+        new_slots: (storage_slot_id, nominated_for_slot_id) after the save
+    """
+    carriers_moved([(old_slots, new_slots)])
+
+
+def carriers_moved(moves):
+    """
+    Update the occupancy indexes after several carriers moved, with one version
+    bump per storage.
+
+    Args:
+        moves: (old_slots, new_slots) pairs as taken by carrier_slots_changed
+    """
+    slot_ids = set()
+    for old_slots, new_slots in moves:
+        for old_slot, new_slot in zip(old_slots, new_slots):
+            if old_slot != new_slot:
+                slot_ids.update({old_slot, new_slot} - {None})
+    if not slot_ids:
+        return
+
+    Storage.objects.filter(storageslot__in=slot_ids).update(
+        slot_occupancy_version=F("slot_occupancy_version") + 1
+    )
+
+    if transaction.get_connection().in_atomic_block:
+        # the change may still be rolled back, rebuild from committed rows instead
+        invalidate_occupancy()
+        transaction.on_commit(invalidate_occupancy)
+        return
+
+    with _occupancy_lock:
+        for index in _occupancy.values():
+            changed = False
+            for (old_slot, old_nominated), (new_slot, new_nominated) in moves:
+                if old_slot != new_slot:
+                    if old_slot is not None:
+                        changed |= index.set_occupied(old_slot, False)
+                    if new_slot is not None:
+                        changed |= index.set_occupied(new_slot, True)
+                if old_nominated != new_nominated:
+                    if old_nominated is not None:
+                        changed |= index.set_nominated(old_nominated, False)
+                    if new_nominated is not None:
+                        changed |= index.set_nominated(new_nominated, True)
+            if changed:
+                # the index has the bump made above, not necessarily others before it
+                index.occupancy_version += 1
+
+
+def invalidate_occupancy(storage_name=None):
+    with _occupancy_lock:
+        if storage_name is None:
+            _occupancy.clear()
+        else:
+            _occupancy.pop(storage_name, None)
+
+
+def invalidate_slot_index(storage_name=None):
+    """
+    Drop the indexes of one storage (or all storages), now and again once the
+    surrounding transaction committed, so no stale index built in between stays cached.
+    Other processes are told by bumping the slot_layout_version of the storage.
+    """
+    if storage_name is not None:
+        Storage.objects.filter(name=storage_name).update(
+            slot_layout_version=F("slot_layout_version") + 1
+        )
+
+    def invalidate():
+        with _lamp_groups_lock:
+            if storage_name is None:
+                _lamp_groups.clear()
+            else:
+                _lamp_groups.pop(storage_name, None)
+        with _lighthouse_zones_lock:
+            if storage_name is None:
+                _lighthouse_zones.clear()
+            else:
+                _lighthouse_zones.pop(storage_name, None)
+        invalidate_occupancy(storage_name)
+
+    invalidate()
+    transaction.on_commit(invalidate)
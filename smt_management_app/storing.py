@@ -1,10 +1,12 @@
+import json
+import time
 from pprint import pp
-from threading import Thread, Timer
 from xml.sax.handler import feature_external_ges
 
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
-from django.db.models import Q
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import Exists, Q
 
 
 from .models import (
@@ -22,54 +24,54 @@ from .models import (
     LocalFile,
 )
 
-from .utils.led_shelf_dispatcher import LED_shelf_dispatcher
+from .utils.led_shelf_dispatcher import get_dispatcher
 from .helpers import find_slot_by_qr_code, slot_matches_qr_code
+from .slot_index import (
+    carrier_slots_changed,
+    find_free_slot_ids,
+    invalidate_occupancy,
+    rebuild_occupancy_index,
+)
 
 
-def get_truly_free_slots(storage, min_diameter, min_width):
+def get_truly_free_slots(storage, min_diameter, min_width, exclude_nominated=False):
     """
     Get slots that are free AND all their related slots in combined slots are free.
 
+    The candidates come from the in-process occupancy index of the storage, the
+    database is only asked for the matching slot rows. Slots freed by another
+    process show up once storage carries its newer slot_occupancy_version. If a
+    row turns out to be occupied after all, the index is rebuilt from the
+    database and asked again.
+
     Args:
-        storage: Storage instance
+        storage: Storage instance, freshly loaded so the index sees other processes
         min_diameter: Minimum diameter requirement
         min_width: Minimum width requirement
+        exclude_nominated: Skip slots another carrier is nominated for
 
     Returns:
         List of StorageSlot instances that are truly free (including their combined slots)
     """
-    # Step 1: Get all potentially free slots that meet requirements
-    potentially_free = list(
-        StorageSlot.objects.filter(
-            carrier__isnull=True,
-            storage=storage,
-            diameter__gte=min_diameter,
-            width__gte=min_width,
-        ).select_related("storage")
-    )
-
-    # Step 2: Collect all slot names that need checking in one batch
-    all_names_to_check = set()
-    slot_to_related_names = {}
-
-    for slot in potentially_free:
-        related_names = set(slot.get_all_slot_names())
-        all_names_to_check.update(related_names)
-        slot_to_related_names[slot.id] = related_names
-
-    # Step 3: Check all occupied slots in a single query
-    occupied_slots = set(
-        StorageSlot.objects.filter(
-            storage=storage, name__in=list(all_names_to_check), carrier__isnull=False
-        ).values_list("name", flat=True)
+    free_slot_ids = find_free_slot_ids(
+        storage, min_diameter, min_width, exclude_nominated
     )
-
-    # Step 4: Filter the truly free slots (no related occupied slots)
-    truly_free = []
-    for slot in potentially_free:
-        related_names = slot_to_related_names[slot.id]
-        if not occupied_slots.intersection(related_names):
-            truly_free.append(slot)
+    slots = StorageSlot.objects.filter(
+        id__in=free_slot_ids, carrier__isnull=True
+    ).select_related("storage")
+    truly_free = sorted(slots, key=lambda slot: slot.id)
+
+    if len(truly_free) != len(free_slot_ids):
+        print(f"Occupancy index of {storage.name} out of sync, rebuilding")
+        rebuild_occupancy_index(storage)
+        free_slot_ids = find_free_slot_ids(
+            storage, min_diameter, min_width, exclude_nominated
+        )
+        truly_free = list(
+            StorageSlot.objects.filter(id__in=free_slot_ids)
+            .select_related("storage")
+            .order_by("id")
+        )
 
     return truly_free
 
@@ -84,11 +86,103 @@ def is_combined_slot_occupied(slot):
     Returns:
         bool: True if any slot in the combined group is occupied
     """
-    all_slot_names = slot.get_all_slot_names()
-    related_slots = StorageSlot.objects.filter(
-        storage=slot.storage, name__in=all_slot_names
-    )
-    return related_slots.filter(carrier__isnull=False).exists()
+    return StorageSlot.objects.filter(
+        carrier__isnull=False, **slot.group_members_filter()
+    ).exists()
+
+
+# how often a reservation looks for fresh candidates / retries a locked database
+RESERVE_ATTEMPTS = 5
+LOCKED_RETRIES = 20
+
+
+def claim_slot(carrier, slot, light=True):
+    """
+    Nominate slot for carrier unless another carrier is stored in or nominated
+    for any slot of its combined group.
+
+    The check and the nomination are one conditional UPDATE, and the unique
+    nominated_for_slot column rejects a second claim of the same slot, so two
+    stations can never end up with the same slot.
+
+    Inside a surrounding transaction a locked database is not retried here, the
+    caller has to retry its whole transaction.
+
+    Args:
+        carrier: Carrier instance to nominate
+        slot: StorageSlot to claim
+        light: Set the led_state of the claimed slot
+
+    Returns:
+        bool: True if the slot was claimed
+    """
+    group_slots = StorageSlot.objects.filter(**slot.group_members_filter()).values("pk")
+    taken = Carrier.objects.filter(
+        Q(storage_slot__in=group_slots) | Q(nominated_for_slot__in=group_slots)
+    ).exclude(pk=carrier.pk)
+
+    for retry in range(LOCKED_RETRIES):
+        try:
+            with transaction.atomic():
+                claimed = (
+                    Carrier.objects.filter(pk=carrier.pk)
+                    .filter(~Exists(taken))
+                    .update(nominated_for_slot=slot)
+                )
+                if claimed and light:
+                    StorageSlot.set_led_state([slot], 1)
+            break
+        except IntegrityError:
+            # another station nominated a carrier for this slot in the meantime
+            return False
+        except OperationalError as e:
+            # sqlite reports concurrent writers as a locked database, try again
+            if "locked" not in str(e) or transaction.get_connection().in_atomic_block:
+                raise
+            time.sleep(0.01 * (retry + 1))
+    else:
+        return False
+
+    if not claimed:
+        return False
+
+    loaded_slots = carrier._slots()
+    carrier.nominated_for_slot = slot
+    carrier_slots_changed(loaded_slots, carrier._slots())
+    carrier._loaded_slots = carrier._slots()
+    return True
+
+
+def reserve_slot(carrier, storage, candidates=None, light=True):
+    """
+    Allocate and nominate a free slot of storage for carrier, race free.
+
+    Candidates come from the occupancy index, a candidate claimed by another
+    station in the meantime is skipped for the next one. If every candidate is
+    gone the index is rebuilt and asked again.
+
+    Args:
+        carrier: Carrier instance to nominate
+        storage: Storage instance
+        candidates: Optional StorageSlot instances to try first
+        light: Set the led_state of the nominated slot, see claim_slot
+
+    Returns:
+        The nominated StorageSlot or None if the storage has no free fitting slot
+    """
+    for attempt in range(RESERVE_ATTEMPTS):
+        if candidates is None:
+            candidates = get_truly_free_slots(
+                storage, carrier.diameter, carrier.width, exclude_nominated=True
+            )
+        if not candidates:
+            return None
+        for slot in candidates:
+            if claim_slot(carrier, slot, light=light):
+                return slot
+        rebuild_occupancy_index(storage)
+        candidates = None
+    return None
 
 
 @csrf_exempt
@@ -130,9 +224,9 @@ def store_carrier(request, carrier_name, storage_name):
         )
     storage = storage_queryset.first()
 
-    # Use combined-slot-aware free slot detection
-    free_slots = get_truly_free_slots(storage, carrier.diameter, carrier.width)
-    if not free_slots:
+    # Atomically nominate the first combined-slot-aware free slot nobody else holds
+    free_slot = reserve_slot(carrier, storage)
+    if not free_slot:
         return JsonResponse(
             {
                 "success": False,
@@ -140,24 +234,8 @@ def store_carrier(request, carrier_name, storage_name):
             }
         )
 
-    free_slot = free_slots[0]  # Get first truly free slot
-    free_slot.led_state = 1
-
-    # check if another carrier was nominated for this slot if yes clear it
-    if hasattr(free_slot, "nominated_carrier") and free_slot.nominated_carrier:
-        other_carrier = free_slot.nominated_carrier
-        other_carrier.nominated_for_slot = None
-        other_carrier.save()
-    free_slot.save()
-
-    carrier.nominated_for_slot = free_slot
-    carrier.save()
-    led_dispatcher = LED_shelf_dispatcher(
-        Storage.objects.get(name=free_slot.storage.name)
-    )
-    Thread(
-        target=led_dispatcher.led_on, kwargs={"lamp": free_slot.name, "color": "yellow"}
-    ).start()
+    led_dispatcher = get_dispatcher(storage)
+    led_dispatcher.submit("led_on", lamp=free_slot.name, color="yellow")
 
     msg = {
         "storage": storage.name,
@@ -187,21 +265,13 @@ def store_carrier_confirm(request, carrier_name, storage_name, slot_name):
         return JsonResponse({"success": False, "message": "Slot not found."})
 
     dispatchers = {
-        storage.name: LED_shelf_dispatcher(storage)
+        storage.name: get_dispatcher(storage)
         for storage in set([carrier.nominated_for_slot.storage, slot.storage])
     }
 
     # Check if scanned slot matches nominated slot (using combined slots support)
     if not slot_matches_qr_code(carrier.nominated_for_slot, slot_name):
-        Thread(
-            target=dispatchers[slot.storage.name].led_on,
-            kwargs={"lamp": slot.name, "color": "red"},
-        ).start()
-        Timer(
-            interval=2,
-            function=dispatchers[slot.storage.name].led_off,
-            kwargs={"lamp": slot.name},
-        ).start()
+        dispatchers[slot.storage.name].flash(slot.name, "red")
         return JsonResponse(
             {
                 "success": False,
@@ -215,18 +285,9 @@ def store_carrier_confirm(request, carrier_name, storage_name, slot_name):
     carrier.storage_slot = slot
     carrier.nominated_for_slot = None
     carrier.save()
-    slot.led_state = 0
-    slot.save()
-
-    Thread(
-        target=dispatchers[slot.storage.name].led_on,
-        kwargs={"lamp": slot.name, "color": "green"},
-    ).start()
-    Timer(
-        interval=2,
-        function=dispatchers[slot.storage.name].led_off,
-        kwargs={"lamp": slot.name},
-    ).start()
+    StorageSlot.set_led_state([slot], 0)
+
+    dispatchers[slot.storage.name].flash(slot.name, "green")
 
     return JsonResponse({"success": True})
 
@@ -242,27 +303,206 @@ def store_carrier_cancel(request, carrier_name):
 
     slot = carrier.nominated_for_slot
     storage = slot.storage
-    dispatchers = {storage.name: LED_shelf_dispatcher(storage)}
+    dispatchers = {storage.name: get_dispatcher(storage)}
 
     carrier.nominated_for_slot = None
     carrier.save()
 
-    slot.led_state = 0
-    slot.save()
+    StorageSlot.set_led_state([slot], 0)
 
-    Thread(
-        target=dispatchers[slot.storage.name].led_on,
-        kwargs={"lamp": slot.name, "color": "red"},
-    ).start()
-    Timer(
-        interval=2,
-        function=dispatchers[slot.storage.name].led_off,
-        kwargs={"lamp": slot.name},
-    ).start()
+    dispatchers[slot.storage.name].flash(slot.name, "red")
 
     return JsonResponse({"success": True})
 
 
+# colours of carrier groups in a batch, red and green stay reserved for feedback
+BATCH_COLORS = ("yellow", "blue")
+
+
+def get_carrier_storing_error(carrier):
+    """Return why a carrier can not be stored right now, or None."""
+    if carrier.collecting:
+        return "Carrier is collecting."
+    if carrier.archived:
+        return "Carrier has been archived."
+    if not carrier.delivered:
+        return "Carrier has not been delivered."
+    if carrier.storage_slot_id:
+        return "Carrier is stored already."
+    if carrier.machine_slot_id:
+        return "Carrier is in machine slot."
+    return None
+
+
+def allocate_slots(carriers, storages):
+    """
+    Allocate a free slot for each carrier, largest carriers first, each into the
+    smallest free slot it fits, so large slots stay available for large reels.
+    A combined slot group takes at most one carrier.
+
+    Args:
+        carriers: Carrier instances
+        storages: Storage instances, filled in the given order
+
+    Returns:
+        Dict {carrier name: StorageSlot} of the carriers that got a slot
+    """
+    free_slots = []
+    for storage in storages:
+        free_slots.extend(get_truly_free_slots(storage, 0, 0, exclude_nominated=True))
+    storage_order = {storage.name: i for i, storage in enumerate(storages)}
+    free_slots.sort(
+        key=lambda slot: (
+            storage_order[slot.storage_id],
+            slot.diameter,
+            slot.width,
+            slot.id,
+        )
+    )
+
+    allocation = {}
+    used_lamps = set()
+    for carrier in sorted(
+        carriers, key=lambda c: (c.diameter or 0, c.width or 0), reverse=True
+    ):
+        for slot in free_slots:
+            lamps = {(slot.storage_id, name) for name in slot.get_all_slot_names()}
+            if (
+                slot.diameter >= (carrier.diameter or 0)
+                and slot.width >= (carrier.width or 0)
+                and not lamps & used_lamps
+            ):
+                allocation[carrier.name] = slot
+                used_lamps |= lamps
+                break
+    return allocation
+
+
+def claim_batch_slots(carriers, storages):
+    """
+    Allocate slots for carriers with allocate_slots and nominate them. A slot
+    another station took meanwhile falls back to the next free one.
+
+    Call it in a transaction, so the batch is nominated completely or not at all.
+    The led_state of the slots is not set, see claim_slot.
+
+    Returns:
+        Dict {carrier name: StorageSlot} of the carriers that got a slot
+    """
+    allocation = allocate_slots(carriers, storages)
+    claimed = {}
+    for carrier in carriers:
+        slot = allocation.get(carrier.name)
+        if slot and not claim_slot(carrier, slot, light=False):
+            slot = reserve_slot(carrier, slot.storage, light=False)
+        if slot:
+            claimed[carrier.name] = slot
+    return claimed
+
+
+@csrf_exempt
+def store_carriers_batch(request):
+    """
+    Nominate and light up slots for a whole batch of carriers at once.
+
+    Expects a JSON body {"carriers": [carrier names], "storage": optional storage
+    name}. Slots are allocated for the whole batch and reserved with claim_slot in
+    one transaction, a failure nominates none of the carriers. Each shelf gets one
+    LED command, carriers of the same article share a colour. Every carrier is then
+    confirmed on its own through store_carrier_confirm.
+
+    Returns:
+        JsonResponse with the allocated and the rejected carriers
+    """
+    try:
+        body = json.loads(request.body or "{}")
+        carrier_names = [name.strip() for name in body["carriers"]]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse(
+            {"success": False, "message": "Expected a JSON list of carriers."}
+        )
+
+    storage_name = (body.get("storage") or "").strip()
+    if storage_name:
+        storages = list(Storage.objects.filter(name=storage_name))
+        if not storages:
+            return JsonResponse(
+                {"success": False, "message": f"No such storage {storage_name}."}
+            )
+    else:
+        storages = list(Storage.objects.filter(archived=False))
+
+    carriers = Carrier.objects.filter(name__in=carrier_names, archived=False)
+    carriers_by_name = {carrier.name: carrier for carrier in carriers}
+
+    rejected = []
+    storable = []
+    for carrier_name in dict.fromkeys(carrier_names):
+        carrier = carriers_by_name.get(carrier_name)
+        error = get_carrier_storing_error(carrier) if carrier else "Carrier not found."
+        if error:
+            rejected.append({"carrier": carrier_name, "message": error})
+        else:
+            storable.append(carrier)
+
+    for retry in range(LOCKED_RETRIES):
+        try:
+            with transaction.atomic():
+                allocation = claim_batch_slots(storable, storages)
+            break
+        except OperationalError as e:
+            # the whole batch was rolled back, indexes built meanwhile saw its claims
+            invalidate_occupancy()
+            if "locked" not in str(e):
+                raise
+            time.sleep(0.01 * (retry + 1))
+    else:
+        return JsonResponse(
+            {"success": False, "message": "Database is busy, no carrier was stored."}
+        )
+
+    for carrier in storable:
+        if carrier.name not in allocation:
+            rejected.append(
+                {"carrier": carrier.name, "message": "No free storage slot."}
+            )
+    StorageSlot.set_led_state(list(allocation.values()), 1)
+
+    article_colors = {}
+    lights_by_storage = {}
+    allocated = []
+    for carrier in storable:
+        slot = allocation.get(carrier.name)
+        if slot is None:
+            continue
+        color = article_colors.setdefault(
+            carrier.article_id, BATCH_COLORS[len(article_colors) % len(BATCH_COLORS)]
+        )
+        lamps = lights_by_storage.setdefault(slot.storage_id, {})
+        for name in slot.get_all_slot_names():
+            lamps[name] = color
+        allocated.append(
+            {
+                "carrier": carrier.name,
+                "storage": slot.storage_id,
+                "slot": slot.qr_value,
+                "color": color,
+            }
+        )
+
+    # one consolidated LED command per shelf
+    for storage in storages:
+        if storage.name in lights_by_storage:
+            get_dispatcher(storage).submit(
+                "_LED_On_Control",
+                lights_dict={"lamps": lights_by_storage[storage.name]},
+            )
+
+    return JsonResponse(
+        {"success": bool(allocated), "allocated": allocated, "rejected": rejected}
+    )
+
+
 @csrf_exempt
 def store_carrier_choose_slot(request, carrier_name, storage_name):
     carrier_name = carrier_name.strip()
@@ -314,7 +554,7 @@ def store_carrier_choose_slot(request, carrier_name, storage_name):
 
     # Update LED state for all free slots
     free_slot_ids = [slot.id for slot in free_slots]
-    StorageSlot.objects.filter(id__in=free_slot_ids).update(led_state=1)
+    StorageSlot.set_led_state(StorageSlot.objects.filter(id__in=free_slot_ids), 1)
 
     # Light up all related LEDs for combined slots
     lights_dict = {"lamps": {}}
@@ -324,10 +564,7 @@ def store_carrier_choose_slot(request, carrier_name, storage_name):
         for name in all_names:
             lights_dict["lamps"][name] = "yellow"
 
-    Thread(
-        target=LED_shelf_dispatcher(storage)._LED_On_Control,
-        kwargs={"lights_dict": lights_dict},
-    ).start()
+    get_dispatcher(storage).submit("_LED_On_Control", lights_dict=lights_dict)
 
     return JsonResponse(msg)
 
@@ -351,32 +588,21 @@ def store_carrier_choose_slot_confirm(request, carrier_name, storage_name, slot_
         return JsonResponse({"success": False, "message": "no slot found"})
 
     storage = Storage.objects.filter(name=storage_name).first()
-    dispatcher = LED_shelf_dispatcher(storage)
+    dispatcher = get_dispatcher(storage)
 
     # Check if ANY slot in the combined group is occupied
     if is_combined_slot_occupied(slot):
-        slot.led_state = 1
-        slot.save()
-        Thread(
-            target=dispatcher.led_on,
-            kwargs={"lamp": slot.name, "color": "red"},
-        ).start()
-        slot.led_state = 0
-        slot.save()
-        Timer(
-            interval=2,
-            function=dispatcher.led_off,
-            kwargs={"lamp": slot.name},
-        ).start()
+        StorageSlot.set_led_state([slot], 0)
+        dispatcher.flash(slot.name, "red")
 
         # Find which specific slot in the group is occupied for error message
-        occupied_slot = None
-        all_slot_names = slot.get_all_slot_names()
-        related_slots = StorageSlot.objects.filter(
-            storage=slot.storage, name__in=all_slot_names, carrier__isnull=False
+        occupied_slot = (
+            StorageSlot.objects.filter(
+                carrier__isnull=False, **slot.group_members_filter()
+            )
+            .select_related("carrier")
+            .first()
         )
-        if related_slots.exists():
-            occupied_slot = related_slots.first()
 
         error_msg = f"Slot {slot_name} is part of a combined slot group where "
         if (
@@ -402,24 +628,13 @@ def store_carrier_choose_slot_confirm(request, carrier_name, storage_name, slot_
 
     carrier.storage_slot = slot
     carrier.save()
-    StorageSlot.objects.filter(storage=storage).update(led_state=0)
-
-    Thread(target=dispatcher.reset_leds).start()
-
-    slot.led_state = 1
-    slot.save()
-    Timer(
-        interval=0.5,
-        function=dispatcher.led_on,
-        kwargs={"lamp": slot.name, "color": "green"},
-    ).start()
-    slot.led_state = 0
-    slot.save()
-    Timer(
-        interval=4,
-        function=dispatcher.led_off,
-        kwargs={"lamp": slot.name},
-    ).start()
+    # deselects every slot of the storage, including the confirmed one
+    StorageSlot.set_led_state(StorageSlot.objects.filter(storage=storage), 0)
+
+    dispatcher.submit("reset_leds")
+
+    # the worker runs commands in order, the green light can not race the reset anymore
+    dispatcher.flash(slot.name, "green", duration=4)
 
     return JsonResponse(
         {
@@ -453,12 +668,7 @@ def store_carrier_choose_slot_confirm_by_qr(request, carrier_name, slot_name):
     carrier = carrier_queryset.first()
 
     # Find slot by QR code across all storages
-    slot = None
-    for storage in Storage.objects.all():
-        found_slot = find_slot_by_qr_code(slot_name, storage.name)
-        if found_slot:
-            slot = found_slot
-            break
+    slot = find_slot_by_qr_code(slot_name)
 
     if not slot:
         return JsonResponse(
@@ -469,32 +679,21 @@ def store_carrier_choose_slot_confirm_by_qr(request, carrier_name, slot_name):
         )
 
     storage = slot.storage
-    dispatcher = LED_shelf_dispatcher(storage)
+    dispatcher = get_dispatcher(storage)
 
     # Check if ANY slot in the combined group is occupied
     if is_combined_slot_occupied(slot):
-        slot.led_state = 1
-        slot.save()
-        Thread(
-            target=dispatcher.led_on,
-            kwargs={"lamp": slot.name, "color": "red"},
-        ).start()
-        slot.led_state = 0
-        slot.save()
-        Timer(
-            interval=2,
-            function=dispatcher.led_off,
-            kwargs={"lamp": slot.name},
-        ).start()
+        StorageSlot.set_led_state([slot], 0)
+        dispatcher.flash(slot.name, "red")
 
         # Find which specific slot in the group is occupied for error message
-        occupied_slot = None
-        all_slot_names = slot.get_all_slot_names()
-        related_slots = StorageSlot.objects.filter(
-            storage=slot.storage, name__in=all_slot_names, carrier__isnull=False
+        occupied_slot = (
+            StorageSlot.objects.filter(
+                carrier__isnull=False, **slot.group_members_filter()
+            )
+            .select_related("carrier")
+            .first()
         )
-        if related_slots.exists():
-            occupied_slot = related_slots.first()
 
         error_msg = f"Slot {slot_name} is part of a combined slot group where "
         if (
@@ -520,24 +719,13 @@ def store_carrier_choose_slot_confirm_by_qr(request, carrier_name, slot_name):
 
     carrier.storage_slot = slot
     carrier.save()
-    StorageSlot.objects.filter(storage=storage).update(led_state=0)
-
-    Thread(target=dispatcher.reset_leds).start()
-
-    slot.led_state = 1
-    slot.save()
-    Timer(
-        interval=0.5,
-        function=dispatcher.led_on,
-        kwargs={"lamp": slot.name, "color": "green"},
-    ).start()
-    slot.led_state = 0
-    slot.save()
-    Timer(
-        interval=4,
-        function=dispatcher.led_off,
-        kwargs={"lamp": slot.name},
-    ).start()
+    # deselects every slot of the storage, including the confirmed one
+    StorageSlot.set_led_state(StorageSlot.objects.filter(storage=storage), 0)
+
+    dispatcher.submit("reset_leds")
+
+    # the worker runs commands in order, the green light can not race the reset anymore
+    dispatcher.flash(slot.name, "green", duration=4)
 
     return JsonResponse(
         {
@@ -609,10 +797,12 @@ def store_carrier_choose_slot_all_storages(request, carrier_name):
     dispatchers = {}
     all_free_slots = []
 
+    free_slots_by_storage = {}
     for storage in Storage.objects.filter(archived=False):
         free_slots = get_truly_free_slots(storage, carrier.diameter, carrier.width)
 
         if free_slots:
+            free_slots_by_storage[storage.name] = free_slots
             available_storages.append(
                 {
                     "storage_name": storage.name,
@@ -622,7 +812,7 @@ def store_carrier_choose_slot_all_storages(request, carrier_name):
             )
             
             # Create dispatcher for this storage
-            dispatchers[storage.name] = LED_shelf_dispatcher(storage)
+            dispatchers[storage.name] = get_dispatcher(storage)
             all_free_slots.extend(free_slots)
 
     if not available_storages:
@@ -637,13 +827,11 @@ def store_carrier_choose_slot_all_storages(request, carrier_name):
     
     # 1. Update LED state for all free slots in database
     all_free_slot_ids = [slot.id for slot in all_free_slots]
-    StorageSlot.objects.filter(id__in=all_free_slot_ids).update(led_state=1)
+    StorageSlot.set_led_state(StorageSlot.objects.filter(id__in=all_free_slot_ids), 1)
 
     # 2. Light up LEDs for each storage that has available slots
-    for storage in Storage.objects.filter(archived=False):
-        free_slots_for_storage = get_truly_free_slots(storage, carrier.diameter, carrier.width)
-        
-        if free_slots_for_storage and storage.name in dispatchers:
+    for storage_name, free_slots_for_storage in free_slots_by_storage.items():
+        if storage_name in dispatchers:
             # Create lights_dict for this storage
             lights_dict = {"lamps": {}}
             
@@ -653,11 +841,8 @@ def store_carrier_choose_slot_all_storages(request, carrier_name):
                 for name in all_names:
                     lights_dict["lamps"][name] = "yellow"
             
-            # Start thread to light up LEDs for this storage
-            Thread(
-                target=dispatchers[storage.name]._LED_On_Control,
-                kwargs={"lights_dict": lights_dict},
-            ).start()
+            # Queue the LED command on the shelf worker of this storage
+            dispatchers[storage_name].submit("_LED_On_Control", lights_dict=lights_dict)
 
     return JsonResponse(
         {
@@ -715,10 +900,10 @@ def store_auto_with_storage_selection(request, carrier_id, storage_name):
 
 
 def store_carrier_choose_slot_cancel(request, carrier_name, storage_name):
-    StorageSlot.objects.filter(storage=storage_name).update(led_state=0)
+    StorageSlot.set_led_state(StorageSlot.objects.filter(storage=storage_name), 0)
     storage = Storage.objects.filter(name=storage_name)
     storage.update(lighthouse_A_yellow=False, lighthouse_B_yellow=False)
-    dispatcher = LED_shelf_dispatcher(storage.first())
-    Thread(target=dispatcher.reset_leds, kwargs={"working_light": True}).start()
+    dispatcher = get_dispatcher(storage.first())
+    dispatcher.submit("reset_leds", working_light=True)
 
     return JsonResponse({"success": True})
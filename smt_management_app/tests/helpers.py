@@ -0,0 +1,56 @@
+import threading
+
+from smt_management_app.models import Storage, StorageSlot
+
+
+def create_storage(name="storage_0", slots=10, device="Dummy", slot_fields=None):
+    """
+    Create a storage with the slots 1..slots, named after their position and
+    with the qr value "<storage>_<slot>".
+
+    Args:
+        name: Storage name
+        slots: Number of slots, also the capacity of the storage
+        device: Storage device
+        slot_fields: Optional callable, returns extra StorageSlot fields for a
+            slot name, e.g. lambda slot_name: {"diameter": 7 + slot_name}
+
+    Returns:
+        Storage
+    """
+    storage = Storage.objects.create(name=name, device=device, capacity=slots)
+    for slot_name in range(1, slots + 1):
+        StorageSlot.objects.create(
+            name=slot_name,
+            qr_value=f"{name}_{slot_name}",
+            storage=storage,
+            **(slot_fields(slot_name) if slot_fields else {}),
+        )
+    return storage
+
+
+class Recorder(list):
+    """
+    List of calls recorded from other threads (dispatcher worker, timer wheel,
+    LED service), wait() blocks until enough of them arrived instead of
+    sleeping for a guessed time.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._changed = threading.Condition()
+
+    def append(self, entry):
+        with self._changed:
+            super().append(entry)
+            self._changed.notify_all()
+
+    def extend(self, entries):
+        with self._changed:
+            super().extend(entries)
+            self._changed.notify_all()
+
+    def wait(self, count=1, timeout=5):
+        """Return whether at least count entries were recorded within timeout."""
+        with self._changed:
+            return self._changed.wait_for(lambda: len(self) >= count, timeout)
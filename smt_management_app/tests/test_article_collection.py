@@ -0,0 +1,111 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from smt_management_app.models import (
+    Article,
+    ArticleCollection,
+    Carrier,
+    StorageSlot,
+)
+from smt_management_app.tests.helpers import create_storage
+from smt_management_app.utils.led_shelf_dispatcher import (
+    LED_shelf_dispatcher,
+    discard_dispatcher,
+)
+
+
+class ArticleCollectionTestCase(TestCase):
+    def setUp(self):
+        discard_dispatcher()
+        for storage_index in range(3):
+            storage = create_storage(f"storage_{storage_index}", slots=4)
+            for slot in storage.storageslot_set.order_by("name"):
+                slot_name = slot.name
+                # article_0 in the first slot of storage_0 and storage_1
+                if slot_name == 1 and storage_index < 2:
+                    article_name = "article_0"
+                elif (storage_index, slot_name) == (2, 3):
+                    article_name = "article_8"
+                else:
+                    article_name = "article_9"
+                article, _ = Article.objects.get_or_create(name=article_name)
+                Carrier.objects.create(
+                    name=f"carrier_{storage_index}_{slot_name}",
+                    article=article,
+                    storage_slot=slot,
+                )
+        # a pick light of another operator
+        StorageSlot.set_led_state(
+            StorageSlot.objects.filter(storage_id="storage_2", name=3), 1
+        )
+
+    def tearDown(self):
+        discard_dispatcher()
+
+    def lit_slots(self):
+        return sorted(
+            StorageSlot.objects.filter(led_state=1).values_list("storage_id", "name")
+        )
+
+    def get(self, url):
+        with mock.patch.object(LED_shelf_dispatcher, "submit", autospec=True) as submit:
+            response = self.client.get(url).json()
+        self.commands = [
+            (call.args[0].storage.name, call.args[1], call.kwargs)
+            for call in submit.call_args_list
+            if call.args[1] != "led_state_changed"
+        ]
+        return response
+
+    def test_confirm_switches_off_the_collection_only(self):
+        response = self.get("/api/collect_carrier_by_article/article_0/")
+        self.assertTrue(response["success"])
+        self.assertEqual(
+            self.lit_slots(),
+            [("storage_0", 1), ("storage_1", 1), ("storage_2", 3)],
+        )
+
+        self.get("/api/collect_carrier_by_article_confirm/carrier_0_1/")
+
+        self.assertEqual(self.lit_slots(), [("storage_2", 3)])
+        # one off command per shelf of the collection, no reset of every shelf
+        self.assertEqual(
+            self.commands,
+            [
+                ("storage_0", "_LED_Off_Control", {"lamps": [1]}),
+                ("storage_1", "_LED_Off_Control", {"lamps": [1]}),
+                ("storage_0", "led_on", {"lamp": 1, "color": "green"}),
+            ],
+        )
+        self.assertFalse(ArticleCollection.objects.exists())
+
+    def test_cancel_keeps_slots_of_other_collections(self):
+        first = self.get("/api/collect_carrier_by_article/article_0/")["collection"]
+        self.get("/api/collect_carrier_by_article/article_0/")
+
+        self.get(
+            f"/api/collect_carrier_by_article_cancel/article_0/?collection={first}"
+        )
+
+        self.assertEqual(self.commands, [])
+        self.assertEqual(len(self.lit_slots()), 3)
+
+        self.get("/api/collect_carrier_by_article_cancel/article_0/")
+
+        self.assertEqual(self.lit_slots(), [("storage_2", 3)])
+        self.assertEqual(len(self.commands), 2)
+
+    def test_selected_slot_belongs_to_the_collection(self):
+        self.get("/api/collect_carrier_by_article/article_9/")
+        self.get("/api/collect_carrier_by_article_select/article_9/carrier_2_2/false/")
+        self.get("/api/collect_carrier_by_article_select/article_9/carrier_2_2/true/")
+        self.get("/api/collect_carrier_by_article_select/article_9/carrier_2_4/false/")
+
+        self.get("/api/collect_carrier_by_article_cancel/article_9/")
+
+        self.assertEqual(self.lit_slots(), [("storage_2", 3)])
+        self.assertEqual(
+            [command for command in self.commands if command[0] == "storage_2"],
+            [("storage_2", "_LED_Off_Control", {"lamps": [1, 2]})],
+        )
@@ -0,0 +1,118 @@
+import json
+from unittest import mock
+
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from smt_management_app.collect_queue import enqueue_carriers, get_collect_queue
+from smt_management_app.models import Article, Carrier, StorageSlot
+from smt_management_app.tests.helpers import create_storage
+from smt_management_app.utils.led_shelf_dispatcher import (
+    LED_shelf_dispatcher,
+    discard_dispatcher,
+    get_dispatcher,
+)
+
+
+class CollectCarriersConfirmBatchTestCase(TransactionTestCase):
+    def setUp(self):
+        discard_dispatcher()
+        self.storage = create_storage(slots=30)
+        article = Article.objects.create(name="article_0")
+        for slot in self.storage.storageslot_set.order_by("name"):
+            Carrier.objects.create(
+                name=f"carrier_{slot.name}", article=article, storage_slot=slot
+            )
+        enqueue_carriers(Carrier.objects.exclude(name="carrier_30"))
+        StorageSlot.set_led_state(StorageSlot.objects.exclude(name=30), 1)
+
+    def tearDown(self):
+        # the worker writes the lighthouse of the storage row
+        self.assertTrue(get_dispatcher(self.storage).wait_idle(timeout=5))
+        discard_dispatcher()
+
+    def confirm_batch(self, carriers):
+        return self.client.post(
+            "/api/collect_carriers_confirm_batch/",
+            json.dumps({"carriers": carriers}),
+            content_type="application/json",
+        ).json()
+
+    def test_batch_confirms_valid_carriers(self):
+        version = get_collect_queue()["queue_version"]
+
+        response = self.client.post(
+            f"/api/collect_carriers_confirm_batch/?since={version}",
+            json.dumps(
+                {
+                    "carriers": [
+                        "carrier_1",
+                        {"carrier": "carrier_2", "slot": "storage_0_2"},
+                        {"carrier": "carrier_3", "slot": "storage_0_4"},
+                        {"carrier": "carrier_5", "storage": "storage_1"},
+                        "carrier_30",
+                        "carrier_1",
+                        "carrier_x",
+                    ]
+                }
+            ),
+            content_type="application/json",
+        ).json()
+
+        self.assertTrue(response["success"])
+        self.assertEqual(
+            response["confirmed"],
+            [
+                {"carrier": "carrier_1", "storage": "storage_0", "slot": "storage_0_1"},
+                {"carrier": "carrier_2", "storage": "storage_0", "slot": "storage_0_2"},
+            ],
+        )
+        self.assertEqual(
+            [item["carrier"] for item in response["rejected"]],
+            ["carrier_3", "carrier_5", "carrier_30", "carrier_1", "carrier_x"],
+        )
+        self.assertEqual(response["queue_delta"]["removed"], ["carrier_1", "carrier_2"])
+        self.assertFalse(
+            Carrier.objects.filter(
+                name__in=["carrier_1", "carrier_2"], storage_slot__isnull=False
+            ).exists()
+        )
+        self.assertEqual(
+            Carrier.objects.get(name="carrier_1").storage_slot_qr_value, None
+        )
+        self.assertEqual(
+            list(
+                StorageSlot.objects.filter(name__in=[1, 2, 3]).values_list(
+                    "led_state", flat=True
+                )
+            ),
+            [0, 0, 1],
+        )
+
+    def test_shelf_flashes_once_and_queries_do_not_grow(self):
+        # no worker commands, a concurrent lighthouse write would make the queue
+        # retry its transaction
+        get_dispatcher(self.storage)
+        with mock.patch.object(LED_shelf_dispatcher, "submit"), mock.patch.object(
+            LED_shelf_dispatcher, "flash_lamps"
+        ) as flash_lamps:
+            with CaptureQueriesContext(connection) as small:
+                self.confirm_batch(["carrier_1", "carrier_2"])
+            with CaptureQueriesContext(connection) as large:
+                self.confirm_batch([f"carrier_{i}" for i in range(3, 23)])
+
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(
+            [call.args for call in flash_lamps.call_args_list],
+            [([1, 2], "green"), (list(range(3, 23)), "green")],
+        )
+
+    def test_rejects_a_body_without_carriers(self):
+        response = self.client.post(
+            "/api/collect_carriers_confirm_batch/",
+            json.dumps({"carrier": "carrier_1"}),
+            content_type="application/json",
+        ).json()
+
+        self.assertFalse(response["success"])
@@ -0,0 +1,111 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from smt_management_app.models import (
+    Article,
+    Board,
+    BoardArticle,
+    Carrier,
+    Job,
+    Storage,
+    StorageSlot,
+)
+from smt_management_app.utils.led_shelf_dispatcher import (
+    LED_shelf_dispatcher,
+    discard_dispatcher,
+    get_dispatcher,
+)
+
+
+class CollectJobTestCase(TestCase):
+    def setUp(self):
+        discard_dispatcher()
+        self.article = Article.objects.create(name="article_0")
+        self.board = Board.objects.create(name="board_0")
+        self.storages = [
+            Storage.objects.create(name=f"storage_{i}", device="Dummy", capacity=50)
+            for i in range(4)
+        ]
+        # warm dispatchers, building one is not part of collecting a job
+        for storage in self.storages:
+            get_dispatcher(storage)
+
+    def tearDown(self):
+        discard_dispatcher()
+
+    def create_job(self, name, carriers):
+        job = Job.objects.create(name=name, board=self.board, count=1, status=1)
+        for i in range(carriers):
+            storage = self.storages[i % 4]
+            slot = StorageSlot.objects.create(
+                name=i // 4 + 1,
+                qr_value=f"{name}_{storage.name}_{i // 4 + 1}",
+                storage=storage,
+            )
+            job.carriers.add(
+                Carrier.objects.create(
+                    name=f"{name}_carrier_{i}", article=self.article, storage_slot=slot
+                )
+            )
+        return job
+
+    def collect(self, job_name):
+        with mock.patch.object(LED_shelf_dispatcher, "submit") as submit:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(f"/api/collect_job/{job_name}/")
+        lamp_maps = [
+            call.kwargs["lights_dict"]["lamps"]
+            for call in submit.call_args_list
+            if call.args[0] == "_LED_On_Control"
+        ]
+        return response.json(), len(queries), lamp_maps
+
+    def test_queries_do_not_grow_with_the_job(self):
+        self.create_job("small", 4)
+        # below the 124 rows a single bulk insert of queue entries takes on sqlite
+        self.create_job("large", 120)
+
+        _, small_queries, _ = self.collect("small")
+        data, large_queries, lamp_maps = self.collect("large")
+
+        self.assertEqual(large_queries, small_queries)
+        self.assertEqual(len(data["picks"]), 120)
+        # one lamp map per shelf
+        self.assertEqual(len(lamp_maps), 4)
+        self.assertEqual(sum(len(lamps) for lamps in lamp_maps), 120)
+        self.assertEqual(
+            StorageSlot.objects.filter(
+                qr_value__startswith="large", led_state=1
+            ).count(),
+            120,
+        )
+        self.assertEqual(
+            Carrier.objects.filter(name__startswith="large", collecting=True).count(),
+            120,
+        )
+
+    def test_lamp_map_contains_combined_slots(self):
+        job = self.create_job("job_0", 1)
+        slot = job.carriers.get().storage_slot
+        StorageSlot.objects.filter(pk=slot.pk).update(related_names=[2, 3])
+
+        data, _, lamp_maps = self.collect("job_0")
+
+        self.assertEqual(lamp_maps, [{1: "blue", 2: "blue", 3: "blue"}])
+        self.assertEqual(data["message"], "1 carriers to be collected.")
+
+    def test_assigning_the_last_article_prepares_the_job(self):
+        job = Job.objects.create(name="job_1", board=self.board, count=1)
+        BoardArticle.objects.create(
+            name="board_0_article_0", board=self.board, article=self.article, count=1
+        )
+        Carrier.objects.create(name="carrier_0", article=self.article)
+
+        with self.assertNumQueries(6):
+            self.client.get("/api/assign_carrier_to_job/job_1/carrier_0/")
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 1)
@@ -0,0 +1,123 @@
+from django.test import TransactionTestCase
+
+from smt_management_app.collect_queue import (
+    dequeue_carriers,
+    enqueue_carriers,
+    get_collect_queue,
+)
+from smt_management_app.models import (
+    Article,
+    Carrier,
+    CollectQueueEntry,
+)
+from smt_management_app.tests.helpers import create_storage
+from smt_management_app.utils.led_shelf_dispatcher import (
+    discard_dispatcher,
+    get_dispatcher,
+)
+
+
+class CollectQueueTestCase(TransactionTestCase):
+
+    def setUp(self):
+        discard_dispatcher()
+        self.storage = create_storage(slots=30)
+        article = Article.objects.create(name="article_0")
+        for slot in self.storage.storageslot_set.order_by("name"):
+            Carrier.objects.create(
+                name=f"carrier_{slot.name}", article=article, storage_slot=slot
+            )
+
+    def tearDown(self):
+        # the worker writes the lighthouse of the storage row
+        self.assertTrue(get_dispatcher(self.storage).wait_idle(timeout=5))
+        discard_dispatcher()
+
+    def test_collect_returns_the_queue_and_its_version(self):
+        response = self.client.get("/api/collect_carrier/carrier_1/?station=line1")
+
+        data = response.json()
+        self.assertTrue(data["success"])
+        self.assertEqual(
+            data["queue"],
+            [{"carrier": "carrier_1", "storage": "storage_0", "slot": "storage_0_1"}],
+        )
+        self.assertEqual(
+            CollectQueueEntry.objects.get(carrier_name="carrier_1").station, "line1"
+        )
+        self.assertTrue(Carrier.objects.get(name="carrier_1").collecting)
+
+        response = self.client.get(
+            f"/api/collect_carrier/carrier_2/?since={data['queue_version']}"
+        )
+        self.assertEqual(
+            response.json()["queue_delta"],
+            {
+                "since": data["queue_version"],
+                "added": [
+                    {
+                        "carrier": "carrier_2",
+                        "storage": "storage_0",
+                        "slot": "storage_0_2",
+                    }
+                ],
+                "removed": [],
+            },
+        )
+
+    def test_delta_size_does_not_grow_with_the_queue(self):
+        enqueue_carriers(Carrier.objects.exclude(name="carrier_30"))
+        version = get_collect_queue()["queue_version"]
+        enqueue_carriers(Carrier.objects.filter(name="carrier_30"))
+        dequeue_carriers(Carrier.objects.filter(name="carrier_1"))
+
+        with self.assertNumQueries(2):
+            delta = get_collect_queue(since=version)["queue_delta"]
+        self.assertEqual([item["carrier"] for item in delta["added"]], ["carrier_30"])
+        self.assertEqual(delta["removed"], ["carrier_1"])
+
+        with self.assertNumQueries(2):
+            queue = get_collect_queue()["queue"]
+        self.assertEqual(len(queue), 29)
+        # queue order is the order the carriers were queued in
+        self.assertEqual(queue[-1]["carrier"], "carrier_30")
+
+    def test_requeued_carrier_goes_to_the_end(self):
+        carriers = list(Carrier.objects.filter(name__in=["carrier_1", "carrier_2"]))
+        enqueue_carriers(carriers)
+        dequeue_carriers(carriers[:1])
+        enqueue_carriers(carriers[:1])
+
+        self.assertEqual(
+            [item["carrier"] for item in get_collect_queue()["queue"]],
+            ["carrier_2", "carrier_1"],
+        )
+        self.assertTrue(carriers[0].collecting)
+
+    def test_confirm_and_cancel_leave_the_queue(self):
+        enqueue_carriers(Carrier.objects.filter(name__in=["carrier_1", "carrier_2"]))
+        version = get_collect_queue()["queue_version"]
+
+        self.client.get("/api/collect_carrier_confirm/carrier_1/storage_0/storage_0_1/")
+        response = self.client.get(
+            f"/api/collect_carrier_cancel/carrier_2/?since={version}"
+        )
+
+        self.assertEqual(
+            response.json()["queue_delta"]["removed"], ["carrier_1", "carrier_2"]
+        )
+        self.assertFalse(Carrier.objects.filter(collecting=True).exists())
+
+    def test_collecting_set_on_the_model_follows_the_queue(self):
+        carrier = Carrier.objects.get(name="carrier_3")
+        carrier.collecting = True
+        carrier.save()
+        version = get_collect_queue()["queue_version"]
+        self.assertEqual(
+            [item["carrier"] for item in get_collect_queue()["queue"]], ["carrier_3"]
+        )
+
+        carrier.delete()
+
+        delta = get_collect_queue(since=version)["queue_delta"]
+        self.assertEqual(delta["removed"], ["carrier_3"])
@@ -0,0 +1,80 @@
+import os
+import subprocess
+import sys
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase
+
+from smt_management_app.models import Storage, StorageSlot
+from smt_management_app.utils import led_shelf_dispatcher
+from smt_management_app.utils.led_shelf_dispatcher import (
+    ShelfBackendUnavailable,
+    discard_dispatcher,
+    get_dispatcher,
+    load_device_handler,
+)
+
+
+class DeviceBackendTestCase(TestCase):
+    def setUp(self):
+        discard_dispatcher()
+        self.storage = Storage.objects.create(
+            name="sophia", device="Sophia", capacity=10, ip_address="127.0.0.1"
+        )
+        StorageSlot.objects.create(name=1, qr_value="sophia_1", storage=self.storage)
+        # a backend that is missing on this machine
+        patches = [
+            mock.patch.dict(
+                led_shelf_dispatcher.DEVICE_HANDLERS,
+                {"Sophia": "smt_management_app.utils.shelf_handlers.missing.Handler"},
+            ),
+            mock.patch.dict(led_shelf_dispatcher._handler_classes, clear=True),
+            mock.patch.dict(led_shelf_dispatcher._handler_errors, clear=True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        discard_dispatcher()
+
+    def test_app_import_does_not_load_device_backends(self):
+        code = (
+            "import sys, django; django.setup();"
+            "import smt_management_app.urls, smt_management_app.storing,"
+            " smt_management_app.collecting;"
+            "print(sorted(m for m in ('clr', 'Ptl', 'serial') if m in sys.modules))"
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE="atn_smt_management.settings")
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+        self.assertEqual(result.stdout.strip().splitlines()[-1], "[]", result.stderr)
+
+    def test_missing_backend_names_the_storage(self):
+        with self.assertRaisesMessage(ShelfBackendUnavailable, "Storage sophia:"):
+            get_dispatcher(self.storage)
+        # the failed import is not retried
+        with mock.patch.object(led_shelf_dispatcher, "import_string") as import_string:
+            with self.assertRaises(ShelfBackendUnavailable):
+                load_device_handler("Sophia")
+        import_string.assert_not_called()
+
+    def test_other_storages_keep_working(self):
+        dummy = Storage.objects.create(name="dummy", device="Dummy", capacity=10)
+        with self.assertRaises(ShelfBackendUnavailable):
+            get_dispatcher(self.storage)
+        self.assertIsNotNone(get_dispatcher(dummy))
+
+    def test_request_gets_a_json_error(self):
+        response = self.client.get("/api/change_slot_color/sophia/1/red/")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()["success"])
+        self.assertIn("Storage sophia:", response.json()["message"])
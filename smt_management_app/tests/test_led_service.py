@@ -0,0 +1,163 @@
+import os
+import threading
+import unittest
+from unittest import mock
+
+from django.test import TransactionTestCase, override_settings
+
+from smt_management_app.models import Article, Carrier, Storage, StorageSlot
+from smt_management_app.tests.helpers import Recorder
+from smt_management_app.utils import led_shelf_dispatcher
+from smt_management_app.utils.led_service import (
+    RemoteDispatcher,
+    close_clients,
+    make_server,
+)
+from smt_management_app.utils.led_shelf_dispatcher import (
+    ShelfBackendUnavailable,
+    discard_local_dispatcher,
+    get_dispatcher,
+    get_local_dispatcher,
+)
+
+
+class LEDServiceTestCase(TransactionTestCase):
+    """Service and web side share this process, the proxy talks to it over TCP."""
+
+    def setUp(self):
+        discard_local_dispatcher()
+        self.server = make_server("127.0.0.1:0")
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        settings = override_settings(LED_SERVICE_ADDRESS=self.server.address)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(led_shelf_dispatcher._remote_dispatchers.clear)
+
+        self.storage = Storage.objects.create(name="dummy", device="Dummy", capacity=10)
+        self.executed = Recorder()
+
+    def tearDown(self):
+        close_clients()
+        self.server.shutdown()
+        self.server.server_close()
+        discard_local_dispatcher()
+
+    def record(self, dispatcher):
+        dispatcher.led_on = lambda lamp, color: self.executed.append((lamp, color))
+        dispatcher.led_off = lambda lamp: self.executed.append((lamp, "off"))
+        dispatcher._LED_On_Control = lambda lights_dict: self.executed.append(
+            lights_dict
+        )
+        dispatcher._LED_Off_Control = lambda lamps: self.executed.append((lamps, "off"))
+
+    def test_commands_run_in_the_service(self):
+        remote = get_dispatcher(self.storage)
+        self.assertIsInstance(remote, RemoteDispatcher)
+        self.record(get_local_dispatcher(self.storage))
+
+        self.assertTrue(remote.submit("led_on", lamp=1, color="blue"))
+        self.assertTrue(
+            remote.submit("_LED_On_Control", lights_dict={"lamps": {2: "red"}})
+        )
+        self.assertTrue(remote.wait_idle(timeout=5))
+
+        self.assertEqual(self.executed, [(1, "blue"), {"lamps": {2: "red"}}])
+        self.assertIs(get_dispatcher(self.storage), remote)
+
+    def test_delayed_actions_are_cancellable(self):
+        remote = get_dispatcher(self.storage)
+        self.record(get_local_dispatcher(self.storage))
+
+        remote.submit_later(0.1, "led_off", lamp=1)
+        remote.submit_later(0.1, "led_off", lamp=2)
+        remote.cancel_pending(2)
+        # lamp 2 would have expired in the same tick and been merged with lamp 1
+        self.assertTrue(self.executed.wait())
+        self.assertTrue(remote.wait_idle(timeout=5))
+
+        self.assertEqual(self.executed, [(1, "off")])
+
+    def test_changed_storage_rebuilds_the_service_dispatcher(self):
+        remote = get_dispatcher(self.storage)
+        local = get_local_dispatcher(self.storage)
+
+        self.storage.capacity = 20
+        self.storage.save()
+        rebuilt = get_dispatcher(self.storage)
+
+        self.assertIsNot(rebuilt, remote)
+        self.assertIsNot(get_local_dispatcher(self.storage), local)
+        self.assertEqual(get_local_dispatcher(self.storage).fingerprint[1], 20)
+
+    def test_health_and_missing_backend(self):
+        get_dispatcher(self.storage)
+        sophia = Storage.objects.create(name="sophia", device="Sophia", capacity=10)
+
+        with mock.patch.dict(
+            led_shelf_dispatcher.DEVICE_HANDLERS,
+            {"Sophia": "smt_management_app.utils.shelf_handlers.missing.Handler"},
+        ), mock.patch.dict(
+            led_shelf_dispatcher._handler_classes, clear=True
+        ), mock.patch.dict(
+            led_shelf_dispatcher._handler_errors, clear=True
+        ):
+            with self.assertRaises(ShelfBackendUnavailable):
+                get_dispatcher(sophia)
+
+        response = self.client.get("/api/health/")
+        self.assertEqual(response.json()["storages"]["dummy"]["state"], "ready")
+        self.assertEqual(get_dispatcher(self.storage).health["device"], "Dummy")
+
+    def test_unreachable_service_drops_commands(self):
+        remote = get_dispatcher(self.storage)
+        close_clients()
+        self.server.shutdown()
+        self.server.server_close()
+
+        self.assertFalse(remote.submit("led_on", lamp=1, color="blue"))
+
+    def test_stopped_service_does_not_fail_requests(self):
+        close_clients()
+        self.server.shutdown()
+        self.server.server_close()
+        Article.objects.create(name="article_0")
+        Carrier.objects.create(
+            name="carrier_0", article=Article("article_0"), delivered=True
+        )
+        StorageSlot.objects.create(name=1, qr_value="dummy_1", storage=self.storage)
+
+        remote = get_dispatcher(self.storage)
+        remote.cancel_pending(1)
+        self.assertFalse(remote.wait_idle(timeout=1))
+
+        response = self.client.get("/api/store_carrier/carrier_0/dummy/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["success"])
+
+    @unittest.skipUnless(hasattr(os, "openpty"), "fake serial device needs a pty")
+    def test_ptl_serial_shelf_behind_the_service(self):
+        from smt_management_app.utils.shelf_handlers.fake_ptl_serial import (
+            FakePTLSerial,
+        )
+        from smt_management_app.utils.shelf_handlers.ptl_serial_handler import (
+            close_serial_transports,
+        )
+
+        device = FakePTLSerial().start()
+        self.addCleanup(device.stop)
+        self.addCleanup(close_serial_transports)
+        storage = Storage.objects.create(
+            name="ptl",
+            device="ATNPTL",
+            capacity=10,
+            COM_address=device.port,
+            ATNPTL_shelf_id=1,
+            ATNPTL_transport="serial",
+        )
+
+        remote = get_dispatcher(storage)
+        remote.submit("led_on", lamp=1001, color="blue")
+        self.assertTrue(remote.wait_idle(timeout=5))
+
+        self.assertEqual(len(device.frames), 1)
+        self.assertEqual(device.frames[0][7:10], [0, 0, 255])
@@ -0,0 +1,327 @@
+import threading
+
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from smt_management_app.models import Storage
+from smt_management_app.tests.helpers import Recorder, create_storage
+from smt_management_app.utils import led_shelf_dispatcher
+from smt_management_app.utils.led_scheduler import DelayedEffect, TimerWheel
+from smt_management_app.utils.led_shelf_dispatcher import (
+    discard_dispatcher,
+    get_dispatcher,
+)
+
+
+class DispatcherRegistryTestCase(TestCase):
+
+    def setUp(self):
+        discard_dispatcher()
+        self.storage = create_storage()
+
+    def tearDown(self):
+        discard_dispatcher()
+
+    def test_dispatcher_is_reused(self):
+        first = get_dispatcher(Storage.objects.get(name="storage_0"))
+        second = get_dispatcher(Storage.objects.get(name="storage_0"))
+        self.assertIs(first, second)
+
+    def test_dispatcher_gets_fresh_storage_row(self):
+        dispatcher = get_dispatcher(self.storage)
+        storage = Storage.objects.get(name="storage_0")
+        self.assertIs(get_dispatcher(storage), dispatcher)
+        self.assertIs(dispatcher.storage, storage)
+
+    def test_dispatcher_rebuilt_on_device_change(self):
+        first = get_dispatcher(self.storage)
+        self.storage.ip_address = "127.0.0.1"
+        self.storage.save()
+        second = get_dispatcher(Storage.objects.get(name="storage_0"))
+        self.assertIsNot(first, second)
+
+    def test_dispatcher_dropped_on_storage_delete(self):
+        first = get_dispatcher(self.storage)
+        self.storage.delete()
+        storage = Storage.objects.create(name="storage_0", device="Dummy", capacity=10)
+        self.assertIsNot(get_dispatcher(storage), first)
+
+    def test_dispatcher_dropped_on_queryset_delete(self):
+        first = get_dispatcher(self.storage)
+        Storage.objects.filter(name="storage_0").delete()
+        storage = Storage.objects.create(name="storage_0", device="Dummy", capacity=10)
+        self.assertIsNot(get_dispatcher(storage), first)
+
+
+class DispatcherWorkerTestCase(TestCase):
+
+    def setUp(self):
+        discard_dispatcher()
+        self.storage = Storage.objects.create(
+            name="storage_0", device="Dummy", capacity=10
+        )
+        self.dispatcher = get_dispatcher(self.storage)
+        self.executed = Recorder()
+        # record instead of printing so the order of execution can be checked
+        self.dispatcher.led_on = lambda lamp, color: self.executed.append(
+            ("on", lamp, color)
+        )
+        self.dispatcher.led_off = lambda lamp: self.executed.append(("off", lamp))
+        self.dispatcher._LED_Off_Control = lambda lamps: self.executed.append(
+            ("off", lamps)
+        )
+
+    def tearDown(self):
+        discard_dispatcher()
+
+    def test_commands_run_in_submission_order(self):
+        for lamp in range(1, 11):
+            self.dispatcher.submit("led_on", lamp=lamp, color="blue")
+            self.dispatcher.submit("led_off", lamp=lamp)
+        self.assertTrue(self.dispatcher.wait_idle(timeout=5))
+        expected = []
+        for lamp in range(1, 11):
+            expected += [("on", lamp, "blue"), ("off", lamp)]
+        self.assertEqual(self.executed, expected)
+
+    def test_delayed_action_runs_after_delay(self):
+        self.dispatcher.submit("led_on", lamp=1, color="green")
+        self.dispatcher.submit_later(0.1, "led_off", lamp=1)
+        self.assertTrue(self.dispatcher.wait_idle(timeout=5))
+        self.assertEqual(self.executed, [("on", 1, "green")])
+        self.assertTrue(self.executed.wait(2))
+        self.assertEqual(self.executed, [("on", 1, "green"), ("off", 1)])
+
+    def test_later_command_cancels_pending_delayed_action(self):
+        self.dispatcher.submit("led_on", lamp=1, color="green")
+        self.dispatcher.submit_later(0.1, "led_off", lamp=1)
+        # expires together with the pending off, which would run before it
+        self.dispatcher.submit_later(0.1, "led_on", lamp=2, color="blue")
+        # a later request turns the lamp on again, the pending off must not fire
+        self.dispatcher.submit("led_on", lamp=1, color="yellow")
+        self.assertTrue(self.executed.wait(3))
+        self.assertTrue(self.dispatcher.wait_idle(timeout=5))
+        self.assertEqual(
+            self.executed,
+            [("on", 1, "green"), ("on", 1, "yellow"), ("on", 2, "blue")],
+        )
+
+    def test_cancel_pending(self):
+        self.dispatcher.submit_later(0.1, "led_off", lamp=1)
+        self.dispatcher.submit_later(0.1, "led_off", lamp=2)
+        self.dispatcher.cancel_pending(1)
+        # lamp 1 would have expired in the same tick and been merged with lamp 2
+        self.assertTrue(self.executed.wait())
+        self.assertTrue(self.dispatcher.wait_idle(timeout=5))
+        self.assertEqual(self.executed, [("off", 2)])
+
+    def test_flash(self):
+        self.dispatcher.flash(1, "red", duration=0.1)
+        self.assertTrue(self.dispatcher.wait_idle(timeout=5))
+        self.assertEqual(self.executed, [("on", 1, "red")])
+        self.assertTrue(self.executed.wait(2))
+        self.assertEqual(self.executed, [("on", 1, "red"), ("off", 1)])
+
+    def test_effects_expiring_together_are_merged(self):
+        self.dispatcher.run_effects(
+            [
+                DelayedEffect(self.dispatcher, "led_off", {"lamp": lamp}, [lamp])
+                for lamp in (1, 2, 3)
+            ]
+        )
+        self.assertTrue(self.dispatcher.wait_idle(timeout=5))
+        self.assertEqual(self.executed, [("off", [1, 2, 3])])
+
+    def test_delayed_actions_share_one_thread(self):
+        other = get_dispatcher(
+            Storage.objects.create(name="storage_1", device="Dummy", capacity=10)
+        )
+        self.dispatcher._LED_Off_Control = lambda lamps: self.executed.extend(
+            ("off", lamp) for lamp in lamps
+        )
+        for lamp in range(1, 51):
+            self.dispatcher.submit_later(0.1, "led_off", lamp=lamp)
+            other.submit_later(0.1, "led_off", lamp=lamp)
+        wheels = [t for t in threading.enumerate() if t.name == "led-timer-wheel"]
+        self.assertEqual(len(wheels), 1)
+        self.assertTrue(self.executed.wait(50))
+        self.assertEqual(
+            sorted(self.executed), [("off", lamp) for lamp in range(1, 51)]
+        )
+
+    def test_full_queue_applies_backpressure(self):
+        blocker = threading.Event()
+        self.dispatcher.led_on = lambda lamp, color: blocker.wait(5)
+        self.dispatcher.SUBMIT_TIMEOUT = 0.1
+        self.dispatcher.submit("led_on", lamp=1, color="blue")
+        accepted = [
+            self.dispatcher.submit("led_off", lamp=lamp)
+            for lamp in range(self.dispatcher.COMMAND_QUEUE_SIZE + 1)
+        ]
+        blocker.set()
+        self.assertFalse(all(accepted))
+        self.assertTrue(self.dispatcher.wait_idle(timeout=5))
+
+    def test_failing_command_does_not_stop_worker(self):
+        with self.assertLogs(led_shelf_dispatcher.logger, "ERROR") as logs:
+            self.dispatcher.submit("does_not_exist")
+            self.dispatcher.submit("led_off", lamp=1)
+            self.assertTrue(self.dispatcher.wait_idle(timeout=5))
+        self.assertEqual(self.executed, [("off", 1)])
+        self.assertIn("does_not_exist", logs.output[0])
+
+
+class RecordingNeoLightHandler:
+    """Stands in for NeoLightAPI and records the requests it would send."""
+
+    def __init__(self):
+        self.requests = []
+
+    def _LED_On_Control(self, lights_dict):
+        self.requests.append(("open", lights_dict))
+
+    def _LED_Off_Control(self, lamps=[], statusA=False, statusB=False):
+        self.requests.append(("close", sorted(lamps), statusA, statusB))
+
+    def led_on(self, lamp, color):
+        self._LED_On_Control({"lamps": {int(lamp): color}})
+
+    def led_off(self, lamp):
+        self._LED_Off_Control([int(lamp)])
+
+
+class NeoLightCoalescingTestCase(TransactionTestCase):
+    # the shelf worker looks up combined slots from its own thread and db connection
+
+    def setUp(self):
+        discard_dispatcher()
+        self.storage = create_storage()
+        self.dispatcher = get_dispatcher(self.storage)
+        self.dispatcher.device_type = "NeoLight"
+        self.dispatcher.device_handler = RecordingNeoLightHandler()
+        self.dispatcher.enable_working_lights_based_on_led_state = lambda: None
+        # make sure all commands of a test land in the same window
+        self.dispatcher.COALESCE_WINDOW = 0.5
+
+    def tearDown(self):
+        discard_dispatcher()
+
+    def test_commands_are_merged_into_one_open_and_one_close(self):
+        for lamp in range(1, 9):
+            self.dispatcher.submit("led_on", lamp=lamp, color="yellow")
+        self.dispatcher.submit("led_off", lamp=9)
+        self.dispatcher.submit(
+            "_LED_On_Control", lights_dict={"lamps": {10: "blue", 1: "green"}}
+        )
+        self.assertTrue(self.dispatcher.wait_idle(timeout=5))
+        expected_lamps = {lamp: "yellow" for lamp in range(2, 9)}
+        expected_lamps.update({1: "green", 10: "blue"})
+        self.assertEqual(
+            self.dispatcher.device_handler.requests,
+            [
+                ("open", {"lamps": expected_lamps}),
+                ("close", [9], False, False),
+            ],
+        )
+
+    def test_last_writer_wins_per_lamp(self):
+        self.dispatcher.submit("led_on", lamp=1, color="yellow")
+        self.dispatcher.submit("led_off", lamp=1)
+        self.dispatcher.submit("led_off", lamp=2)
+        self.dispatcher.submit("led_on", lamp=2, color="red")
+        self.assertTrue(self.dispatcher.wait_idle(timeout=5))
+        self.assertEqual(
+            self.dispatcher.device_handler.requests,
+            [
+                ("open", {"lamps": {2: "red"}}),
+                ("close", [1], False, False),
+            ],
+        )
+
+    def test_non_coalescable_command_ends_the_batch(self):
+        executed = []
+        self.dispatcher.reset_leds = lambda: executed.append(
+            list(self.dispatcher.device_handler.requests)
+        )
+        self.dispatcher.submit("led_on", lamp=1, color="yellow")
+        self.dispatcher.submit("led_on", lamp=2, color="yellow")
+        self.dispatcher.submit("reset_leds")
+        self.dispatcher.submit("led_on", lamp=3, color="blue")
+        self.assertTrue(self.dispatcher.wait_idle(timeout=5))
+        # the reset ran after the merged request for lamps 1 and 2, lamp 3 after the reset
+        self.assertEqual(executed, [[("open", {"lamps": {1: "yellow", 2: "yellow"}})]])
+        self.assertEqual(
+            self.dispatcher.device_handler.requests[-1],
+            ("open", {"lamps": {3: "blue"}}),
+        )
+
+
+class LEDTestCycleTestCase(TransactionTestCase):
+    # test_leds reads the slots from the worker thread and db connection
+
+    def setUp(self):
+        discard_dispatcher()
+        self.storage = create_storage()
+        self.dispatcher = get_dispatcher(self.storage)
+        self.executed = []
+        self.finished = threading.Event()
+        self.dispatcher.led_on = lambda lamp, color: self.executed.append(
+            ("on", lamp, color)
+        )
+        self.dispatcher._test_leds_on = lambda lamps, color: self.executed.append(
+            (color, len(lamps))
+        )
+        self.dispatcher._test_leds_off = lambda lamps: self.executed.append(
+            ("off", len(lamps))
+        )
+        self.dispatcher.enable_working_lights_based_on_led_state = lambda: None
+        self.dispatcher._reconcile = self.finished.set
+        self.dispatcher.TEST_LEDS_CYCLES = 1
+        self.dispatcher.TEST_LEDS_ON_TIME = 0.2
+
+    def tearDown(self):
+        discard_dispatcher()
+
+    def test_cycle_does_not_block_the_worker(self):
+        self.dispatcher.submit("test_leds")
+        self.dispatcher.submit("led_on", lamp=1, color="blue")
+
+        self.assertTrue(self.finished.wait(timeout=5))
+        self.assertEqual(
+            self.executed,
+            [
+                ("red", 10),
+                # served while the test colour is on, not after the whole cycle
+                ("on", 1, "blue"),
+                ("off", 10),
+                ("green", 10),
+                ("off", 10),
+                ("yellow", 10),
+                ("off", 10),
+            ],
+        )
+
+
+class TimerWheelTestCase(SimpleTestCase):
+    def setUp(self):
+        self.wheel = TimerWheel(tick=0.01, slots=4)
+        self.fired = Recorder()
+
+    def run_effects(self, effects):
+        self.fired.extend(effect.kwargs["lamp"] for effect in effects)
+
+    def test_delay_longer_than_one_revolution(self):
+        self.wheel.schedule(self, 0.15, "led_off", {"lamp": 1}, [1])
+        # lamp 1 passes its bucket before lamp 2 is due and must not fire early
+        self.wheel.schedule(self, 0.07, "led_off", {"lamp": 2}, [2])
+        self.assertTrue(self.fired.wait())
+        self.assertEqual(self.fired, [2])
+        self.assertTrue(self.fired.wait(2))
+        self.assertEqual(self.fired, [2, 1])
+
+    def test_cancel_per_lamp(self):
+        self.wheel.schedule(self, 0.05, "led_off", {"lamp": 1}, [1])
+        self.wheel.schedule(self, 0.05, "led_off", {"lamp": 2}, [2])
+        self.wheel.cancel(self, 1)
+        # both expire in the same tick and would be fired together
+        self.assertTrue(self.fired.wait())
+        self.assertEqual(self.fired, [2])
@@ -0,0 +1,68 @@
+from django.test import TransactionTestCase
+
+from smt_management_app.models import (
+    Article,
+    Carrier,
+    StorageSlot,
+    group_storage_slots,
+)
+from smt_management_app.tests.helpers import create_storage
+from smt_management_app.utils.led_shelf_dispatcher import (
+    discard_dispatcher,
+    get_dispatcher,
+)
+
+
+class LedStateTestCase(TransactionTestCase):
+
+    def setUp(self):
+        discard_dispatcher()
+        self.storage = create_storage(slots=6)
+        group_storage_slots(list(StorageSlot.objects.filter(name__in=[1, 2])))
+        self.article = Article.objects.create(name="article_0")
+
+    def tearDown(self):
+        # the worker writes the lighthouse of the storage row
+        self.assertTrue(get_dispatcher(self.storage).wait_idle(timeout=5))
+        discard_dispatcher()
+
+    def slot(self, slot_name):
+        return StorageSlot.objects.get(storage=self.storage, name=slot_name)
+
+    def test_set_led_state_is_one_update(self):
+        slots = [self.slot(1), self.slot(3)]
+
+        # a combined slot would run its validation queries on save()
+        with self.assertNumQueries(1):
+            self.assertEqual(StorageSlot.set_led_state(slots, 1), 2)
+
+        self.assertEqual(slots[0].led_state, 1)
+        self.assertEqual(
+            list(
+                StorageSlot.objects.filter(led_state=1)
+                .order_by("name")
+                .values_list("name", flat=True)
+            ),
+            [1, 3],
+        )
+        # the changed slots are read for the lighthouse counters of the dispatchers
+        with self.assertNumQueries(2):
+            StorageSlot.set_led_state(StorageSlot.objects.all(), 0)
+        self.assertFalse(StorageSlot.objects.filter(led_state=1).exists())
+
+    def test_confirm_leaves_slot_deselected(self):
+        slot = self.slot(1)
+        carrier = Carrier.objects.create(
+            name="carrier_0",
+            article=self.article,
+            storage_slot=slot,
+            collecting=True,
+        )
+        StorageSlot.set_led_state([slot], 1)
+
+        response = self.client.get(
+            f"/api/collect_carrier_confirm/{carrier.name}/storage_0/storage_0_1/"
+        )
+
+        self.assertTrue(response.json()["success"])
+        self.assertEqual(self.slot(1).led_state, 0)
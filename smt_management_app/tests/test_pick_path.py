@@ -0,0 +1,153 @@
+import json
+import random
+
+from django.test import SimpleTestCase, TransactionTestCase
+
+from smt_management_app.models import (
+    Article,
+    Board,
+    Carrier,
+    Job,
+    Storage,
+    StorageSlot,
+)
+from smt_management_app.pick_path import (
+    SlotCoordinates,
+    order_picks,
+    path_length,
+    slot_coordinates,
+)
+from smt_management_app.utils.led_shelf_dispatcher import (
+    discard_dispatcher,
+    get_dispatcher,
+)
+
+
+class PickPathTestCase(SimpleTestCase):
+    def test_slot_coordinates(self):
+        self.assertEqual(slot_coordinates(17, "A1-017"), SlotCoordinates(0, 1, 17))
+        self.assertEqual(slot_coordinates(1, "L1607B3042"), SlotCoordinates(1, 3, 42))
+        self.assertEqual(
+            slot_coordinates(105, "002-06-105"), SlotCoordinates(0, 6, 105)
+        )
+        self.assertEqual(slot_coordinates(5010, "1010"), SlotCoordinates(1, 1, 10))
+        self.assertEqual(slot_coordinates(3, None), SlotCoordinates(0, 0, 3))
+
+    def test_picks_follow_the_s_shaped_walk(self):
+        picks = [
+            SlotCoordinates(1, 1, 5),
+            SlotCoordinates(0, 2, 30),
+            SlotCoordinates(1, 2, 40),
+            SlotCoordinates(0, 1, 10),
+            SlotCoordinates(0, 1, 30),
+        ]
+
+        ordered = order_picks((pick, pick) for pick in picks)
+
+        self.assertEqual(
+            ordered,
+            [
+                SlotCoordinates(0, 1, 10),
+                SlotCoordinates(0, 1, 30),
+                SlotCoordinates(0, 2, 30),
+                SlotCoordinates(1, 2, 40),
+                SlotCoordinates(1, 1, 5),
+            ],
+        )
+        # along side 0 to 30, around the end (50) to 40 on side 1, back to 5 and
+        # around the near end to the start
+        self.assertEqual(path_length(ordered, 50), 30 + 30 + 35 + 5)
+
+    def test_single_side_is_walked_forward(self):
+        picks = [SlotCoordinates(1, 0, 9), SlotCoordinates(1, 0, 2)]
+        ordered = order_picks((pick, pick) for pick in picks)
+        self.assertEqual(ordered, picks[::-1])
+
+    def test_ordered_path_is_shorter(self):
+        rng = random.Random(1)
+        shelf = [
+            slot_coordinates(row * 200 + position, f"002-{row:02}-{position:03}")
+            for row in range(1, 8)
+            for position in range(1, 201)
+        ]
+        picks = rng.sample(shelf, 30)
+
+        ordered = order_picks((pick, pick) for pick in picks)
+
+        self.assertLess(path_length(ordered, 200), path_length(picks, 200) / 2)
+
+
+class ProgressivePickingTestCase(TransactionTestCase):
+    def setUp(self):
+        discard_dispatcher()
+        self.storage = Storage.objects.create(
+            name="storage_0", device="Dummy", capacity=10
+        )
+        article = Article.objects.create(name="article_0")
+        self.job = Job.objects.create(
+            name="job_0",
+            board=Board.objects.create(name="board_0"),
+            count=1,
+            status=1,
+        )
+        # created in reverse order of the walk
+        for slot_name in (9, 7, 5, 2):
+            slot = StorageSlot.objects.create(
+                name=slot_name,
+                qr_value=f"002-01-{slot_name:03}",
+                storage=self.storage,
+            )
+            self.job.carriers.add(
+                Carrier.objects.create(
+                    name=f"carrier_{slot_name}", article=article, storage_slot=slot
+                )
+            )
+
+    def tearDown(self):
+        discard_dispatcher()
+
+    def lit_slots(self):
+        return list(
+            StorageSlot.objects.filter(led_state=1)
+            .order_by("name")
+            .values_list("name", flat=True)
+        )
+
+    def test_job_lights_the_next_picks(self):
+        response = self.client.get("/api/collect_job/job_0/?next=2")
+
+        self.assertEqual(
+            [pick["carrier"] for pick in response.json()["picks"]],
+            ["carrier_2", "carrier_5", "carrier_7", "carrier_9"],
+        )
+        self.assertEqual(self.lit_slots(), [2, 5])
+
+        self.client.get("/api/collect_carrier_confirm/carrier_2/storage_0/002-01-002/")
+
+        self.assertEqual(self.lit_slots(), [5, 7])
+        # the worker writes the lighthouse of the storage row
+        self.assertTrue(get_dispatcher(self.storage).wait_idle(timeout=5))
+
+    def test_without_next_confirm_lights_no_pick(self):
+        self.client.get("/api/collect_job/job_0/")
+        # e.g. a reset of the shelf switched the picks off
+        StorageSlot.set_led_state(StorageSlot.objects.all(), 0)
+
+        self.client.get("/api/collect_carrier_confirm/carrier_2/storage_0/002-01-002/")
+        self.client.get("/api/collect_carrier_cancel/carrier_5/")
+
+        self.assertEqual(self.lit_slots(), [])
+        self.assertTrue(get_dispatcher(self.storage).wait_idle(timeout=5))
+
+    def test_batch_confirm_lights_a_next_pick_per_carrier(self):
+        self.client.get("/api/collect_job/job_0/?next=2")
+
+        self.client.post(
+            "/api/collect_carriers_confirm_batch/",
+            json.dumps({"carriers": ["carrier_2", "carrier_5"]}),
+            content_type="application/json",
+        )
+
+        self.assertEqual(self.lit_slots(), [7, 9])
+        # the worker writes the lighthouse of the storage row
+        self.assertTrue(get_dispatcher(self.storage).wait_idle(timeout=5))
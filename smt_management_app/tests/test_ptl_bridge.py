@@ -0,0 +1,121 @@
+import os
+import threading
+import unittest
+
+from django.test import SimpleTestCase
+
+from smt_management_app.utils.shelf_handlers.PTL_handler import PTL_API
+from smt_management_app.utils.shelf_handlers.ptl_bridge import (
+    SerialBridge,
+    match_acks,
+)
+from smt_management_app.utils.shelf_handlers.transport import close_transports
+
+
+@unittest.skipUnless(hasattr(os, "openpty"), "fake serial device needs a pty")
+class PTLBridgeTestCase(SimpleTestCase):
+    def setUp(self):
+        from smt_management_app.utils.shelf_handlers.fake_ptl_serial import (
+            FakePTLSerial,
+        )
+        from smt_management_app.utils.shelf_handlers.ptl_bridge import make_server
+
+        self.device = FakePTLSerial().start()
+        self.server = make_server(port=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api = PTL_API(
+            port=self.device.port,
+            flask_url=f"http://127.0.0.1:{self.server.server_address[1]}",
+        )
+
+    def tearDown(self):
+        close_transports()
+        self.server.shutdown()
+        self.server.bridge.close()
+        self.server.server_close()
+        self.device.stop()
+
+    def lamps(self, count):
+        codes = [row * 1000 + led for row in range(1, 9) for led in range(1, 51)]
+        colors = ["red", "green", "blue", "yellow"]
+        return {code: colors[i % 4] for i, code in enumerate(codes[:count])}
+
+    def test_batch_sends_the_same_frames_as_single_commands(self):
+        lamps = self.lamps(20)
+        for lamp, color in lamps.items():
+            self.api.led_on(shelf=1, lamp=lamp, color=color)
+        single = list(self.device.frames)
+        self.device.frames.clear()
+
+        acks = self.api.leds_on(shelf=1, lamps=lamps)
+
+        self.assertEqual(self.device.frames, single)
+        self.assertEqual(acks, [[2, 1, 1, 11, 3]] * 20)
+
+    def test_batch_of_400_lamps_gets_all_acks(self):
+        acks = self.api.leds_on(shelf=1, lamps=self.lamps(400))
+
+        self.assertEqual(len(self.device.frames), 400)
+        self.assertEqual(len(acks), 400)
+        self.assertNotIn(None, acks)
+
+    def test_leds_off(self):
+        self.api.leds_off(shelf=2, lamps=[1001, "2002"])
+
+        self.assertEqual([frame[2:4] for frame in self.device.frames], [[2, 21]] * 2)
+        self.assertEqual([frame[4] for frame in self.device.frames], [1, 2])
+
+    def test_falls_back_to_single_commands(self):
+        self.api.batch_supported = False
+
+        acks = self.api.leds_on(shelf=1, lamps=self.lamps(5))
+
+        self.assertEqual(len(self.device.frames), 5)
+        self.assertEqual(len(acks), 5)
+
+
+class ScriptedSerial:
+    """Serial port that answers reads from a fixed byte string."""
+
+    is_open = True
+
+    def __init__(self, replies):
+        self.replies = bytearray(replies)
+
+    def write(self, data):
+        return len(data)
+
+    def read(self, size):
+        data = bytes(self.replies[:size])
+        del self.replies[:size]
+        return data
+
+
+class SerialBridgeAckTestCase(SimpleTestCase):
+    def test_acks_are_matched_by_controller_and_command(self):
+        commands = [
+            [2, 1, 1, 11, 1, 0, 1, 255, 0, 0, 0, 0],
+            [2, 1, 1, 21, 1, 0, 2, 0, 0, 0, 0, 0],
+            [2, 1, 2, 11, 1, 0, 3, 0, 255, 0, 0, 0],
+        ]
+        bridge = SerialBridge()
+        # no ack for the first frame, line noise before the last ack
+        bridge.serial = ScriptedSerial(bytes([2, 1, 1, 21, 3, 0, 2, 1, 2, 11, 3]))
+
+        written, acks = bridge.send_commands(commands)
+
+        self.assertEqual(written, 36)
+        self.assertEqual(acks, [None, [2, 1, 1, 21, 3], [2, 1, 2, 11, 3]])
+
+    def test_skipped_frame_of_identical_echoes_acks_none_of_them(self):
+        commands = [[2, 1, 1, 11, 1, 0, lamp, 0, 0, 255, 0, 0] for lamp in (1, 2, 3)]
+        ack = [2, 1, 1, 11, 3]
+        other = [2, 1, 1, 21, 1, 0, 4, 0, 0, 0, 0, 0]
+
+        # the second frame was skipped, which two frames the acks answer is unknown
+        self.assertEqual(match_acks(commands, [ack, ack]), [None, None, None])
+        self.assertEqual(
+            match_acks(commands + [other], [ack, ack, [2, 1, 1, 21, 3]]),
+            [None, None, None, [2, 1, 1, 21, 3]],
+        )
+        self.assertEqual(match_acks(commands, [ack] * 3), [ack] * 3)
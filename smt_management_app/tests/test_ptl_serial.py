@@ -0,0 +1,109 @@
+import os
+import time
+import unittest
+
+from django.test import TestCase
+
+from smt_management_app.models import Storage
+from smt_management_app.utils.led_shelf_dispatcher import (
+    discard_dispatcher,
+    get_dispatcher,
+)
+from smt_management_app.utils.shelf_handlers.ptl_serial_handler import (
+    PTL_SerialAPI,
+    close_serial_transports,
+)
+
+
+@unittest.skipUnless(hasattr(os, "openpty"), "fake serial device needs a pty")
+class PTLSerialTestCase(TestCase):
+    def setUp(self):
+        from smt_management_app.utils.shelf_handlers.fake_ptl_serial import (
+            FakePTLSerial,
+        )
+
+        self.device = FakePTLSerial().start()
+        self.api = PTL_SerialAPI(port=self.device.port)
+        self.api.transport.ack_timeout = 0.2
+
+    def tearDown(self):
+        discard_dispatcher()
+        close_serial_transports()
+        self.device.stop()
+
+    def lamps(self, count):
+        codes = [row * 1000 + led for row in range(1, 9) for led in range(1, 51)]
+        return {code: "blue" for code in codes[:count]}
+
+    def test_led_on_off_and_reset(self):
+        self.assertTrue(self.api.connected)
+
+        self.api.led_on(shelf=3, lamp=2005, color="red")
+        self.api.led_off(shelf=3, lamp=2005)
+        self.api.reset_leds(controller=3)
+
+        on, off, reset = self.device.frames
+        self.assertEqual(on[:5], [2, 1, 3, 11, 2])
+        self.assertEqual(on[7:10], [255, 0, 0])
+        self.assertEqual(off[3], 21)
+        self.assertEqual(reset[3], 23)
+
+    def test_pipelined_batch_gets_matched_acks(self):
+        lamps = self.lamps(400)
+        lamps[1001] = "red"
+        self.api.leds_off(shelf=2, lamps=[1002])
+
+        acks = self.api.leds_on(shelf=1, lamps=lamps)
+
+        self.assertEqual(len(self.device.frames), 401)
+        self.assertEqual(acks, [[2, 1, 1, 11, 3]] * 400)
+
+    def test_unanswered_frames_time_out(self):
+        self.device.silent = True
+
+        started = time.monotonic()
+        acks = self.api.leds_on(shelf=1, lamps=self.lamps(40))
+
+        self.assertEqual(acks, [None] * 40)
+        self.assertLess(time.monotonic() - started, 2)
+
+        self.device.silent = False
+        self.assertEqual(self.api.leds_off(shelf=1, lamps=[1001]), [[2, 1, 1, 21, 3]])
+
+    def test_skipped_middle_frame_acks_none_of_its_echo(self):
+        self.device.skip = {1}
+
+        acks = self.api.leds_on(shelf=1, lamps=self.lamps(3))
+
+        self.assertEqual(acks, [None, None, None])
+        self.assertEqual(
+            self.api.leds_on(shelf=1, lamps=self.lamps(2)), [[2, 1, 1, 11, 3]] * 2
+        )
+
+    def test_reconnects_after_port_error(self):
+        self.api.transport.serial.close()
+        for _ in range(50):
+            if not self.api.transport.connected:
+                break
+            time.sleep(0.05)
+        self.assertFalse(self.api.transport.connected)
+
+        self.assertEqual(self.api.leds_off(shelf=1, lamps=[1001]), [[2, 1, 1, 21, 3]])
+        self.assertTrue(self.api.connected)
+
+    def test_storage_selects_serial_transport(self):
+        storage = Storage.objects.create(
+            name="ptl_serial",
+            device="ATNPTL",
+            capacity=10,
+            COM_address=self.device.port,
+            ATNPTL_shelf_id=1,
+            ATNPTL_transport="serial",
+        )
+
+        dispatcher = get_dispatcher(storage)
+        # the device is connected by the dispatcher worker
+        self.assertTrue(dispatcher.wait_idle(timeout=5))
+
+        self.assertIsInstance(dispatcher.device_handler, PTL_SerialAPI)
+        self.assertIs(dispatcher.device_handler.transport, self.api.transport)
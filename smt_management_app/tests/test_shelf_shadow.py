@@ -0,0 +1,193 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from smt_management_app.models import Storage, StorageSlot
+from smt_management_app.tests.helpers import create_storage
+from smt_management_app.tests.test_led_shelf_dispatcher import (
+    RecordingNeoLightHandler,
+)
+from smt_management_app.utils.led_shelf_dispatcher import (
+    discard_dispatcher,
+    get_dispatcher,
+)
+from smt_management_app.utils.shelf_shadow import ShelfShadow
+
+
+class ShelfShadowTestCase(SimpleTestCase):
+    def setUp(self):
+        self.shadow = ShelfShadow()
+
+    def push(self):
+        diff = self.shadow.diff()
+        self.shadow.acknowledge(*diff)
+        return diff
+
+    def test_only_changes_are_pushed(self):
+        self.shadow.set_lamps({1: "blue", 2: None})
+        self.shadow.set_status({"A": "green"})
+        self.assertEqual(self.push(), ({1: "blue"}, [2], {"A": "green"}, []))
+
+        self.shadow.set_lamps({1: "blue", 2: None})
+        self.shadow.set_status({"A": "green"})
+        self.assertEqual(self.push(), ({}, [], {}, []))
+
+        self.shadow.set_lamps({1: "red", 3: None})
+        self.assertEqual(self.push(), ({1: "red"}, [3], {}, []))
+        # lamps that are off are not kept as desired state
+        self.assertEqual(self.shadow.desired, {1: "red"})
+
+    def test_resync_pushes_the_full_desired_state(self):
+        self.shadow.set_lamps({lamp: "blue" for lamp in range(1, 6)})
+        self.shadow.set_lamps({5: None})
+        self.push()
+
+        self.shadow.resync()
+
+        self.assertEqual(
+            self.shadow.diff(), ({lamp: "blue" for lamp in range(1, 5)}, [], {}, [])
+        )
+        copied = self.shadow.copy()
+        self.assertEqual(copied.diff(), self.shadow.diff())
+
+    def test_after_reset_every_lamp_is_known_off(self):
+        self.shadow.set_lamps({1: "blue"})
+        self.push()
+
+        self.shadow.reset()
+        self.shadow.set_lamps({1: None, 2: None})
+
+        self.assertEqual(self.shadow.diff(), ({}, [], {}, []))
+
+
+class ReconcilingDispatcherTestCase(TestCase):
+    def setUp(self):
+        discard_dispatcher()
+        self.storage = create_storage()
+        self.dispatcher = get_dispatcher(self.storage)
+        self.dispatcher.device_type = "NeoLight"
+        self.handler = RecordingNeoLightHandler()
+        self.dispatcher.device_handler = self.handler
+
+    def tearDown(self):
+        discard_dispatcher()
+
+    def test_redundant_commands_do_not_reach_the_device(self):
+        self.dispatcher.led_on(1, "blue")
+        self.dispatcher.led_on(1, "blue")
+        self.dispatcher._LED_On_Control({"lamps": {1: "blue", 3: "red"}})
+        self.dispatcher.led_off(3)
+        self.dispatcher._LED_Off_Control(lamps=[3])
+
+        self.assertEqual(
+            self.handler.requests,
+            [
+                ("open", {"lamps": {1: "blue"}}),
+                ("open", {"lamps": {3: "red"}}),
+                ("close", [3], False, False),
+            ],
+        )
+
+    def test_lighthouse_changes_once_and_is_saved_once(self):
+        # selecting the slots and lighting them arrive in one batch
+        self.dispatcher._LED_batch_control(
+            [
+                ("led_state_changed", {"slots": [2, 4], "state": 1}),
+                ("led_on", {"lamp": 2, "color": "blue"}),
+            ]
+        )
+        self.dispatcher.led_on(4, "blue")
+
+        self.assertEqual(
+            self.handler.requests,
+            [
+                ("open", {"lamps": {2: "blue"}, "status": {"A": "yellow"}}),
+                ("open", {"lamps": {4: "blue"}}),
+            ],
+        )
+        storage = Storage.objects.get(name="storage_0")
+        self.assertTrue(storage.lighthouse_A_yellow)
+        self.assertFalse(storage.lighthouse_A_green)
+        self.assertTrue(storage.lighthouse_B_green)
+
+    def test_lighthouse_follows_the_selected_slot_counters(self):
+        self.dispatcher.led_on(7, "blue")
+        self.handler.requests.clear()
+
+        # one storage write per side going from or to zero selected slots
+        with self.assertNumQueries(2):
+            self.dispatcher.led_state_changed([2, 4], 1)
+            self.dispatcher.led_state_changed([4], 0)
+            self.dispatcher.led_off(7)
+            self.dispatcher.led_state_changed([2], 0)
+
+        self.assertEqual(
+            self.handler.requests,
+            [
+                ("open", {"status": {"A": "yellow"}}),
+                ("close", [7], False, False),
+                ("open", {"status": {"A": "green"}}),
+            ],
+        )
+
+    def test_set_led_state_notifies_the_dispatcher(self):
+        slots = StorageSlot.objects.filter(name__in=[2, 3]).order_by("name")
+        with mock.patch.object(self.dispatcher, "submit") as submit:
+            StorageSlot.set_led_state(slots, 1)
+            StorageSlot.set_led_state(slots, 1)
+
+        submit.assert_called_once_with("led_state_changed", slots=[2, 3], state=1)
+
+    def test_reconnect_reapplies_desired_state_in_one_call(self):
+        self.handler.connection_epoch = 0
+        self.dispatcher.led_on(1, "blue")
+        self.dispatcher.led_on(2, "red")
+        self.dispatcher.led_off(2)
+        self.handler.requests.clear()
+
+        self.handler.connection_epoch += 1
+        self.dispatcher.led_on(3, "green")
+
+        self.assertEqual(
+            self.handler.requests,
+            [
+                (
+                    "open",
+                    {
+                        "lamps": {1: "blue", 3: "green"},
+                        "status": {"A": "green", "B": "green"},
+                    },
+                )
+            ],
+        )
+
+    def test_batch_with_a_missing_ack_is_sent_again(self):
+        self.dispatcher.device_type = "ATNPTL"
+        self.dispatcher.ATNPTL_shelf_id = 1
+        handler = mock.Mock()
+        # one frame was not answered, the acks do not tell which one
+        handler.leds_on.return_value = [[1, 11], [1, 11], None]
+        self.dispatcher.device_handler = handler
+
+        self.dispatcher._LED_On_Control({"lamps": {1: "blue", 2: "blue", 3: "blue"}})
+        handler.leds_on.return_value = [[1, 11]] * 4
+        self.dispatcher.led_on(4, "red")
+
+        self.assertEqual(
+            [call.kwargs["lamps"] for call in handler.leds_on.call_args_list],
+            [
+                {1: "blue", 2: "blue", 3: "blue"},
+                {1: "blue", 2: "blue", 3: "blue", 4: "red"},
+            ],
+        )
+        self.assertEqual(self.dispatcher.shadow.diff(), ({}, [], {}, []))
+
+    def test_rebuilt_dispatcher_takes_over_the_lamps(self):
+        self.dispatcher.led_on(1, "blue")
+
+        self.storage.ip_address = "127.0.0.1"
+        self.storage.save()
+        rebuilt = get_dispatcher(self.storage)
+
+        self.assertIsNot(rebuilt, self.dispatcher)
+        self.assertEqual(rebuilt.shadow.desired, {1: "blue"})
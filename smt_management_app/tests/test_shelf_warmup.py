@@ -0,0 +1,145 @@
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from smt_management_app import shelf_warmup
+from smt_management_app.models import Storage
+from smt_management_app.utils import led_shelf_dispatcher
+from smt_management_app.utils.led_shelf_dispatcher import (
+    discard_dispatcher,
+    get_dispatcher,
+)
+
+connect_allowed = threading.Event()
+
+
+class SlowPTLHandler:
+    """Stands in for PTL_API, connecting blocks until the test allows it."""
+
+    def __init__(self, port, baudrate=None, timeout=None):
+        connect_allowed.wait(5)
+        self.connected = True
+        self.lamps = []
+
+    def leds_on(self, shelf=None, lamps=None):
+        self.lamps.append(dict(lamps))
+        return [[shelf, 11]] * len(lamps)
+
+
+class BrokenPTLHandler:
+    def __init__(self, port, baudrate=None, timeout=None):
+        raise OSError("bridge unreachable")
+
+
+class ShelfWarmupTestCase(TransactionTestCase):
+    def setUp(self):
+        discard_dispatcher()
+        connect_allowed.clear()
+        for patch in (
+            mock.patch.dict(
+                led_shelf_dispatcher.DEVICE_HANDLERS,
+                {
+                    "ATNPTL": f"{__name__}.SlowPTLHandler",
+                    "ATNPTL serial": f"{__name__}.BrokenPTLHandler",
+                },
+            ),
+            mock.patch.dict(led_shelf_dispatcher._handler_classes, clear=True),
+            mock.patch.dict(led_shelf_dispatcher._handler_errors, clear=True),
+            mock.patch.dict(shelf_warmup._unavailable, clear=True),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.slow = Storage.objects.create(
+            name="slow", device="ATNPTL", capacity=10, ATNPTL_shelf_id=1
+        )
+
+    def tearDown(self):
+        connect_allowed.set()
+        discard_dispatcher()
+
+    def test_commands_queue_while_connecting(self):
+        started = time.monotonic()
+        dispatcher = get_dispatcher(self.slow)
+        dispatcher.submit("led_on", lamp=1001, color="blue")
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(dispatcher.health["state"], "connecting")
+
+        response = self.client.get("/api/health/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["storages"]["slow"]["state"], "connecting")
+
+        connect_allowed.set()
+        self.assertTrue(dispatcher.wait_idle(timeout=5))
+        self.assertEqual(dispatcher.device_handler.lamps, [{1001: "blue"}])
+
+        response = self.client.get("/api/health/")
+        self.assertEqual(response.status_code, 200)
+        health = response.json()["storages"]["slow"]
+        self.assertEqual(health["state"], "ready")
+        self.assertEqual(health["device"], "ATNPTL")
+        self.assertGreater(health["init_duration"], 0)
+
+    def test_warm_up_records_every_storage(self):
+        connect_allowed.set()
+        Storage.objects.create(
+            name="broken", device="ATNPTL", capacity=10, ATNPTL_transport="serial"
+        )
+        Storage.objects.create(name="sophia", device="Sophia", capacity=10)
+        Storage.objects.create(name="dummy", device="Dummy", capacity=10)
+
+        with mock.patch.dict(
+            led_shelf_dispatcher.DEVICE_HANDLERS,
+            {"Sophia": "smt_management_app.utils.shelf_handlers.missing.Handler"},
+        ):
+            shelf_warmup.warm_up_dispatchers()
+        for name in ("slow", "broken", "dummy"):
+            self.assertTrue(get_dispatcher(Storage.objects.get(name=name)).wait_idle(5))
+
+        ready, storages = shelf_warmup.collect_shelf_health()
+        self.assertTrue(ready)
+        self.assertEqual(storages["slow"]["state"], "ready")
+        self.assertEqual(storages["dummy"]["state"], "ready")
+        self.assertEqual(storages["broken"]["state"], "failed")
+        self.assertEqual(storages["broken"]["error"], "bridge unreachable")
+        self.assertEqual(storages["sophia"]["state"], "failed")
+        self.assertIn("Storage sophia:", storages["sophia"]["error"])
+
+    def test_storage_without_dispatcher_is_pending(self):
+        ready, storages = shelf_warmup.collect_shelf_health()
+        self.assertFalse(ready)
+        self.assertEqual(storages["slow"]["state"], "pending")
+
+
+class ShouldWarmUpTestCase(SimpleTestCase):
+    def test_only_serving_processes_warm_up(self):
+        with mock.patch.dict("os.environ", {"RUN_MAIN": "true"}):
+            self.assertTrue(shelf_warmup.should_warm_up(["manage.py", "runserver"]))
+            self.assertFalse(shelf_warmup.should_warm_up(["manage.py", "migrate"]))
+            self.assertFalse(shelf_warmup.should_warm_up(["manage.py", "test"]))
+            self.assertFalse(shelf_warmup.should_warm_up(["-c"]))
+            with override_settings(SHELF_WARMUP=False):
+                self.assertFalse(
+                    shelf_warmup.should_warm_up(["manage.py", "runserver"])
+                )
+
+        with mock.patch.dict("os.environ", {}, clear=True):
+            # the autoreloader parent does not serve requests
+            self.assertFalse(shelf_warmup.should_warm_up(["manage.py", "runserver"]))
+            self.assertTrue(
+                shelf_warmup.should_warm_up(["manage.py", "runserver", "--noreload"])
+            )
+
+
+class StartWarmupTestCase(SimpleTestCase):
+    def test_warm_up_starts_once_per_process(self):
+        with mock.patch.object(shelf_warmup, "_warmup_thread", None), mock.patch.object(
+            shelf_warmup, "warm_up_dispatchers"
+        ) as warm_up:
+            # apps.ready() and wsgi.py of one runserver process
+            thread = shelf_warmup.start_warmup()
+            self.assertIs(shelf_warmup.start_warmup(), thread)
+            thread.join(5)
+
+        warm_up.assert_called_once_with()
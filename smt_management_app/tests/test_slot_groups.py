@@ -0,0 +1,82 @@
+from django.test import TestCase
+
+from smt_management_app.models import (
+    Article,
+    Carrier,
+    SlotGroup,
+    StorageSlot,
+    group_storage_slots,
+    merge_storage_slots,
+    split_slot_group,
+)
+from smt_management_app.storing import is_combined_slot_occupied
+from smt_management_app.tests.helpers import create_storage
+
+
+class SlotGroupTestCase(TestCase):
+
+    def setUp(self):
+        self.storage = create_storage(
+            slots=6, slot_fields=lambda slot_name: {"diameter": 7 + slot_name}
+        )
+        self.article = Article.objects.create(name="article_0")
+
+    def slot(self, slot_name):
+        return StorageSlot.objects.get(storage=self.storage, name=slot_name)
+
+    def test_group_storage_slots(self):
+        group = group_storage_slots([self.slot(1), self.slot(2), self.slot(3)])
+
+        self.assertEqual(group.lamps, [1, 2, 3])
+        self.assertEqual(group.diameter, 10)
+        # the members keep their own dimensions
+        self.assertEqual([self.slot(name).diameter for name in (1, 2, 3)], [8, 9, 10])
+        self.assertEqual(self.slot(2).related_names, [1, 3])
+        self.assertEqual(self.slot(2).qr_codes, ["storage_0_1", "storage_0_3"])
+        self.assertEqual(self.slot(3).group, group)
+        self.assertIsNone(self.slot(4).group)
+
+    def test_grouping_joins_existing_group(self):
+        first = group_storage_slots([self.slot(1), self.slot(2)])
+        group = group_storage_slots([self.slot(2), self.slot(3)])
+
+        self.assertEqual(group.lamps, [1, 2, 3])
+        self.assertFalse(SlotGroup.objects.filter(pk=first.pk).exists())
+
+    def test_related_names_edit_syncs_group(self):
+        slot = self.slot(4)
+        slot.related_names = [5]
+        slot.save()
+        group = self.slot(5).group
+        self.assertEqual(group.lamps, [4, 5])
+
+        slot.related_names = []
+        slot.save()
+        group.refresh_from_db()
+        self.assertIsNone(self.slot(4).group)
+        self.assertEqual(group.lamps, [5])
+
+    def test_merge_keeps_names_of_deleted_slots(self):
+        merge_storage_slots(self.slot(1), self.slot(2))
+        primary = self.slot(1)
+        self.assertEqual(primary.group.lamps, [1, 2])
+        self.assertEqual(primary.group.slots.count(), 1)
+
+    def test_occupancy_is_checked_over_group(self):
+        group_storage_slots([self.slot(1), self.slot(2)])
+        Carrier.objects.create(
+            name="carrier_0", article=self.article, storage_slot=self.slot(2)
+        )
+        slot = self.slot(1)
+        with self.assertNumQueries(1):
+            self.assertTrue(is_combined_slot_occupied(slot))
+        self.assertFalse(is_combined_slot_occupied(self.slot(3)))
+
+    def test_split_slot_group(self):
+        group = group_storage_slots([self.slot(1), self.slot(2)])
+        split_slot_group(group)
+
+        self.assertFalse(SlotGroup.objects.exists())
+        self.assertEqual(self.slot(1).related_names, [])
+        self.assertEqual(self.slot(2).qr_codes, [])
+        self.assertFalse(is_combined_slot_occupied(self.slot(1)))
@@ -0,0 +1,235 @@
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase
+
+from smt_management_app.models import Article, Carrier, Storage, StorageSlot
+from smt_management_app import slot_index
+from smt_management_app.slot_index import (
+    find_first_free_slot_id,
+    find_free_slot_ids,
+    get_lamp_group,
+    get_lamp_groups,
+    get_lighthouse_zones,
+    get_occupancy_index,
+    invalidate_slot_index,
+)
+from smt_management_app.storing import get_truly_free_slots
+from smt_management_app.tests.helpers import create_storage
+
+
+class LampGroupIndexTestCase(TestCase):
+
+    def setUp(self):
+        invalidate_slot_index()
+        self.storage = create_storage()
+
+    def tearDown(self):
+        invalidate_slot_index()
+
+    def test_single_slot_maps_to_itself(self):
+        self.assertEqual(get_lamp_group(self.storage, 3), [3])
+        self.assertEqual(get_lamp_group(self.storage, "3"), [3])
+
+    def test_unknown_lamp_falls_back_to_itself(self):
+        self.assertEqual(get_lamp_group(self.storage, 99), [99])
+
+    def test_map_is_built_with_one_query(self):
+        with self.assertNumQueries(1):
+            for lamp in range(1, 11):
+                get_lamp_group(self.storage, lamp)
+
+    def test_merged_slots_share_group(self):
+        get_lamp_groups(self.storage)
+        slot = StorageSlot.objects.get(storage=self.storage, name=1)
+        slot.related_names = [2, 3]
+        slot.save()
+        StorageSlot.objects.filter(storage=self.storage, name__in=[2, 3]).delete()
+
+        self.assertEqual(get_lamp_group(self.storage, 1), [1, 2, 3])
+        self.assertEqual(get_lamp_group(self.storage, 3), [1, 2, 3])
+        self.assertEqual(get_lamp_group(self.storage, 4), [4])
+
+    def test_unchanged_save_keeps_map(self):
+        lamp_groups = get_lamp_groups(self.storage)
+        slot = StorageSlot.objects.get(storage=self.storage, name=1)
+        slot.led_state = 1
+        slot.save()
+        self.assertIs(get_lamp_groups(self.storage), lamp_groups)
+
+    def test_slot_delete_invalidates_map(self):
+        lamp_groups = get_lamp_groups(self.storage)
+        StorageSlot.objects.get(storage=self.storage, name=10).delete()
+        self.assertIsNot(get_lamp_groups(self.storage), lamp_groups)
+
+    def test_change_of_another_process_shows_with_a_fresh_row(self):
+        get_lamp_groups(self.storage)
+        slot = StorageSlot.objects.get(storage=self.storage, name=1)
+        slot.related_names = [2]
+        with mock.patch.dict(slot_index._lamp_groups, clear=True):
+            # another process, its save does not reach the map of this one
+            slot.save()
+        self.assertEqual(get_lamp_group(self.storage, 1), [1])
+
+        storage = Storage.objects.get(name="storage_0")
+        self.assertEqual(get_lamp_group(storage, 1), [1, 2])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_lamp_group(storage, 1), [1, 2])
+
+    def test_lighthouse_zones(self):
+        zones = get_lighthouse_zones(self.storage)
+        self.assertEqual([zones[name] for name in (1, 5, 6, 10)], ["A", "A", "B", "B"])
+
+        # code style names: shelf row and position, split at the middle of the names
+        storage = Storage.objects.create(name="storage_1", device="Dummy", capacity=8)
+        for slot_name in (1001, 1002, 1003, 1004, 2001, 2002, 2003, 2004):
+            StorageSlot.objects.create(
+                name=slot_name, qr_value=f"storage_1_{slot_name}", storage=storage
+            )
+        zones = get_lighthouse_zones(storage)
+        self.assertEqual(zones[1004], "A")
+        self.assertEqual(zones[2001], "B")
+
+        with self.assertNumQueries(0):
+            self.assertIs(get_lighthouse_zones(storage), zones)
+        StorageSlot.objects.get(storage=storage, name=2004).delete()
+        self.assertIsNot(get_lighthouse_zones(storage), zones)
+
+
+class OccupancyIndexTestCase(TransactionTestCase):
+
+    def setUp(self):
+        invalidate_slot_index()
+        self.storage = create_storage(
+            slot_fields=lambda slot_name: {"diameter": 13 if slot_name > 8 else 7}
+        )
+        self.slots = {
+            slot.name: slot for slot in StorageSlot.objects.filter(storage=self.storage)
+        }
+        self.article = Article.objects.create(name="article_0")
+        self.carrier = Carrier.objects.create(
+            name="carrier_0", article=self.article, delivered=True
+        )
+
+    def tearDown(self):
+        invalidate_slot_index()
+
+    def slot_names(self, slot_ids):
+        names = {slot.id: slot.name for slot in self.slots.values()}
+        return [names[slot_id] for slot_id in slot_ids]
+
+    def test_lookup_does_not_query(self):
+        get_occupancy_index(self.storage)
+        with self.assertNumQueries(0):
+            slot_ids = find_free_slot_ids(self.storage, 7, 12)
+            first = find_first_free_slot_id(self.storage, 13, 12)
+        self.assertEqual(self.slot_names(slot_ids), list(range(1, 11)))
+        self.assertEqual(self.slot_names([first]), [9])
+
+    def test_dimensions_filter_slots(self):
+        self.assertEqual(
+            self.slot_names(find_free_slot_ids(self.storage, 13, 12)), [9, 10]
+        )
+        self.assertEqual(find_free_slot_ids(self.storage, 15, 12), [])
+        self.assertEqual(find_free_slot_ids(self.storage, 7, 16), [])
+
+    def test_store_and_collect_update_index(self):
+        index = get_occupancy_index(self.storage)
+        self.carrier.storage_slot = self.slots[1]
+        self.carrier.save()
+        self.assertIs(get_occupancy_index(self.storage), index)
+        self.assertNotIn(self.slots[1].id, find_free_slot_ids(self.storage, 7, 12))
+
+        self.carrier.storage_slot = None
+        self.carrier.save()
+        self.assertIn(self.slots[1].id, find_free_slot_ids(self.storage, 7, 12))
+
+    def test_occupied_slot_blocks_combined_group(self):
+        slot = self.slots[1]
+        slot.related_names = [2, 3]
+        slot.save()
+        self.carrier.storage_slot = self.slots[3]
+        self.carrier.save()
+
+        free = self.slot_names(find_free_slot_ids(self.storage, 7, 12))
+        self.assertNotIn(1, free)
+        self.assertNotIn(3, free)
+        self.assertIn(2, free)
+
+    def test_nominated_slots_can_be_excluded(self):
+        self.carrier.nominated_for_slot = self.slots[1]
+        self.carrier.save()
+        first = find_first_free_slot_id(self.storage, 7, 12, exclude_nominated=True)
+        self.assertEqual(self.slot_names([first]), [2])
+        self.assertEqual(
+            self.slot_names([find_first_free_slot_id(self.storage, 7, 12)]), [1]
+        )
+
+    def test_mismatch_rebuilds_index(self):
+        get_occupancy_index(self.storage)
+        # bypass Carrier.save so the index does not see the change
+        Carrier.objects.filter(name="carrier_0").update(storage_slot=self.slots[9])
+        free_slots = get_truly_free_slots(self.storage, 13, 12)
+        self.assertEqual([slot.name for slot in free_slots], [10])
+        self.assertNotIn(
+            self.slots[9].id, get_occupancy_index(self.storage).free_slot_ids(13, 12)
+        )
+
+    def test_full_storage_does_not_rebuild(self):
+        for name in (9, 10):
+            Carrier.objects.create(
+                name=f"carrier_{name}",
+                article=self.article,
+                storage_slot=self.slots[name],
+            )
+        storage = Storage.objects.get(name="storage_0")
+        self.assertEqual(get_truly_free_slots(storage, 13, 12), [])
+
+        index = get_occupancy_index(storage)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_truly_free_slots(storage, 13, 12), [])
+        self.assertIs(get_occupancy_index(storage), index)
+
+    def test_incremental_update_keeps_index_current(self):
+        index = get_occupancy_index(Storage.objects.get(name="storage_0"))
+        self.carrier.storage_slot = self.slots[9]
+        self.carrier.save()
+
+        # the bump of this process is in the index already, no rebuild
+        storage = Storage.objects.get(name="storage_0")
+        self.assertEqual(storage.slot_occupancy_version, 1)
+        self.assertEqual(index.occupancy_version, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.slot_names(find_free_slot_ids(storage, 13, 12)), [10])
+        self.assertIs(get_occupancy_index(storage), index)
+
+    def test_slot_freed_by_another_process_is_found(self):
+        for name in (9, 10):
+            Carrier.objects.create(
+                name=f"carrier_{name}",
+                article=self.article,
+                storage_slot=self.slots[name],
+            )
+        self.assertEqual(get_truly_free_slots(self.storage, 13, 12), [])
+
+        carrier = Carrier.objects.get(name="carrier_10")
+        carrier.storage_slot = None
+        with mock.patch.dict(slot_index._occupancy, clear=True):
+            # another process, its save does not reach the index of this one
+            carrier.save()
+        self.assertEqual(get_truly_free_slots(self.storage, 13, 12), [])
+
+        storage = Storage.objects.get(name="storage_0")
+        free_slots = get_truly_free_slots(storage, 13, 12)
+        self.assertEqual([slot.name for slot in free_slots], [10])
+
+    def test_storage_save_keeps_newer_versions(self):
+        storage = Storage.objects.get(name="storage_0")
+        self.carrier.storage_slot = self.slots[1]
+        self.carrier.save()
+
+        storage.location = "hall 2"
+        storage.save()
+
+        storage = Storage.objects.get(name="storage_0")
+        self.assertEqual(storage.location, "hall 2")
+        self.assertEqual(storage.slot_occupancy_version, 1)
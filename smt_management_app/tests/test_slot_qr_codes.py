@@ -0,0 +1,69 @@
+from django.forms import ValidationError
+from django.test import TestCase
+
+from smt_management_app.helpers import find_slot_by_qr_code
+from smt_management_app.models import (
+    SlotQRCode,
+    Storage,
+    StorageSlot,
+    merge_storage_slots,
+)
+
+
+class SlotQRCodeTestCase(TestCase):
+
+    def setUp(self):
+        for storage_name in ("storage_0", "storage_1"):
+            storage = Storage.objects.create(
+                name=storage_name, device="Dummy", capacity=5
+            )
+            for slot_name in range(1, 6):
+                # both storages share their qr values like mirrored shelves do
+                StorageSlot.objects.create(
+                    name=slot_name, qr_value=f"qr_{slot_name}", storage=storage
+                )
+
+    def slot(self, storage_name, slot_name):
+        return StorageSlot.objects.get(storage_id=storage_name, name=slot_name)
+
+    def test_lookup_is_one_query(self):
+        with self.assertNumQueries(1):
+            slot = find_slot_by_qr_code("qr_2", "storage_1")
+            self.assertEqual((slot.storage.name, slot.name), ("storage_1", 2))
+
+    def test_global_lookup_returns_first_storage(self):
+        slot = find_slot_by_qr_code("qr_3")
+        self.assertEqual((slot.storage.name, slot.name), ("storage_0", 3))
+        self.assertIsNone(find_slot_by_qr_code("qr_unknown"))
+
+    def test_qr_value_edit_moves_code(self):
+        slot = self.slot("storage_0", 1)
+        slot.qr_value = "qr_new"
+        slot.save()
+        self.assertEqual(find_slot_by_qr_code("qr_new", "storage_0"), slot)
+        self.assertIsNone(find_slot_by_qr_code("qr_1", "storage_0"))
+
+    def test_duplicate_primary_code_rejected(self):
+        slot = self.slot("storage_0", 1)
+        slot.qr_value = "qr_2"
+        with self.assertRaises(ValidationError):
+            slot.save()
+
+    def test_additional_code_does_not_take_primary(self):
+        slot = self.slot("storage_0", 1)
+        slot.qr_codes = ["qr_2"]
+        slot.save()
+        self.assertEqual(find_slot_by_qr_code("qr_2", "storage_0").name, 2)
+
+    def test_merge_moves_codes_to_primary(self):
+        primary = self.slot("storage_0", 1)
+        merge_storage_slots(
+            primary, self.slot("storage_0", 2), self.slot("storage_0", 3)
+        )
+
+        for code in ("qr_1", "qr_2", "qr_3"):
+            self.assertEqual(find_slot_by_qr_code(code, "storage_0"), primary)
+        self.assertEqual(find_slot_by_qr_code("qr_2", "storage_1").name, 2)
+        self.assertEqual(
+            SlotQRCode.objects.filter(slot=primary, is_primary=False).count(), 2
+        )
@@ -0,0 +1,123 @@
+import threading
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.client import Client
+
+from smt_management_app.models import Article, Carrier, StorageSlot
+from smt_management_app.slot_index import invalidate_slot_index
+from smt_management_app.storing import claim_slot, reserve_slot
+from smt_management_app.tests.helpers import create_storage
+from smt_management_app.utils.led_shelf_dispatcher import discard_dispatcher
+
+
+class SlotReservationTestCase(TestCase):
+
+    def setUp(self):
+        invalidate_slot_index()
+        self.storage = create_storage(slots=3)
+        self.article = Article.objects.create(name="article_0")
+        self.carriers = [
+            Carrier.objects.create(
+                name=f"carrier_{i}", article=self.article, delivered=True
+            )
+            for i in range(3)
+        ]
+
+    def tearDown(self):
+        invalidate_slot_index()
+
+    def slot(self, slot_name):
+        return StorageSlot.objects.get(storage=self.storage, name=slot_name)
+
+    def test_claimed_slot_is_not_claimed_twice(self):
+        self.assertTrue(claim_slot(self.carriers[0], self.slot(1)))
+        self.assertFalse(claim_slot(self.carriers[1], self.slot(1)))
+        self.assertEqual(
+            Carrier.objects.get(name="carrier_0").nominated_for_slot, self.slot(1)
+        )
+        self.assertEqual(self.slot(1).led_state, 1)
+
+    def test_group_with_carrier_is_not_claimed(self):
+        slot = self.slot(1)
+        slot.related_names = [2]
+        slot.save()
+        self.assertTrue(claim_slot(self.carriers[0], self.slot(2)))
+        self.assertFalse(claim_slot(self.carriers[1], self.slot(1)))
+
+    def test_reserve_skips_taken_candidates(self):
+        claim_slot(self.carriers[0], self.slot(1))
+        # stale candidate list, slot 1 was claimed by another station
+        slot = reserve_slot(
+            self.carriers[1], self.storage, candidates=[self.slot(1), self.slot(2)]
+        )
+        self.assertEqual(slot.name, 2)
+
+    def test_reserve_returns_none_when_full(self):
+        for carrier in self.carriers:
+            self.assertIsNotNone(reserve_slot(carrier, self.storage))
+        extra = Carrier.objects.create(
+            name="carrier_3", article=self.article, delivered=True
+        )
+        self.assertIsNone(reserve_slot(extra, self.storage))
+
+
+class ConcurrentStoringStressTestCase(TransactionTestCase):
+    STATIONS = 8
+    CARRIERS_PER_STATION = 10
+    SLOTS = 60
+
+    def setUp(self):
+        invalidate_slot_index()
+        discard_dispatcher()
+        self.storage = create_storage(slots=self.SLOTS)
+        article = Article.objects.create(name="article_0")
+        for i in range(self.STATIONS * self.CARRIERS_PER_STATION):
+            Carrier.objects.create(name=f"carrier_{i}", article=article, delivered=True)
+
+    def tearDown(self):
+        discard_dispatcher()
+        invalidate_slot_index()
+
+    def test_parallel_stations_never_share_a_slot(self):
+        results = {}
+        errors = []
+        start = threading.Barrier(self.STATIONS)
+
+        def station(station_id):
+            client = Client()
+            start.wait()
+            try:
+                for i in range(self.CARRIERS_PER_STATION):
+                    carrier_name = (
+                        f"carrier_{station_id * self.CARRIERS_PER_STATION + i}"
+                    )
+                    response = client.get(
+                        f"/api/store_carrier/{carrier_name}/storage_0/"
+                    ).json()
+                    results[carrier_name] = response
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=station, args=(station_id,))
+            for station_id in range(self.STATIONS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        succeeded = [r for r in results.values() if r["success"]]
+        self.assertEqual(len(succeeded), self.SLOTS)
+        self.assertEqual(len({r["slot"] for r in succeeded}), self.SLOTS)
+
+        nominated = Carrier.objects.filter(nominated_for_slot__isnull=False)
+        self.assertEqual(nominated.count(), self.SLOTS)
+        self.assertEqual(
+            StorageSlot.objects.filter(storage=self.storage, led_state=1).count(),
+            self.SLOTS,
+        )
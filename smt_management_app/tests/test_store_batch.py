@@ -0,0 +1,167 @@
+import json
+from unittest import mock
+
+from django.db import OperationalError
+from django.test import TestCase
+from django.test.client import Client
+
+from smt_management_app import storing
+from smt_management_app.models import Article, Carrier, StorageSlot
+from smt_management_app.slot_index import invalidate_slot_index
+from smt_management_app.tests.helpers import create_storage
+from smt_management_app.utils.led_shelf_dispatcher import discard_dispatcher
+
+
+class StoreCarriersBatchTestCase(TestCase):
+
+    def setUp(self):
+        invalidate_slot_index()
+        discard_dispatcher()
+        self.client = Client()
+        self.storage = create_storage(
+            slots=6,
+            slot_fields=lambda slot_name: {"diameter": 13 if slot_name > 4 else 7},
+        )
+        for article_name in ("article_0", "article_1"):
+            Article.objects.create(name=article_name)
+
+    def tearDown(self):
+        discard_dispatcher()
+        invalidate_slot_index()
+
+    def create_carrier(self, name, article="article_0", diameter=7, **kwargs):
+        return Carrier.objects.create(
+            name=name,
+            article=Article(article),
+            diameter=diameter,
+            delivered=True,
+            **kwargs,
+        )
+
+    def store_batch(self, carriers, storage=None):
+        body = {"carriers": carriers}
+        if storage:
+            body["storage"] = storage
+        return self.client.post(
+            "/api/store_carriers_batch/",
+            json.dumps(body),
+            content_type="application/json",
+        ).json()
+
+    def test_batch_nominates_slots(self):
+        self.create_carrier("carrier_0")
+        self.create_carrier("carrier_1", article="article_1")
+
+        response = self.store_batch(["carrier_0", "carrier_1"], "storage_0")
+
+        self.assertTrue(response["success"])
+        self.assertEqual(len(response["allocated"]), 2)
+        self.assertEqual(
+            {entry["color"] for entry in response["allocated"]}, {"yellow", "blue"}
+        )
+        slot_names = {
+            Carrier.objects.get(name=name).nominated_for_slot.name
+            for name in ("carrier_0", "carrier_1")
+        }
+        self.assertEqual(len(slot_names), 2)
+        self.assertEqual(
+            StorageSlot.objects.filter(storage=self.storage, led_state=1).count(), 2
+        )
+
+    def test_large_carriers_get_large_slots(self):
+        self.create_carrier("carrier_0")
+        self.create_carrier("carrier_1", diameter=13)
+        self.create_carrier("carrier_2", diameter=13)
+
+        self.store_batch(["carrier_0", "carrier_1", "carrier_2"])
+
+        self.assertEqual(
+            Carrier.objects.get(name="carrier_0").nominated_for_slot.diameter, 7
+        )
+        for name in ("carrier_1", "carrier_2"):
+            self.assertEqual(
+                Carrier.objects.get(name=name).nominated_for_slot.diameter, 13
+            )
+
+    def test_combined_group_takes_one_carrier(self):
+        slot = StorageSlot.objects.get(storage=self.storage, name=1)
+        slot.related_names = [2, 3, 4]
+        slot.save()
+        StorageSlot.objects.filter(storage=self.storage, name__in=[2, 3, 4]).delete()
+        for i in range(4):
+            self.create_carrier(f"carrier_{i}")
+
+        response = self.store_batch([f"carrier_{i}" for i in range(4)])
+
+        self.assertEqual(len(response["allocated"]), 3)
+        self.assertEqual(
+            response["rejected"],
+            [{"carrier": "carrier_3", "message": "No free storage slot."}],
+        )
+
+    def test_invalid_carriers_are_rejected(self):
+        self.create_carrier("carrier_0")
+        self.create_carrier("carrier_1", collecting=True)
+
+        response = self.store_batch(["carrier_0", "carrier_1", "carrier_x"])
+
+        self.assertEqual(len(response["allocated"]), 1)
+        self.assertEqual(
+            {entry["carrier"] for entry in response["rejected"]},
+            {"carrier_1", "carrier_x"},
+        )
+
+    def test_batch_slot_is_confirmed_per_carrier(self):
+        self.create_carrier("carrier_0")
+        response = self.store_batch(["carrier_0"])
+        slot = response["allocated"][0]["slot"]
+
+        response = self.client.get(
+            f"/api/store_carrier_confirm/carrier_0/storage_0/{slot}/"
+        ).json()
+
+        self.assertTrue(response["success"])
+        self.assertEqual(
+            Carrier.objects.get(name="carrier_0").storage_slot.qr_value, slot
+        )
+
+    def claim_failing_at(self, failing_call, error):
+        claim_slot = storing.claim_slot
+        calls = []
+
+        def claim(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == failing_call:
+                raise OperationalError(error)
+            return claim_slot(*args, **kwargs)
+
+        return mock.patch.object(storing, "claim_slot", side_effect=claim)
+
+    def test_failed_batch_nominates_nothing(self):
+        for i in range(3):
+            self.create_carrier(f"carrier_{i}")
+
+        with self.claim_failing_at(2, "disk I/O error"):
+            with self.assertRaises(OperationalError):
+                self.store_batch([f"carrier_{i}" for i in range(3)])
+
+        self.assertFalse(Carrier.objects.filter(nominated_for_slot__isnull=False))
+        self.assertFalse(StorageSlot.objects.filter(led_state=1))
+
+    def test_locked_batch_is_retried_as_a_whole(self):
+        for i in range(3):
+            self.create_carrier(f"carrier_{i}")
+
+        with self.claim_failing_at(2, "database is locked"):
+            response = self.store_batch([f"carrier_{i}" for i in range(3)])
+
+        self.assertEqual(len(response["allocated"]), 3)
+        self.assertEqual(
+            Carrier.objects.filter(nominated_for_slot__isnull=False).count(), 3
+        )
+
+    def test_bad_body(self):
+        response = self.client.post(
+            "/api/store_carriers_batch/", "nope", content_type="application/json"
+        ).json()
+        self.assertFalse(response["success"])
@@ -0,0 +1,198 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase
+
+from smt_management_app.utils.shelf_handlers import transport as transport_module
+from smt_management_app.utils.shelf_handlers.transport import (
+    CircuitBreaker,
+    HTTPTransport,
+    ShelfOfflineError,
+    close_transports,
+    get_transport,
+)
+
+
+class FakeController(BaseHTTPRequestHandler):
+    """Answers every POST with server.status (200), optionally after a delay."""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        with self.server.received:
+            self.server.requests += 1
+            self.server.received.notify_all()
+        time.sleep(self.server.delay)
+        body = b'{"success": true}'
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TransportTestCase(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeController)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.received = threading.Condition(self.server.lock)
+        self.server.connections = 0
+        self.server.requests = 0
+        self.server.delay = 0
+        self.server.status = 200
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.backoff = transport_module.RETRY_BACKOFF
+        transport_module.RETRY_BACKOFF = 0.001
+
+    def tearDown(self):
+        transport_module.RETRY_BACKOFF = self.backoff
+        close_transports()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def wait_for_requests(self, count, timeout=5):
+        """Wait until the controller received count requests."""
+        with self.server.received:
+            return self.server.received.wait_for(
+                lambda: self.server.requests >= count, timeout
+            )
+
+    def unused_url(self):
+        # a port that was just released refuses connections right away
+        server = ThreadingHTTPServer(("127.0.0.1", 0), FakeController)
+        port = server.server_address[1]
+        server.server_close()
+        return f"http://127.0.0.1:{port}"
+
+    def test_connection_is_reused(self):
+        transport = HTTPTransport(self.url)
+        for _ in range(10):
+            self.assertEqual(
+                transport.post("/api/open", json={"a": 1}).status_code, 200
+            )
+
+        self.assertEqual(self.server.requests, 10)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_get_transport_is_shared_per_controller(self):
+        self.assertIs(get_transport(self.url), get_transport(self.url + "/"))
+        self.assertIsNot(get_transport(self.url), get_transport(self.unused_url()))
+
+    def test_read_timeout(self):
+        self.server.delay = 0.5
+        transport = HTTPTransport(self.url, timeout=(1, 0.1), retries=0)
+
+        started = time.monotonic()
+        with self.assertRaises(requests.Timeout):
+            transport.post("/api/open")
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_idempotent_request_is_retried(self):
+        self.server.delay = 0.3
+        transport = HTTPTransport(self.url, timeout=(1, 0.1), retries=2)
+
+        with self.assertRaises(requests.Timeout):
+            transport.post("/api/open")
+        self.assertTrue(self.wait_for_requests(3))
+        self.assertEqual(self.server.requests, 3)
+
+    def test_non_idempotent_request_is_not_retried(self):
+        self.server.delay = 0.3
+        transport = HTTPTransport(self.url, timeout=(1, 0.1), retries=2)
+
+        with self.assertRaises(requests.Timeout):
+            transport.post("/initialize", idempotent=False)
+        self.assertTrue(self.wait_for_requests(1))
+        self.assertEqual(self.server.requests, 1)
+
+    def test_breaker_fails_fast_and_recovers(self):
+        transport = HTTPTransport(self.unused_url(), retries=0)
+        transport.breaker = CircuitBreaker(threshold=2, reset_timeout=0.2)
+
+        for _ in range(2):
+            with self.assertRaises(requests.ConnectionError):
+                transport.post("/api/open")
+        self.assertTrue(transport.breaker.is_open)
+
+        with self.assertRaises(ShelfOfflineError):
+            transport.post("/api/open")
+
+        # the controller comes back, the trial call after reset_timeout closes it
+        transport.base_url = self.url
+        with self.assertRaises(ShelfOfflineError):
+            transport.post("/api/open")
+        time.sleep(0.25)
+        self.assertEqual(transport.post("/api/open").status_code, 200)
+        self.assertFalse(transport.breaker.is_open)
+
+    def test_request_past_the_breaker(self):
+        transport = HTTPTransport(self.unused_url(), retries=0)
+        transport.breaker = CircuitBreaker(threshold=1, reset_timeout=10)
+
+        for _ in range(3):
+            with self.assertRaises(requests.ConnectionError) as raised:
+                transport.post("/initialize", idempotent=False, breaker=False)
+            self.assertNotIsInstance(raised.exception, ShelfOfflineError)
+        self.assertFalse(transport.breaker.is_open)
+
+        transport.breaker.record_failure()
+        transport.base_url = self.url
+        response = transport.post("/initialize", idempotent=False, breaker=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(transport.breaker.is_open)
+
+    def test_failed_trial_keeps_breaker_open(self):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        # only one trial at a time
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+    def test_server_errors_open_breaker(self):
+        self.server.status = 500
+        transport = HTTPTransport(self.url, retries=0)
+        transport.breaker = CircuitBreaker(threshold=2, reset_timeout=10)
+
+        for _ in range(2):
+            self.assertEqual(transport.post("/api/open").status_code, 500)
+
+        self.assertTrue(transport.breaker.is_open)
+
+    def test_unexpected_error_settles_trial(self):
+        transport = HTTPTransport(self.url, retries=2)
+        transport.breaker = CircuitBreaker(threshold=1, reset_timeout=0.05)
+        transport.breaker.record_failure()
+        time.sleep(0.06)
+
+        with mock.patch.object(
+            transport.session,
+            "post",
+            side_effect=requests.exceptions.ChunkedEncodingError,
+        ) as post:
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                transport.post("/api/open")
+        # not retried, and the failed trial lets the next one through in time
+        self.assertEqual(post.call_count, 1)
+        time.sleep(0.06)
+        self.assertEqual(transport.post("/api/open").status_code, 200)
+        self.assertFalse(transport.breaker.is_open)
@@ -0,0 +1,118 @@
+import unittest
+
+from django.test import SimpleTestCase, TransactionTestCase
+
+from smt_management_app.models import Storage
+from smt_management_app.utils.led_shelf_dispatcher import (
+    ShelfBackendUnavailable,
+    discard_dispatcher,
+    get_dispatcher,
+    load_device_handler,
+)
+
+
+def recording_xgate_handler():
+    """XGateHandler without a bus, records the rows it would display."""
+    try:
+        XGateHandler = load_device_handler("Sophia")
+    except ShelfBackendUnavailable as e:
+        raise unittest.SkipTest(str(e))
+
+    class RecordingXGateHandler(XGateHandler):
+        def __init__(self):
+            self.sent = []
+            self.lighthouse = []
+            self.row_delay = self.clear_row_delay = 0
+            self._reset_frames()
+
+        def _display_row(self, address, frame):
+            self.sent.append((address, frame))
+
+        def light_house_on(self, mode="normal"):
+            self.lighthouse.append(mode)
+
+        def clear_lhs(self):
+            self.lighthouse.append("clear")
+
+    return RecordingXGateHandler()
+
+
+class XGateFrameTestCase(SimpleTestCase):
+    def setUp(self):
+        self.handler = recording_xgate_handler()
+
+    def test_only_changed_rows_are_sent(self):
+        lamps = {(row, lamp): "blue" for row in (1, 2, 11) for lamp in range(1, 11)}
+
+        self.assertEqual(self.handler.set_lamps(lamps), [1, 2, 11])
+        self.assertEqual(len(self.handler.sent), 3)
+        self.assertEqual(self.handler.sent[0][1][5], ("blue", False))
+
+        # nothing changed, nothing sent
+        self.assertEqual(self.handler.set_lamps(lamps), [])
+        self.assertEqual(self.handler.set_lamps({(3, 1): "off"}), [])
+
+        self.assertEqual(self.handler.set_lamps({(2, 5): "off"}), [2])
+        self.assertNotIn(5, self.handler.sent[-1][1])
+        self.assertEqual(len(self.handler.sent[-1][1]), 9)
+
+    def test_lamps_keep_their_own_color(self):
+        self.handler.switch_lights(address=1, lamp=1, col="red", blink=False)
+        self.handler.switch_lights(address=1, lamp=2, col="green", blink=True)
+        # switching a lamp on twice keeps it on
+        self.handler.switch_lights(address=1, lamp=2, col="green", blink=True)
+
+        self.assertEqual(len(self.handler.sent), 2)
+        self.assertEqual(
+            self.handler.sent[-1], (1, {1: ("red", False), 2: ("green", True)})
+        )
+
+    def test_clear_leds_resets_frames(self):
+        self.handler.set_lamps({(1, 1): "red"})
+        self.handler.row_devices = {}
+        cleared = []
+        self.handler.row_devices[1] = type(
+            "Row", (), {"Clear": lambda self: cleared.append(1)}
+        )()
+
+        self.handler.clear_leds()
+
+        self.assertEqual(cleared, [1])
+        self.assertEqual(self.handler.set_lamps({(1, 1): "red"}), [1])
+
+
+class SophiaDispatcherTestCase(TransactionTestCase):
+    # XGate lamps are addressed as "A1-001", they have no combined slots here
+    def setUp(self):
+        handler = recording_xgate_handler()
+        discard_dispatcher()
+        self.storage = Storage.objects.create(
+            name="sophia", device="Dummy", capacity=300
+        )
+        self.dispatcher = get_dispatcher(self.storage)
+        self.dispatcher.device_type = "Sophia"
+        self.dispatcher.device_handler = handler
+        self.dispatcher.COALESCE_WINDOW = 0.5
+
+    def tearDown(self):
+        discard_dispatcher()
+
+    def test_job_is_sent_once_per_row(self):
+        # 28 reels on 4 rows, submitted one by one
+        for row in ("A1", "A2", "B1", "B2"):
+            for lamp in range(1, 8):
+                self.dispatcher.submit("led_on", lamp=f"{row}-{lamp:03}", color="blue")
+        self.dispatcher.submit("led_off", lamp="A1-001")
+        self.assertTrue(self.dispatcher.wait_idle(timeout=5))
+
+        sent = self.dispatcher.device_handler.sent
+        self.assertEqual(sorted(address for address, frame in sent), [1, 2, 11, 12])
+        self.assertEqual(dict(sent)[1], {lamp: ("blue", False) for lamp in range(2, 8)})
+
+    def test_led_off_does_not_relight(self):
+        self.dispatcher.led_on("A1-001", "red")
+        self.dispatcher.led_off("A1-001")
+
+        self.assertEqual(
+            self.dispatcher.device_handler.sent, [(1, {1: ("red", False)}), (1, {})]
+        )
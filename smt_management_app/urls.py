@@ -172,6 +172,13 @@ urlpatterns.append(
         name="collect_carrier_cancel",
     )
 )
+urlpatterns.append(
+    path(
+        "collect_carriers_confirm_batch/",
+        views.collect_carriers_confirm_batch,
+        name="collect_carriers_confirm_batch",
+    )
+)
 
 urlpatterns.append(
     path(
@@ -239,6 +246,13 @@ urlpatterns.append(
     )
 )
 
+urlpatterns.append(
+    path(
+        "store_carriers_batch/",
+        views.store_carriers_batch,
+        name="store_carriers_batch",
+    )
+)
 urlpatterns.append(
     path(
         "store_carrier_choose_slot/<path:carrier_name>/<storage_name>/",
@@ -294,6 +308,14 @@ urlpatterns.append(
     )
 )
 
+urlpatterns.append(
+    path(
+        "health/",
+        views.shelf_health,
+        name="shelf_health",
+    )
+)
+
 
 ######### views ###########
 urlpatterns.append(
@@ -0,0 +1,133 @@
+"""
+Process wide scheduler for delayed LED effects ("green for 2 s, then off").
+
+One thread serves the delayed actions of every shelf. Effects are kept in a hashed
+timer wheel with TICK resolution: scheduling is an append to a bucket, a burst of
+scans adds entries instead of threads, and effects expiring in the same tick are
+handed to their dispatcher together so it can merge them into one device call.
+"""
+
+import math
+import threading
+import time
+
+
+class DelayedEffect:
+    """A dispatcher command waiting in the wheel, cancellable until its tick is due."""
+
+    __slots__ = ("dispatcher", "action", "kwargs", "lamps", "cancelled")
+
+    def __init__(self, dispatcher, action, kwargs, lamps):
+        self.dispatcher = dispatcher
+        self.action = action
+        self.kwargs = kwargs
+        self.lamps = lamps
+        self.cancelled = False
+
+
+class TimerWheel:
+    # seconds per bucket, the precision of the delays
+    TICK = 0.05
+    # buckets per revolution, delays longer than TICK * SLOTS wait for further rounds
+    SLOTS = 256
+
+    def __init__(self, tick=TICK, slots=SLOTS):
+        self.tick = tick
+        self._buckets = [[] for _ in range(slots)]
+        # (dispatcher, lamp) -> pending effects, for cancel()
+        self._by_lamp = {}
+        self._pending = 0
+        self._next_tick = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def schedule(self, dispatcher, delay, action, kwargs, lamps=()):
+        """
+        Hand action to dispatcher.run_effects() after delay seconds.
+
+        Args:
+            dispatcher: Object with a run_effects(effects) method
+            delay: Seconds from now
+            action: Dispatcher method name
+            kwargs: Keyword arguments of the method
+            lamps: Lamps the effect addresses, see cancel()
+
+        Returns:
+            DelayedEffect handle
+        """
+        effect = DelayedEffect(dispatcher, action, kwargs, list(lamps))
+        with self._condition:
+            if not self._pending:
+                # an idle wheel does not advance, continue from now
+                self._next_tick = int(time.monotonic() / self.tick)
+            tick = max(
+                math.ceil((time.monotonic() + delay) / self.tick), self._next_tick
+            )
+            self._buckets[tick % len(self._buckets)].append((tick, effect))
+            for lamp in effect.lamps:
+                self._by_lamp.setdefault((dispatcher, lamp), set()).add(effect)
+            self._pending += 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="led-timer-wheel", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+        return effect
+
+    def cancel(self, dispatcher, *lamps):
+        """Cancel the pending effects of dispatcher for the given lamps."""
+        with self._condition:
+            for lamp in lamps:
+                for effect in self._by_lamp.pop((dispatcher, lamp), ()):
+                    effect.cancelled = True
+
+    def _expire(self, tick):
+        """Remove and return the effects of tick that were not cancelled."""
+        bucket = self._buckets[tick % len(self._buckets)]
+        due = []
+        later = []
+        for entry in bucket:
+            entry_tick, effect = entry
+            if entry_tick > tick:
+                later.append(entry)
+                continue
+            self._pending -= 1
+            for lamp in effect.lamps:
+                lamp_effects = self._by_lamp.get((effect.dispatcher, lamp))
+                if lamp_effects:
+                    lamp_effects.discard(effect)
+                    if not lamp_effects:
+                        del self._by_lamp[(effect.dispatcher, lamp)]
+            if not effect.cancelled:
+                due.append(effect)
+        bucket[:] = later
+        return due
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if not self._pending:
+                        self._condition.wait()
+                        continue
+                    wait = self._next_tick * self.tick - time.monotonic()
+                    if wait > 0:
+                        self._condition.wait(wait)
+                        continue
+                    due = self._expire(self._next_tick)
+                    self._next_tick += 1
+                    if due:
+                        break
+
+            by_dispatcher = {}
+            for effect in due:
+                by_dispatcher.setdefault(effect.dispatcher, []).append(effect)
+            for dispatcher, effects in by_dispatcher.items():
+                try:
+                    dispatcher.run_effects(effects)
+                except Exception as e:
+                    print(f"Delayed LED effects failed: {e}")
+
+
+timer_wheel = TimerWheel()
@@ -0,0 +1,350 @@
+"""
+LED device service: one process owns every shelf connection and dispatcher queue,
+web workers forward their commands to it over a local socket.
+
+Without LED_SERVICE_ADDRESS in the settings nothing changes, get_dispatcher()
+returns the in-process dispatcher. With it set the web process gets a
+RemoteDispatcher with the same submit/submit_later/flash/cancel_pending/wait_idle API,
+so runserver, waitress or gunicorn can run several workers while the XGate bus,
+the NeoLight session and the PTL serial port stay opened exactly once.
+
+    python manage.py runscript led_service --script-args 127.0.0.1:8765
+
+Protocol: one JSON object per line over TCP on localhost (Windows has no unix
+sockets in the Python we deploy). Every request carries an id and gets exactly one
+reply {"id": ..., "ok": true, "result": ...} or {"id": ..., "ok": false,
+"error": ..., "type": ...}. Requests name the storage and send its fingerprint,
+the service reloads the Storage row only when the fingerprint changed.
+"""
+
+import json
+import socket
+import socketserver
+import threading
+
+from django.db import close_old_connections
+
+from ..models import Storage
+from . import led_shelf_dispatcher
+from .led_shelf_dispatcher import (
+    ShelfBackendUnavailable,
+    get_local_dispatcher,
+    storage_fingerprint,
+)
+
+CONNECT_TIMEOUT = 2
+# wait_idle blocks in the service, the reply may take that long on top
+REPLY_TIMEOUT = 10
+
+
+class LEDServiceUnavailable(ConnectionError):
+    """The LED service does not answer."""
+
+
+def parse_address(address):
+    host, _, port = str(address).rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def _restore_lamp_keys(kwargs):
+    # JSON object keys are strings, NeoLight and PTL lamps are ints
+    lights_dict = kwargs.get("lights_dict")
+    if isinstance(lights_dict, dict) and isinstance(lights_dict.get("lamps"), dict):
+        lights_dict["lamps"] = {
+            int(lamp) if lamp.isdigit() else lamp: color
+            for lamp, color in lights_dict["lamps"].items()
+        }
+    return kwargs
+
+
+class LEDServiceClient:
+    """
+    One persistent connection to the service, shared by the threads of a web
+    worker. Requests are tiny, they are sent one at a time under a lock.
+    """
+
+    def __init__(self, address, timeout=REPLY_TIMEOUT):
+        self.address = parse_address(address)
+        self.timeout = timeout
+        self._socket = None
+        self._file = None
+        self._lock = threading.Lock()
+        self._ids = 0
+
+    def _connect(self):
+        sock = socket.create_connection(self.address, timeout=CONNECT_TIMEOUT)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self.timeout)
+        self._socket = sock
+        self._file = sock.makefile("rwb")
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+    def _disconnect(self):
+        if self._socket is not None:
+            try:
+                self._file.close()
+                self._socket.close()
+            except OSError:
+                pass
+        self._socket = None
+        self._file = None
+
+    def request(self, op, **fields):
+        """
+        Send one request and wait for its reply.
+
+        A broken connection is reopened once, the service may have been restarted
+        since the last request.
+
+        Returns:
+            The result of the reply
+
+        Raises:
+            ShelfBackendUnavailable: the service could not load the device backend
+            LEDServiceUnavailable: the service does not answer
+            RuntimeError: any other error raised in the service
+        """
+        with self._lock:
+            self._ids += 1
+            line = json.dumps(dict(fields, id=self._ids, op=op)).encode() + b"\n"
+            for attempt in range(2):
+                try:
+                    if self._socket is None:
+                        self._connect()
+                    self._file.write(line)
+                    self._file.flush()
+                    reply = self._file.readline()
+                    if not reply:
+                        raise ConnectionResetError("LED service closed the connection")
+                    break
+                except OSError as e:
+                    self._disconnect()
+                    if attempt:
+                        raise LEDServiceUnavailable(
+                            f"LED service {self.address[0]}:{self.address[1]}: {e}"
+                        )
+        reply = json.loads(reply)
+        if reply["ok"]:
+            return reply.get("result")
+        if reply.get("type") == "ShelfBackendUnavailable":
+            raise ShelfBackendUnavailable(reply["error"])
+        raise RuntimeError(reply["error"])
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(address):
+    with _clients_lock:
+        client = _clients.get(address)
+        if client is None:
+            client = _clients[address] = LEDServiceClient(address)
+        return client
+
+
+def close_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+class RemoteDispatcher:
+    """
+    Stands in for LED_shelf_dispatcher in web workers, every call is forwarded to
+    the dispatcher of the same storage in the LED service.
+    """
+
+    def __init__(self, storage, client):
+        self.client = client
+        self.storage = storage
+        self.fingerprint = storage_fingerprint(storage)
+        self.device_type = storage.device
+        # builds the dispatcher in the service. A backend the service reports as
+        # missing raises ShelfBackendUnavailable, a service that is down does not
+        # fail the request, its commands are dropped like those of submit()
+        try:
+            self._request("connect")
+        except LEDServiceUnavailable as e:
+            print(f"{e}, {storage.name} not connected")
+
+    def _request(self, op, **fields):
+        return self.client.request(
+            op,
+            storage=self.storage.name,
+            fingerprint=list(self.fingerprint),
+            # the row of the service is not reloaded per request, see LEDService
+            slot_index_versions=[
+                getattr(self.storage, field, 0)
+                for field in Storage.SLOT_INDEX_VERSION_FIELDS
+            ],
+            **fields,
+        )
+
+    def submit(self, action, **kwargs):
+        try:
+            return self._request("submit", action=action, kwargs=kwargs)
+        except LEDServiceUnavailable as e:
+            print(f"{e}, dropped {action}")
+            return False
+
+    def submit_later(self, delay, action, **kwargs):
+        """The delayed command lives in the service, there is no local handle."""
+        try:
+            self._request("submit_later", delay=delay, action=action, kwargs=kwargs)
+        except LEDServiceUnavailable as e:
+            print(f"{e}, dropped delayed {action}")
+
+    def flash(self, lamp, color, duration=2):
+        """On and the delayed off in one round trip."""
+        try:
+            self._request("flash", lamp=lamp, color=color, duration=duration)
+        except LEDServiceUnavailable as e:
+            print(f"{e}, dropped flash of {lamp}")
+
+    def flash_lamps(self, lamps, color, duration=2):
+        lamps = list(lamps)
+        try:
+            self._request("flash_lamps", lamps=lamps, color=color, duration=duration)
+        except LEDServiceUnavailable as e:
+            print(f"{e}, dropped flash of {len(lamps)} lamps")
+
+    def cancel_pending(self, *lamps):
+        try:
+            self._request("cancel_pending", lamps=list(lamps))
+        except LEDServiceUnavailable as e:
+            print(f"{e}, pending commands of {len(lamps)} lamps not cancelled")
+
+    def wait_idle(self, timeout=None):
+        try:
+            return self._request("wait_idle", timeout=timeout)
+        except LEDServiceUnavailable as e:
+            print(e)
+            return False
+
+    @property
+    def health(self):
+        return self.client.request("health").get(self.storage.name)
+
+    def close(self):
+        """The service owns the device, dropping the proxy leaves it connected."""
+
+
+class LEDServiceHandler(socketserver.StreamRequestHandler):
+    """Serves the requests of one web worker connection until it closes."""
+
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        for line in self.rfile:
+            request = {}
+            try:
+                request = json.loads(line)
+                reply = {"ok": True, "result": self.server.service.handle(request)}
+            except ShelfBackendUnavailable as e:
+                reply = {
+                    "ok": False,
+                    "error": str(e),
+                    "type": "ShelfBackendUnavailable",
+                }
+            except Exception as e:
+                reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            finally:
+                # handler threads live as long as the connection, not a request
+                close_old_connections()
+            reply["id"] = request.get("id")
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+            self.wfile.flush()
+
+
+class LEDService:
+    """Executes requests against the local dispatchers of this process."""
+
+    def __init__(self):
+        self._storages = {}
+
+    def _dispatcher(self, request):
+        name = request["storage"]
+        storage = self._storages.get(name)
+        if storage is None or list(storage_fingerprint(storage)) != list(
+            request["fingerprint"]
+        ):
+            storage = self._storages[name] = Storage.objects.get(name=name)
+        # the web workers load the row per request, their slot index versions make
+        # the lamp group index of the service rebuild after a layout change
+        for field, version in zip(
+            Storage.SLOT_INDEX_VERSION_FIELDS, request.get("slot_index_versions", ())
+        ):
+            setattr(storage, field, max(getattr(storage, field), version))
+        return get_local_dispatcher(storage)
+
+    def handle(self, request):
+        op = request["op"]
+        if op == "health":
+            return led_shelf_dispatcher.get_local_shelf_health()
+        if op == "discard":
+            self._storages.pop(request.get("storage"), None)
+            led_shelf_dispatcher.discard_local_dispatcher(request.get("storage"))
+            return None
+        if op == "led_state":
+            led_shelf_dispatcher.notify_led_state(
+                request["storage"], request["slots"], request["state"]
+            )
+            return None
+
+        dispatcher = self._dispatcher(request)
+        match op:
+            case "connect":
+                return None
+            case "submit":
+                return dispatcher.submit(
+                    request["action"], **_restore_lamp_keys(request["kwargs"])
+                )
+            case "submit_later":
+                dispatcher.submit_later(
+                    request["delay"],
+                    request["action"],
+                    **_restore_lamp_keys(request["kwargs"]),
+                )
+                return None
+            case "flash":
+                dispatcher.flash(request["lamp"], request["color"], request["duration"])
+                return None
+            case "flash_lamps":
+                dispatcher.flash_lamps(
+                    request["lamps"], request["color"], request["duration"]
+                )
+                return None
+            case "cancel_pending":
+                dispatcher.cancel_pending(*request["lamps"])
+                return None
+            case "wait_idle":
+                return dispatcher.wait_idle(timeout=request.get("timeout"))
+        raise ValueError(f"unknown LED service op {op}")
+
+
+class LEDServiceServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        self.service = LEDService()
+        super().__init__(parse_address(address), LEDServiceHandler)
+
+    @property
+    def address(self):
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+
+
+def make_server(address="127.0.0.1:8765"):
+    """
+    Create the service server. It must run in a process that does not set
+    LED_SERVICE_ADDRESS itself, or that called
+    led_shelf_dispatcher.serve_devices_locally() before the first dispatcher.
+    """
+    return LEDServiceServer(address)
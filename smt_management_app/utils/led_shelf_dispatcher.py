@@ -1,17 +1,303 @@
 from gc import enable
+import logging
+import queue
 import re
+import threading
 import time
 from pprint import pprint as pp
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
 from ..models import StorageSlot
-from .shelf_handlers.neolight_handler import NeoLightAPI
-from .shelf_handlers.PTL_handler import PTL_API
-from .shelf_handlers.xgate_handler import XGateHandler
+from ..slot_index import get_lamp_group, get_lighthouse_zones, lighthouse_zone
+from .led_scheduler import timer_wheel
+from .shelf_shadow import ShelfShadow
+
+logger = logging.getLogger(__name__)
+
+# Device handler per Storage.device, imported when the first storage of that type is
+# used. Processes without Sophia shelfs never start the .NET runtime for XGate.
+DEVICE_HANDLERS = {
+    "NeoLight": "smt_management_app.utils.shelf_handlers.neolight_handler.NeoLightAPI",
+    "Sophia": "smt_management_app.utils.shelf_handlers.xgate_handler.XGateHandler",
+    "ATNPTL": "smt_management_app.utils.shelf_handlers.PTL_handler.PTL_API",
+    # ATNPTL storages with ATNPTL_transport "serial"
+    "ATNPTL serial": "smt_management_app.utils.shelf_handlers.ptl_serial_handler.PTL_SerialAPI",
+}
+
+# Storage fields that define how the device handler is connected. A change to any of
+# them means the warm dispatcher in the registry is stale and has to be rebuilt.
+DISPATCHER_FINGERPRINT_FIELDS = (
+    "device",
+    "capacity",
+    "ip_address",
+    "ip_port",
+    "COM_address",
+    "COM_baudrate",
+    "COM_timeout",
+    "ATNPTL_shelf_id",
+    "ATNPTL_transport",
+)
+
+# The worker only writes the lighthouse state of its storage. Saving just these
+# fields updates the existing row and never re-inserts a storage deleted meanwhile.
+LIGHTHOUSE_FIELDS = [
+    "lighthouse_A_green",
+    "lighthouse_A_yellow",
+    "lighthouse_B_green",
+    "lighthouse_B_yellow",
+]
+
+_dispatchers = {}
+_dispatcher_build_locks = {}
+_registry_lock = threading.Lock()
+# proxies to the LED service by storage name, see get_dispatcher
+_remote_dispatchers = {}
+_serving_devices = False
+
+
+class ShelfBackendUnavailable(Exception):
+    """The device handler of a storage cannot be loaded on this machine."""
+
+
+_handler_classes = {}
+_handler_errors = {}
+
+
+def device_handler_key(storage):
+    if storage.device == "ATNPTL" and storage.ATNPTL_transport == "serial":
+        return "ATNPTL serial"
+    return storage.device
+
+
+def load_device_handler(key, storage_name=None):
+    """
+    Import the device handler class registered for key.
+
+    A failed import is remembered, later storages of the same type fail fast
+    instead of starting the import (and possibly the .NET runtime) again.
+
+    Args:
+        key: DEVICE_HANDLERS key, see device_handler_key
+        storage_name: Optional storage name for the error message
+
+    Returns:
+        The handler class
+
+    Raises:
+        ShelfBackendUnavailable: If the backend cannot be imported
+    """
+    handler_class = _handler_classes.get(key)
+    if handler_class is not None:
+        return handler_class
+
+    prefix = f"Storage {storage_name}: " if storage_name else ""
+    if key not in _handler_errors:
+        try:
+            _handler_classes[key] = import_string(DEVICE_HANDLERS[key])
+            return _handler_classes[key]
+        except KeyError:
+            _handler_errors[key] = f"no device handler registered for {key}"
+        except Exception as e:
+            # pythonnet raises .NET exceptions for a missing Ptl.Device.dll
+            _handler_errors[key] = f"{key} backend could not be loaded: {e}"
+    raise ShelfBackendUnavailable(prefix + _handler_errors[key])
+
+
+def storage_fingerprint(storage):
+    return tuple(getattr(storage, field) for field in DISPATCHER_FINGERPRINT_FIELDS)
+
+
+def serve_devices_locally():
+    """
+    Called by the LED service process, its dispatchers always own the devices even
+    though it shares the settings with the web workers.
+    """
+    global _serving_devices
+    _serving_devices = True
+
+
+def led_service_address():
+    """Address of the LED service this process forwards to, None to drive devices here."""
+    if _serving_devices:
+        return None
+    return getattr(settings, "LED_SERVICE_ADDRESS", None)
+
+
+def get_dispatcher(storage):
+    """
+    Return the dispatcher for a storage.
+
+    With LED_SERVICE_ADDRESS set this is a RemoteDispatcher forwarding to the LED
+    service process, otherwise the warm in-process dispatcher of get_local_dispatcher.
+
+    Args:
+        storage: Storage instance, ideally freshly loaded by the caller
+
+    Returns:
+        LED_shelf_dispatcher or RemoteDispatcher bound to the given storage
+    """
+    address = led_service_address()
+    if address is None:
+        return get_local_dispatcher(storage)
+
+    from .led_service import RemoteDispatcher, get_client
+
+    with _registry_lock:
+        dispatcher = _remote_dispatchers.get(storage.name)
+    if dispatcher is None or dispatcher.fingerprint != storage_fingerprint(storage):
+        dispatcher = RemoteDispatcher(storage, get_client(address))
+        with _registry_lock:
+            _remote_dispatchers[storage.name] = dispatcher
+    else:
+        dispatcher.storage = storage
+    return dispatcher
+
+
+def get_local_dispatcher(storage):
+    """
+    Return the process-wide dispatcher for a storage.
+
+    Constructing a dispatcher connects the device handler (XGate bus setup, NeoLight
+    working lights, PTL bridge initialisation), which takes up to several seconds.
+    The registry keeps one warm dispatcher per storage and only rebuilds it when the
+    connection relevant fields of the Storage row changed.
+
+    Args:
+        storage: Storage instance, ideally freshly loaded by the caller
+
+    Returns:
+        LED_shelf_dispatcher bound to the given storage
+    """
+    with _registry_lock:
+        build_lock = _dispatcher_build_locks.setdefault(storage.name, threading.Lock())
+
+    # building is serialized per storage only, a slow Sophia bus does not block other shelfs
+    with build_lock:
+        dispatcher = _dispatchers.get(storage.name)
+        if dispatcher is None or dispatcher.fingerprint != storage_fingerprint(storage):
+            shadow = None
+            if dispatcher is not None:
+                dispatcher.close()
+                shadow = dispatcher.shadow.copy()
+            dispatcher = LED_shelf_dispatcher(storage, shadow=shadow)
+            _dispatchers[storage.name] = dispatcher
+        else:
+            # keep the lighthouse flags of the cached row up to date
+            dispatcher.storage = storage
+    return dispatcher
 
 
-class LED_shelf_dispatcher:
+def get_shelf_health():
+    """Return the connection health of every dispatcher in the registry by storage name."""
+    address = led_service_address()
+    if address is not None:
+        from .led_service import get_client
+
+        return get_client(address).request("health")
+    return get_local_shelf_health()
+
+
+def get_local_shelf_health():
+    with _registry_lock:
+        dispatchers = dict(_dispatchers)
+    return {
+        name: dict(dispatcher.health, device=dispatcher.device_type)
+        for name, dispatcher in dispatchers.items()
+    }
+
+
+def discard_dispatcher(storage_name=None):
+    """Drop the cached dispatcher of one storage, or of all storages if no name is given."""
+    address = led_service_address()
+    if address is not None:
+        from .led_service import get_client
 
-    def __init__(self, storage):
+        with _registry_lock:
+            if storage_name is None:
+                _remote_dispatchers.clear()
+            else:
+                _remote_dispatchers.pop(storage_name, None)
+        try:
+            get_client(address).request("discard", storage=storage_name)
+        except ConnectionError as e:
+            # a restarted service loads the storage from the database anyway
+            logger.warning("%s, %s not discarded in the LED service", e, storage_name)
+        return
+    discard_local_dispatcher(storage_name)
+
+
+def notify_led_state(storage_name, slots, state):
+    """
+    Tell the dispatcher of a storage that led_state of slots was written, it keeps
+    the selected slot counters of its lighthouse sides. Queued like a command, so
+    the lighthouse follows in order with the lamps of the same request.
+
+    A storage without a dispatcher yet needs nothing, its dispatcher loads the
+    selected slots from the database on first use.
+
+    Args:
+        storage_name: Name of the storage
+        slots: Slot names
+        state: The written led_state, 0 or 1
+    """
+    address = led_service_address()
+    if address is not None:
+        from .led_service import get_client
+
+        try:
+            get_client(address).request(
+                "led_state", storage=storage_name, slots=slots, state=state
+            )
+        except ConnectionError as e:
+            # a restarted service loads the selected slots from the database anyway
+            logger.warning("%s, led_state of %s not forwarded", e, storage_name)
+        return
+    with _registry_lock:
+        dispatcher = _dispatchers.get(storage_name)
+    if dispatcher is not None:
+        dispatcher.submit("led_state_changed", slots=slots, state=state)
+
+
+def discard_local_dispatcher(storage_name=None):
+    with _registry_lock:
+        if storage_name is None:
+            discarded = list(_dispatchers.values())
+            _dispatchers.clear()
+        else:
+            discarded = [_dispatchers.pop(storage_name, None)]
+    for dispatcher in discarded:
+        if dispatcher is not None:
+            dispatcher.close()
+
+
+class LED_shelf_dispatcher:
+    # bounded so a burst of scans blocks the producing request instead of piling up commands
+    COMMAND_QUEUE_SIZE = 256
+    SUBMIT_TIMEOUT = 5
+    # NeoLight can switch many lamps with one request, commands arriving within this
+    # many seconds are merged into one /api/open and one api/close call
+    COALESCE_WINDOW = 0.02
+    COALESCED_DEVICES = ("NeoLight", "Sophia")
+    COALESCED_ACTIONS = (
+        "led_on",
+        "led_off",
+        "_LED_On_Control",
+        "_LED_Off_Control",
+        "led_state_changed",
+    )
+    # status lights follow the selected slots, see enable_working_lights_based_on_led_state
+    WORKING_LIGHT_DEVICES = ("NeoLight", "Dummy")
+    # see test_leds, every color is on for TEST_LEDS_ON_TIME seconds per cycle
+    TEST_LEDS_CYCLES = 5
+    TEST_LEDS_COLORS = ("red", "green", "yellow")
+    TEST_LEDS_ON_TIME = 1
+
+    def __init__(self, storage, shadow=None):
         self.storage = storage
+        self.fingerprint = storage_fingerprint(storage)
         self.device_type = storage.device
         self.ip_address = None
         self.ip_port = None
@@ -20,16 +306,71 @@ class LED_shelf_dispatcher:
         self.COM_timeout = None
         self.ATNPTL_shelf_id = None
         self.device_handler = None
+        # desired and acknowledged lamp state, a rebuilt dispatcher takes it over
+        self.shadow = shadow or ShelfShadow()
+        self._connection_epoch = None
+        # slots with led_state 1 mapped to their lighthouse side and the count per
+        # side, loaded from the database on first use, then kept by led_state_changed
+        self._selected_slots = None
+        self._selected_counts = {"A": 0, "B": 0}
+        self._zones = None
+
+        handler_class = None
+        if self.device_type != "Dummy":
+            handler_class = load_device_handler(
+                device_handler_key(storage), storage_name=storage.name
+            )
+
+        # every device action of this shelf runs on one worker thread in submission order
+        self._commands = queue.Queue(maxsize=self.COMMAND_QUEUE_SIZE)
+        self._stopped = False
+        self._worker = threading.Thread(
+            target=self._run_worker,
+            name=f"led-dispatcher-{storage.name}",
+            daemon=True,
+        )
+
+        # state, error and init_duration of the device connection, see get_shelf_health
+        self.health = {"state": "connecting", "error": None, "init_duration": None}
+        self._handler_class = handler_class
+        if self.device_type == "Dummy":
+            self.enable_working_lights_based_on_led_state()
+            self.health.update(state="ready", init_duration=0)
+        else:
+            # connecting takes seconds (XGate bus setup, PTL bridge retries), as the
+            # first job of the worker it delays this shelf's commands, not the caller
+            self._commands.put(("_connect", {}))
+        self._worker.start()
 
+    def _connect(self):
+        started = time.monotonic()
+        try:
+            self._connect_device()
+        except Exception as e:
+            logger.warning("Connecting %s failed: %s", self.storage.name, e)
+            self.health.update(state="failed", error=str(e))
+        else:
+            if getattr(self.device_handler, "connected", True) is False:
+                self.health.update(state="failed", error="device not connected")
+            else:
+                self.health.update(state="ready", error=None)
+        finally:
+            self.health["init_duration"] = round(time.monotonic() - started, 3)
+        if self.health["state"] == "ready":
+            # lamps taken over from the dispatcher this one replaced
+            self._reconcile()
+
+    def _connect_device(self):
+        storage = self.storage
         match self.device_type:
             case "ATNPTL":
                 # ATNPTL has no workinglight/lighthouse
-                # ATNPTL has no interface to switch multiple lights at once
+                # ATNPTL switches multiple lights through the bridge batch endpoint
                 self.COM_address = storage.COM_address
                 self.ATNPTL_shelf_id = storage.ATNPTL_shelf_id
                 self.COM_baudrate = storage.COM_baudrate
                 self.COM_timeout = storage.COM_timeout
-                self.device_handler = PTL_API(
+                self.device_handler = self._handler_class(
                     port=self.COM_address,
                     baudrate=self.COM_baudrate,
                     timeout=self.COM_timeout,
@@ -39,7 +380,7 @@ class LED_shelf_dispatcher:
                 # NeoLight has an interface to switch multiple lights at once
                 self.ip_address = storage.ip_address
                 self.ip_port = storage.ip_port
-                self.device_handler = NeoLightAPI(
+                self.device_handler = self._handler_class(
                     ip=self.ip_address, port=self.ip_port
                 )  # 192.168.178.11 weytronik
 
@@ -49,346 +390,543 @@ class LED_shelf_dispatcher:
                 # Sophia PROBABLY has no interface to switch multiple lights at once, recheck docs
                 # for now we treat Sophia as single command switch
                 self.ip_address = storage.ip_address
-                self.device_handler = XGateHandler(
+                self.device_handler = self._handler_class(
                     xgate_address=self.ip_address
                 )  # 192.168.0.10 siemens AT
                 self._LED_On_Control(
                     lights_dict={"status": {"A": "green", "B": "green"}}
                 )
-            case "Dummy":
-                self.enable_working_lights_based_on_led_state()
 
-    def enable_working_lights_based_on_led_state(self):
-        enabled_leds = StorageSlot.objects.filter(storage=self.storage, led_state=1)
-
-        if enabled_leds:
-
-            if (
-                all(led.name <= (self.storage.capacity // 2) for led in enabled_leds)
-                and self.storage.lighthouse_B_yellow
-            ):
-                self.storage.lighthouse_B_yellow = False
-                self.storage.save()
-                self.lighthouse_off_control(statusB=True)
-            if (
-                all(led.name > (self.storage.capacity // 2) for led in enabled_leds)
-                and self.storage.lighthouse_A_yellow
-            ):
-                self.storage.lighthouse_A_yellow = False
-                self.storage.save()
-                self.lighthouse_off_control(statusA=True)
-
-            if (
-                any(led.name <= (self.storage.capacity // 2) for led in enabled_leds)
-                and not self.storage.lighthouse_A_yellow
-            ):
-                self.storage.lighthouse_A_yellow = True
-                self.storage.save()
-                self.lighthouse_on_control(lights_dict={"status": {"A": "yellow"}})
-            if (
-                any(led.name > (self.storage.capacity // 2) for led in enabled_leds)
-                and not self.storage.lighthouse_B_yellow
-            ):
-                self.storage.lighthouse_B_yellow = True
-                self.storage.save()
-                self.lighthouse_on_control(lights_dict={"status": {"B": "yellow"}})
+    @staticmethod
+    def _lamps_of(kwargs):
+        """Return the lamps a command addresses, used to cancel pending delayed actions."""
+        lamps = []
+        if kwargs.get("lamp") is not None:
+            lamps.append(kwargs["lamp"])
+        lamps.extend(kwargs.get("lamps", None) or [])
+        lights_dict = kwargs.get("lights_dict", None) or {}
+        lamps.extend((lights_dict.get("lamps", None) or {}).keys())
+        return lamps
+
+    def submit(self, action, **kwargs):
+        """
+        Queue a dispatcher method for execution on the shelf worker.
 
-        else:
-            self.lighthouse_off_control()
-            self.storage.lighthouse_A_green = False
-            self.storage.lighthouse_B_green = False
-            self.storage.lighthouse_A_yellow = False
-            self.storage.lighthouse_B_yellow = False
-            self.storage.save()
-        if not (self.storage.lighthouse_A_green and self.storage.lighthouse_B_green):
-            self.lighthouse_on_control()
-            self.storage.lighthouse_A_green = True
-            self.storage.lighthouse_B_green = True
-            self.storage.save()
+        Commands run strictly in submission order. Pending delayed actions for the
+        lamps addressed by this command are cancelled, so e.g. a scheduled green->off
+        can not switch off a lamp that a later request turned on again.
 
-    def lighthouse_on_control(
-        self, lights_dict={"status": {"A": "green", "B": "green"}}
-    ):
+        Args:
+            action: Name of the dispatcher method, e.g. "led_on" or "_LED_On_Control"
+            **kwargs: Keyword arguments passed to the method
+
+        Returns:
+            bool: False if the queue stayed full for SUBMIT_TIMEOUT seconds
+        """
+        self.cancel_pending(*self._lamps_of(kwargs))
+        try:
+            self._commands.put((action, kwargs), timeout=self.SUBMIT_TIMEOUT)
+        except queue.Full:
+            logger.warning(
+                "LED command queue of %s is full, dropped %s", self.storage.name, action
+            )
+            return False
+        return True
+
+    def submit_later(self, delay, action, **kwargs):
+        """
+        Queue a dispatcher method to run after delay seconds, e.g. switching a
+        confirmation light off again. Cancelled by cancel_pending() or by a later
+        submit() for the same lamp.
+
+        Returns:
+            DelayedEffect handle of the process wide timer wheel
+        """
+        return timer_wheel.schedule(self, delay, action, kwargs, self._lamps_of(kwargs))
+
+    def flash(self, lamp, color, duration=2):
+        """Switch lamp to color and off again after duration seconds."""
+        if self.submit("led_on", lamp=lamp, color=color):
+            self.submit_later(duration, "led_off", lamp=lamp)
+
+    def flash_lamps(self, lamps, color, duration=2):
+        """
+        Switch several lamps to color with one command and off again together
+        after duration seconds, e.g. confirming a cart of carriers.
+        """
+        lamps = list(lamps)
+        if lamps and self.submit(
+            "_LED_On_Control", lights_dict={"lamps": {lamp: color for lamp in lamps}}
+        ):
+            self.submit_later(duration, "_LED_Off_Control", lamps=lamps)
+
+    def cancel_pending(self, *lamps):
+        """Cancel all delayed actions that are still pending for the given lamps."""
+        timer_wheel.cancel(self, *lamps)
+
+    def run_effects(self, effects):
+        """
+        Called by the timer wheel with the effects of this shelf that expired in
+        the same tick. Several lamps going off become one _LED_Off_Control.
+        """
+        if self._stopped:
+            return
+        commands = [(effect.action, effect.kwargs) for effect in effects]
+        if len(commands) > 1 and all(action == "led_off" for action, _ in commands):
+            lamps = [kwargs["lamp"] for _, kwargs in commands]
+            commands = [("_LED_Off_Control", {"lamps": lamps})]
+        for index, command in enumerate(commands):
+            try:
+                self._commands.put_nowait(command)
+            except queue.Full:
+                # retry on the next tick instead of blocking the other shelfs
+                for action, kwargs in commands[index:]:
+                    self.submit_later(timer_wheel.tick, action, **kwargs)
+                return
+
+    def wait_idle(self, timeout=None):
+        """Block until all immediately queued commands have been executed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._commands.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self):
+        """Stop the worker after the already queued commands."""
+        self._stopped = True
+        try:
+            self._commands.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _run_worker(self):
+        held = None
+        while True:
+            if self._stopped and held is None and self._commands.empty():
+                return
+
+            if held is None:
+                held = self._commands.get()
+            command, held = held, None
+
+            batch = [command] if command is not None else []
+            if batch and self._is_coalescable(command[0]):
+                held = self._collect_batch(batch)
+            try:
+                if len(batch) > 1:
+                    self._execute_batch(batch)
+                elif batch:
+                    self._execute(*command)
+            finally:
+                for _ in batch or [None]:
+                    self._commands.task_done()
+
+    def _is_coalescable(self, action):
+        return (
+            self.device_type in self.COALESCED_DEVICES
+            and action in self.COALESCED_ACTIONS
+        )
+
+    def _collect_batch(self, batch):
+        """
+        Drain further coalescable commands arriving within COALESCE_WINDOW into batch.
+
+        Returns:
+            The first non coalescable command, to be executed after the batch, or None
+        """
+        deadline = time.monotonic() + self.COALESCE_WINDOW
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                command = self._commands.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if command is None:
+                # wake up from close(), nothing to execute
+                self._commands.task_done()
+            elif self._is_coalescable(command[0]):
+                batch.append(command)
+            else:
+                return command
+
+    def _execute_batch(self, batch):
+        try:
+            self._LED_batch_control(batch)
+        except Exception as e:
+            logger.exception(
+                "LED batch of %s commands failed on %s: %s",
+                len(batch),
+                self.storage.name,
+                e,
+            )
+        finally:
+            close_old_connections()
+
+    def _LED_batch_control(self, batch):
+        """
+        Merge queued on/off/colour commands into one shadow update, the device gets
+        one /api/open and one api/close call (one frame diff on XGate).
+        The last command for a lamp (or status light) wins.
+        """
+        lamp_colors = {}
+        status_colors = {}
+
+        for action, kwargs in batch:
+            match action:
+                case "led_on":
+                    for lamp_name in self._get_all_slot_names_for_lamp(kwargs["lamp"]):
+                        lamp_colors[lamp_name] = kwargs["color"]
+                case "led_off":
+                    for lamp_name in self._get_all_slot_names_for_lamp(kwargs["lamp"]):
+                        lamp_colors[lamp_name] = None
+                case "_LED_On_Control":
+                    lights_dict = kwargs["lights_dict"]
+                    lamps = lights_dict.get("lamps", None) or {}
+                    if kwargs.get("expanded", False):
+                        lamp_colors.update(lamps)
+                    else:
+                        for lamp, color in lamps.items():
+                            for lamp_name in self._get_all_slot_names_for_lamp(lamp):
+                                lamp_colors[lamp_name] = color
+                    status_colors.update(lights_dict.get("status", None) or {})
+                case "_LED_Off_Control":
+                    for lamp in kwargs.get("lamps", None) or []:
+                        for lamp_name in self._get_all_slot_names_for_lamp(lamp):
+                            lamp_colors[lamp_name] = None
+                    for side in ("A", "B"):
+                        if kwargs.get(f"status{side}", False):
+                            status_colors[side] = None
+                case "led_state_changed":
+                    self._count_selected(kwargs["slots"], kwargs["state"])
+
+        self._update(lamp_colors, status_colors)
+
+    def _update(self, lamp_colors=None, status=None):
+        """
+        Write lamp colors and status lights (None switches off) into the shadow and
+        push what changed to the device.
+        """
+        self.shadow.set_lamps(lamp_colors or {})
+        self.shadow.set_status(status or {})
+        if self.device_type in self.WORKING_LIGHT_DEVICES:
+            self.enable_working_lights_based_on_led_state()
+        self._reconcile()
+
+    def _reconcile(self):
+        """Push the difference between the desired and the acknowledged shelf state."""
+        epoch = getattr(self.device_handler, "connection_epoch", None)
+        if epoch != self._connection_epoch:
+            # the controller may have rebooted, it gets the full desired state
+            if self._connection_epoch is not None:
+                logger.info("%s reconnected, reapplying its lamps", self.storage.name)
+            self.shadow.resync()
+            self._connection_epoch = epoch
+
+        diff = self.shadow.diff()
+        if not any(diff):
+            return
+        # lamps the device did not acknowledge stay in the diff of the next reconcile
+        acked = self._push(*diff)
+        self.shadow.acknowledge(*acked)
+        lamps_on, lamps_off, status_on, status_off = acked
+        if (status_on or status_off) and self.device_type != "ATNPTL":
+            self._persist_lighthouse()
+
+    def _push(self, lamps_on, lamps_off, status_on, status_off):
+        """
+        Send one diff to the device, at most one call per direction.
+
+        Returns:
+            tuple: The part of the diff the device accepted, same layout as the diff
+        """
         match self.device_type:
             case "ATNPTL":
-                print("ATNPTL has no lighthouse")
+                # all frames of a direction go out in one bridge request. Their
+                # acks only echo shelf and command, the same for every frame, so
+                # with one ack missing nobody knows which lamp did not switch and
+                # the whole direction stays in the diff
+                if lamps_on:
+                    acks = self.device_handler.leds_on(
+                        shelf=self.ATNPTL_shelf_id, lamps=lamps_on
+                    )
+                    if not self._all_acked(acks, lamps_on):
+                        lamps_on = {}
+                if lamps_off:
+                    acks = self.device_handler.leds_off(
+                        shelf=self.ATNPTL_shelf_id, lamps=lamps_off
+                    )
+                    if not self._all_acked(acks, lamps_off):
+                        lamps_off = []
+                if status_on or status_off:
+                    logger.debug("ATNPTL has no lighthouse/status lights")
             case "NeoLight":
-                self.device_handler._LED_On_Control(lights_dict=lights_dict)
+                lights_dict = {}
+                if lamps_on:
+                    lights_dict["lamps"] = lamps_on
+                if status_on:
+                    lights_dict["status"] = status_on
+                if lights_dict:
+                    self.device_handler._LED_On_Control(lights_dict=lights_dict)
+                if lamps_off or status_off:
+                    self.device_handler._LED_Off_Control(
+                        lamps=lamps_off,
+                        statusA="A" in status_off,
+                        statusB="B" in status_off,
+                    )
             case "Sophia":
-                workinglight_dictionary = lights_dict.get("status", None)
-                lamps_dictionary = lights_dict.get("lamps", None)
-                if workinglight_dictionary:
+                # one frame diff over all rows instead of an on and an off pass
+                if lamps_on or lamps_off:
+                    lamp_colors = dict(lamps_on)
+                    lamp_colors.update({lamp: "off" for lamp in lamps_off})
+                    self._xgate_set_lamps(lamp_colors)
+                if status_on:
                     self.device_handler.light_house_on(mode="normal")
-                if lamps_dictionary:
-                    for lamp, color in lamps_dictionary.items():
-                        self.led_on(lamp=lamp, color=color)
+                if status_off:
+                    self.device_handler.clear_lhs()
             case "Dummy":
-                print(f"LIGHTHOUSE ON {self.storage.name}")
-                pp(lights_dict)
+                if lamps_on or status_on:
+                    print(f"LED ON {self.storage.name}")
+                    pp({"lamps": lamps_on, "status": status_on})
+                if lamps_off or status_off:
+                    print(f"LED OFF {self.storage.name}")
+                    pp({"lamps": lamps_off, "status": status_off})
+        return lamps_on, lamps_off, status_on, status_off
+
+    @staticmethod
+    def _all_acked(acks, lamps):
+        return len(acks or []) == len(lamps) and None not in acks
+
+    def _persist_lighthouse(self):
+        """Store the acknowledged status lights in the lighthouse fields, in one save."""
+        changed = []
+        for side in ("A", "B"):
+            for color in ("green", "yellow"):
+                field = f"lighthouse_{side}_{color}"
+                value = self.shadow.acked_status.get(side) == color
+                if getattr(self.storage, field) != value:
+                    setattr(self.storage, field, value)
+                    changed.append(field)
+        if changed:
+            self.storage.save(update_fields=changed)
+
+    def _execute(self, action, kwargs):
+        try:
+            getattr(self, action)(**kwargs)
+        except Exception as e:
+            logger.exception(
+                "LED command %s %s failed on %s: %s",
+                action,
+                kwargs,
+                self.storage.name,
+                e,
+            )
+        finally:
+            # the worker thread outlives requests, do not leak its db connection
+            close_old_connections()
+
+    def enable_working_lights_based_on_led_state(self):
+        """
+        Status light of each side: yellow while a slot on that side is selected
+        (led_state 1), green otherwise. Served from the selected slot counters, the
+        device and the storage row only see a side going from or to zero.
+        """
+        self._count_selected()
+        self.shadow.set_status(
+            {
+                side: "yellow" if count else "green"
+                for side, count in self._selected_counts.items()
+            }
+        )
+        self._reconcile()
+
+    def led_state_changed(self, slots, state):
+        """Command queued by notify_led_state."""
+        if self.device_type not in self.WORKING_LIGHT_DEVICES:
+            return
+        self._count_selected(slots, state)
+        self.enable_working_lights_based_on_led_state()
+
+    def _count_selected(self, slots=(), state=0):
+        """Add (state 1) or remove slots from the selected slot counters, O(1) per slot."""
+        if self.device_type not in self.WORKING_LIGHT_DEVICES:
+            return
+        zones = get_lighthouse_zones(self.storage)
+        if self._selected_slots is None:
+            # already contains the slots of a notification arriving first
+            self._zones = zones
+            self._selected_slots = {}
+            slots = StorageSlot.objects.filter(
+                storage=self.storage, led_state=1
+            ).values_list("name", flat=True)
+            state = 1
+        elif zones is not self._zones:
+            # slots were added, renamed or the capacity changed
+            self._zones = zones
+            selected = list(self._selected_slots)
+            self._selected_slots = {}
+            self._selected_counts = {"A": 0, "B": 0}
+            self._count_selected(selected, 1)
+
+        for name in slots:
+            if state:
+                if name not in self._selected_slots:
+                    side = lighthouse_zone(self.storage, name, zones)
+                    self._selected_slots[name] = side
+                    self._selected_counts[side] += 1
+            else:
+                side = self._selected_slots.pop(name, None)
+                if side is not None:
+                    self._selected_counts[side] -= 1
+
+    def lighthouse_on_control(
+        self, lights_dict={"status": {"A": "green", "B": "green"}}
+    ):
+        self.shadow.set_lamps(
+            {
+                lamp_name: color
+                for lamp, color in (lights_dict.get("lamps", None) or {}).items()
+                for lamp_name in self._get_all_slot_names_for_lamp(lamp)
+            }
+        )
+        self.shadow.set_status(lights_dict.get("status", None) or {})
+        self._reconcile()
 
     def lighthouse_off_control(self, statusA=True, statusB=True):
-        match self.device_type:
-            case "ATNPTL":
-                print("ATNPTL has no lighthouse")
-            case "NeoLight":
-                self.device_handler._LED_Off_Control(statusA=statusA, statusB=statusB)
-            case "Sophia":
-                pass
-            case "Dummy":
-                print(f"LIGHTHOUSE LED OFF {self.storage.name} {statusA=} {statusB=}")
+        self.shadow.set_status(
+            {side: None for side, off in (("A", statusA), ("B", statusB)) if off}
+        )
+        self._reconcile()
 
-    def test_leds(self):
+    def test_leds(self, step=0):
         """
         Test all LEDs by cycling through all colors for all slots 5 times.
         Each hardware type is handled according to its specific requirements.
+
+        Every call runs one step, on or off for one color, and schedules the next
+        one on the timer wheel, so the worker keeps serving the shelf meanwhile.
         """
         # Get all slots for this storage from the database
-        all_slots = StorageSlot.objects.filter(storage=self.storage)
-
-        # Define colors to cycle through
-        colors = ["red", "green", "yellow"]
+        all_slots = list(
+            StorageSlot.objects.filter(storage=self.storage).values_list(
+                "name", flat=True
+            )
+        )
+        steps = 2 * self.TEST_LEDS_CYCLES * len(self.TEST_LEDS_COLORS)
+
+        if step == 0:
+            self._test_leds_reset()
+            logger.info(
+                "Testing LEDs for %s, %s slots", self.storage.name, len(all_slots)
+            )
+        if step == steps:
+            self._test_leds_reset()
+            logger.info("LED testing of %s completed", self.storage.name)
+            # the test switched the lamps behind the shadow, show the desired state again
+            self.shadow.resync()
+            self._reconcile()
+            return
+
+        color = self.TEST_LEDS_COLORS[step // 2 % len(self.TEST_LEDS_COLORS)]
+        if step % 2 == 0:
+            self._test_leds_on(all_slots, color)
+            # keep the color visible before switching off
+            self.submit_later(self.TEST_LEDS_ON_TIME, "test_leds", step=step + 1)
+        else:
+            self._test_leds_off(all_slots)
+            self.submit_later(0, "test_leds", step=step + 1)
 
-        # Cycle 5 times
+    def _test_leds_reset(self):
         match self.device_type:
             case "ATNPTL":
-                # Reset all LEDs before starting
-                self.device_handler.reset_leds(shelf=self.ATNPTL_shelf_id)
-
-                for cycle in range(5):
-                    for color in colors:
-                        # Turn on all slots with current color
-                        for slot in all_slots:
-                            time.sleep(1)
-                            self.device_handler.led_on(
-                                shelf=self.ATNPTL_shelf_id, lamp=slot.name, color=color
-                            )
-
-                        # Wait a bit to make the effect visible
-                        import time
-
-                        time.sleep(1)
-
-                        # Turn off all slots
-                        for slot in all_slots:
-                            self.device_handler.led_off(
-                                slot.name, shelf=self.ATNPTL_shelf_id
-                            )
-
-                # Reset all LEDs after testing
-                self.device_handler.reset_leds(shelf=self.ATNPTL_shelf_id)
-
+                self.device_handler.reset_leds(controller=self.ATNPTL_shelf_id)
             case "NeoLight":
-                # Reset all LEDs before starting
-                self.device_handler.reset_leds(working_light=True)
-
-                for cycle in range(5):
-                    for color in colors:
-                        # Turn on all slots with current color
-                        for slot in all_slots:
-                            self.device_handler.led_on(slot.name, color)
-
-                        # Wait a bit to make the effect visible
-                        import time
-
-                        time.sleep(1)
-
-                        # Turn off all slots
-                        for slot in all_slots:
-                            self.device_handler.led_off(slot.name)
-
-                # Reset all LEDs after testing
                 self.device_handler.reset_leds(working_light=True)
                 self.enable_working_lights_based_on_led_state()
-
             case "Sophia":
-                # Reset all LEDs before starting
-                self.device_handler.clear_leds()
-                self.device_handler.clear_lhs()
-
-                for cycle in range(5):
-                    for color in colors:
-                        # Turn on all slots with current color
-                        for slot in all_slots:
-                            row, led = self._xgate_slot_to_row_led(slot.name)
-                            self.device_handler.switch_lights(
-                                address=row, lamp=led, col=color, blink=False
-                            )
-
-                        # Wait a bit to make the effect visible
-                        import time
-
-                        time.sleep(1)
-
-                        # Turn off all slots (using "off" color)
-                        for slot in all_slots:
-                            row, led = self._xgate_slot_to_row_led(slot.name)
-                            self.device_handler.switch_lights(
-                                address=row, lamp=led, col="off", blink=False
-                            )
-
-                # Reset all LEDs after testing
                 self.device_handler.clear_leds()
                 self.device_handler.clear_lhs()
                 self._LED_On_Control(
                     lights_dict={"status": {"A": "green", "B": "green"}}
                 )
-
             case "Dummy":
-                print(f"Testing LEDs for {self.storage.name}")
-                print(f"Found {len(all_slots)} slots to test")
-                print(f"Colors to test: {colors}")
-
-                for cycle in range(5):
-                    print(f"Starting test cycle {cycle + 1}/5")
-
-                    for color in colors:
-                        print(f"Testing color: {color}")
-
-                        # Turn on all slots with current color
-                        for slot in all_slots:
-                            print(f"led on {self.storage.name} {slot.name=} ; {color=}")
-
-                        # Wait a bit to make the effect visible
-                        import time
-
-                        time.sleep(1)
-
-                        # Turn off all slots
-                        for slot in all_slots:
-                            print(f"led off {self.storage.name} {slot.name=}")
-
-                    print(f"Completed test cycle {cycle + 1}/5")
-
-                print("LED testing completed")
                 self.enable_working_lights_based_on_led_state()
 
-    def _get_all_slot_names_for_lamp(self, lamp):
-        """For a given lamp number, return all lamp numbers that should be controlled"""
-        # First check if this is a primary slot
-        try:
-            slot = StorageSlot.objects.get(storage=self.storage, name=lamp)
-            return slot.get_all_slot_names()
-        except StorageSlot.DoesNotExist:
-            # This might be a related slot, find the primary
-            all_slots = StorageSlot.objects.filter(storage=self.storage)
-            for slot in all_slots:
-                if lamp in slot.related_names:
-                    return slot.get_all_slot_names()
-        # If not found anywhere, just return the lamp itself
-        return [lamp]
-
-    def led_on(self, lamp, color):
-        # Get all related lamps for combined slots
-        all_lamps = self._get_all_slot_names_for_lamp(lamp)
-
+    def _test_leds_on(self, lamps, color):
         match self.device_type:
             case "ATNPTL":
-                print(
-                    f"led on {self.storage.name} with ID {self.ATNPTL_shelf_id} {lamp=} (all: {all_lamps}) ; {color=}"
+                self.device_handler.leds_on(
+                    shelf=self.ATNPTL_shelf_id, lamps={lamp: color for lamp in lamps}
                 )
-                for lamp_name in all_lamps:
-                    self.device_handler.led_on(
-                        lamp=lamp_name, color=color, shelf=self.ATNPTL_shelf_id
-                    )
             case "NeoLight":
-                for lamp_name in all_lamps:
-                    self.device_handler.led_on(lamp_name, color)
-                self.enable_working_lights_based_on_led_state()
+                for lamp in lamps:
+                    self.device_handler.led_on(lamp, color)
             case "Sophia":
-                for lamp_name in all_lamps:
-                    row, led = self._xgate_slot_to_row_led(lamp_name)
-                    self.device_handler.switch_lights(
-                        address=row, lamp=led, col=color, blink=False
-                    )
+                self._xgate_set_lamps({lamp: color for lamp in lamps})
             case "Dummy":
-                print(
-                    f"led on {self.storage.name} {lamp=} (all: {all_lamps}) ; {color=}"
-                )
-                self.enable_working_lights_based_on_led_state()
-
-    def led_off(self, lamp):
-        # Get all related lamps for combined slots
-        all_lamps = self._get_all_slot_names_for_lamp(lamp)
+                for lamp in lamps:
+                    print(f"led on {self.storage.name} {lamp=} ; {color=}")
 
+    def _test_leds_off(self, lamps):
         match self.device_type:
             case "ATNPTL":
-                for lamp_name in all_lamps:
-                    self.device_handler.led_off(
-                        lamp=lamp_name, shelf=self.ATNPTL_shelf_id
-                    )
+                self.device_handler.leds_off(shelf=self.ATNPTL_shelf_id, lamps=lamps)
             case "NeoLight":
-                for lamp_name in all_lamps:
-                    self.device_handler.led_off(lamp_name)
-                self.enable_working_lights_based_on_led_state()
+                for lamp in lamps:
+                    self.device_handler.led_off(lamp)
             case "Sophia":
-                for lamp_name in all_lamps:
-                    self.led_on(lamp_name, "off")
+                # Turn off all slots (using "off" color)
+                self._xgate_set_lamps({lamp: "off" for lamp in lamps})
             case "Dummy":
-                print(f"led off {self.storage.name} {lamp=} (all: {all_lamps})")
-                self.enable_working_lights_based_on_led_state()
+                for lamp in lamps:
+                    print(f"led off {self.storage.name} {lamp=}")
+
+    def _get_all_slot_names_for_lamp(self, lamp):
+        """For a given lamp number, return all lamp numbers that should be controlled"""
+        # served from the per storage lamp group index, no query per lamp
+        return get_lamp_group(self.storage, lamp)
+
+    def led_on(self, lamp, color):
+        # Get all related lamps for combined slots
+        all_lamps = self._get_all_slot_names_for_lamp(lamp)
+        self._update({lamp_name: color for lamp_name in all_lamps})
+
+    def led_off(self, lamp):
+        # Get all related lamps for combined slots
+        all_lamps = self._get_all_slot_names_for_lamp(lamp)
+        self._update({lamp_name: None for lamp_name in all_lamps})
 
-    def _LED_On_Control(self, lights_dict):
-        # Expand lamps dict to include related slots
-        if "lamps" in lights_dict:
+    def _LED_On_Control(self, lights_dict, expanded=False):
+        """
+        Args:
+            lights_dict: {"lamps": {lamp: color}, "status": {side: color}}
+            expanded: The lamps already contain every lamp of their combined
+                groups (e.g. resolved by the caller's slot query), skip the lookup
+        """
+        lamps = lights_dict.get("lamps", None) or {}
+        if expanded:
+            expanded_lamps = dict(lamps)
+        else:
+            # Expand lamps dict to include related slots
             expanded_lamps = {}
-            for lamp, color in lights_dict["lamps"].items():
-                all_lamps = self._get_all_slot_names_for_lamp(lamp)
-                for lamp_name in all_lamps:
+            for lamp, color in lamps.items():
+                for lamp_name in self._get_all_slot_names_for_lamp(lamp):
                     expanded_lamps[lamp_name] = color
-            lights_dict = lights_dict.copy()
-            lights_dict["lamps"] = expanded_lamps
-
-        match self.device_type:
-            case "ATNPTL":
-                if "lamps" in lights_dict:
-                    for lamp, color in lights_dict["lamps"].items():
-                        self.led_on(lamp=lamp, color=color)
-                # Fixed: Handle status lights properly
-                if "status" in lights_dict:
-                    print(f"ATNPTL has no lighthouse/status lights")
-            case "NeoLight":
-                self.device_handler._LED_On_Control(lights_dict=lights_dict)
-                self.enable_working_lights_based_on_led_state()
-            case "Sophia":
-                workinglight_dictionary = lights_dict.get("status", None)
-                lamps_dictionary = lights_dict.get("lamps", None)
-                if workinglight_dictionary:
-                    self.device_handler.light_house_on(mode="normal")
-                if lamps_dictionary:
-                    for lamp, color in lamps_dictionary.items():
-                        self.led_on(lamp=lamp, color=color)
-            case "Dummy":
-                print(f"LED ON {self.storage.name}")
-                pp(lights_dict)
-                self.enable_working_lights_based_on_led_state()
+        self._update(expanded_lamps, lights_dict.get("status", None))
 
     def _LED_Off_Control(self, lamps=[], statusA=False, statusB=False):
         # Expand lamps list to include related slots
-        expanded_lamps = []
+        expanded_lamps = {}
         for lamp in lamps:
-            all_lamps = self._get_all_slot_names_for_lamp(lamp)
-            expanded_lamps.extend(all_lamps)
-        # Remove duplicates
-        expanded_lamps = list(set(expanded_lamps))
-
-        match self.device_type:
-            case "ATNPTL":
-                for lamp in expanded_lamps:
-                    self.led_off(lamp=lamp)
-            case "NeoLight":
-                self.device_handler._LED_Off_Control(
-                    lamps=expanded_lamps, statusA=statusA, statusB=statusB
-                )
-                self.enable_working_lights_based_on_led_state()
-            case "Sophia":
-                for lamp in expanded_lamps:
-                    self.led_off(lamp)
-                if statusA or statusB:
-                    self.device_handler.clear_lhs()
-            case "Dummy":
-                print(f"Led OFF {self.storage.name} {statusA=} {statusB=}")
-                pp(expanded_lamps)
-                self.enable_working_lights_based_on_led_state()
+            for lamp_name in self._get_all_slot_names_for_lamp(lamp):
+                expanded_lamps[lamp_name] = None
+        self._update(
+            expanded_lamps,
+            {side: None for side, off in (("A", statusA), ("B", statusB)) if off},
+        )
 
     def reset_leds(self, working_light=False):
         match self.device_type:
@@ -396,11 +934,6 @@ class LED_shelf_dispatcher:
                 self.device_handler.reset_leds(controller=self.ATNPTL_shelf_id)
             case "NeoLight":
                 self.device_handler.reset_leds(working_light=working_light)
-                if working_light:
-                    self.storage.lighthouse_A_yellow = False
-                    self.storage.lighthouse_B_yellow = False
-                    self.storage.save()
-                self.lighthouse_on_control()
             case "Sophia":
                 self.device_handler.clear_leds()
                 if working_light:
@@ -409,10 +942,23 @@ class LED_shelf_dispatcher:
                 print(f"reset leds {self.storage.name}")
                 if working_light:
                     print(f"reset workinglight {self.storage.name}")
-                    self.storage.lighthouse_A_yellow = False
-                    self.storage.lighthouse_B_yellow = False
-                    self.storage.save()
-                self.lighthouse_on_control()
+
+        # every lamp is off now, lamps switched on before are not reapplied
+        self.shadow.reset(status=working_light and self.device_type == "Sophia")
+        if self.device_type in self.WORKING_LIGHT_DEVICES:
+            # /resetled leaves the status lights in an unknown state
+            self.shadow.acked_status.clear()
+            self.enable_working_lights_based_on_led_state()
+
+    def _xgate_set_lamps(self, lamp_colors):
+        """Send lamp colors ("off" switches off) to the XGate rows in one frame diff."""
+        self.device_handler.set_lamps(
+            {
+                self._xgate_slot_to_row_led(lamp): color
+                for lamp, color in lamp_colors.items()
+            },
+            blink=False,
+        )
 
     def _xgate_slot_to_row_led(self, lamp):
         # the barcodes on the storage slots have a 5 char long prefix and the slot id is formatted a little differntly then its printed under the barcode
@@ -1,9 +1,68 @@
 # Modified PTL_handler.py
+import logging
 import time
 import requests
 
+from .transport import get_transport
+
+logger = logging.getLogger(__name__)
+
 
 class PTL_API:
+    # slot number on a channel -> LED position on the strip
+    slot_to_strip_map = {
+        1: 1,
+        2: 3,
+        3: 6,
+        4: 9,
+        5: 12,
+        6: 15,
+        7: 18,
+        8: 20,
+        9: 23,
+        10: 26,
+        11: 29,
+        12: 32,
+        13: 35,
+        14: 38,
+        15: 41,
+        16: 44,
+        17: 47,
+        18: 49,
+        19: 52,
+        20: 55,
+        21: 58,
+        22: 61,
+        23: 64,
+        24: 66,
+        25: 69,
+        26: 72,
+        27: 75,
+        28: 78,
+        29: 81,
+        30: 84,
+        31: 87,
+        32: 90,
+        33: 93,
+        34: 96,
+        35: 98,
+        36: 101,
+        37: 104,
+        38: 107,
+        39: 110,
+        40: 113,
+        41: 116,
+        42: 118,
+        43: 121,
+        44: 124,
+        45: 127,
+        46: 130,
+        47: 133,
+        48: 136,
+        49: 138,
+        50: 140,
+    }
+
     def __init__(
         self,
         port,
@@ -12,13 +71,14 @@ class PTL_API:
         connection=None,
         flask_url="http://127.0.0.1:5000",
     ):
-        print("PTL_API arg", port)
         self.port = str(port)
-        print("PTL_API val", self.port)
         self.baudrate = baudrate
         self.flask_url = flask_url
         self.connected = False
         self.timeout = timeout
+        self.transport = get_transport(flask_url)
+        # cleared when the bridge answers /send_commands with 404
+        self.batch_supported = True
 
         # Initialize connection to Flask service
         if not connection:  # If no connection is provided, use Flask service
@@ -27,95 +87,54 @@ class PTL_API:
             while not self.connected and attempts < max_attempts:
                 attempts += 1
                 try:
-                    response = requests.post(
-                        f"{self.flask_url}/initialize",
+                    # this loop already retries, the transport must not, and its
+                    # attempts must not open the breaker of the commands
+                    response = self.transport.post(
+                        "/initialize",
                         json={
                             "port": self.port,
                             "baudrate": self.baudrate,
                             "timeout": self.timeout,
                         },
+                        idempotent=False,
+                        breaker=False,
                     )
 
                     if response.status_code == 200 and response.json()["success"]:
                         self.connected = True
-                        print(
-                            f"Connected to Flask service: {response.json()['message']}"
+                        logger.debug(
+                            "connected to PTL bridge: %s", response.json()["message"]
                         )
                     else:
-                        print(
-                            f"Failed to connect: {response.json().get('message', 'Unknown error')}"
+                        logger.warning(
+                            "PTL bridge failed to open %s: %s",
+                            self.port,
+                            response.json().get("message", "Unknown error"),
                         )
                         time.sleep(1)  # Wait before retry
                 except requests.RequestException as e:
-                    print(f"Error connecting to Flask service: {str(e)}")
+                    logger.warning("PTL bridge %s not reachable: %s", flask_url, e)
                     time.sleep(1)
 
                 if attempts >= max_attempts:
-                    print(
-                        f"Failed to establish connection after {max_attempts} attempts"
+                    logger.warning(
+                        "PTL bridge did not open %s after %s attempts",
+                        self.port,
+                        max_attempts,
                     )
                     break
         else:
             # If connection is provided (for testing or special cases),
             # we're setting connected to True but not actually using the connection
             self.connected = True
-            print("Using provided connection (this is ignored in HTTP mode)")
-
-        # Slot to strip mapping remains unchanged
-        self.slot_to_strip_map = {
-            1: 1,
-            2: 3,
-            3: 6,
-            4: 9,
-            5: 12,
-            6: 15,
-            7: 18,
-            8: 20,
-            9: 23,
-            10: 26,
-            11: 29,
-            12: 32,
-            13: 35,
-            14: 38,
-            15: 41,
-            16: 44,
-            17: 47,
-            18: 49,
-            19: 52,
-            20: 55,
-            21: 58,
-            22: 61,
-            23: 64,
-            24: 66,
-            25: 69,
-            26: 72,
-            27: 75,
-            28: 78,
-            29: 81,
-            30: 84,
-            31: 87,
-            32: 90,
-            33: 93,
-            34: 96,
-            35: 98,
-            36: 101,
-            37: 104,
-            38: 107,
-            39: 110,
-            40: 113,
-            41: 116,
-            42: 118,
-            43: 121,
-            44: 124,
-            45: 127,
-            46: 130,
-            47: 133,
-            48: 136,
-            49: 138,
-            50: 140,
-        }
+            logger.debug("Using provided connection (this is ignored in HTTP mode)")
 
-    def _LED_strip_control(
+    @property
+    def connection_epoch(self):
+        """Changes when the bridge was reachable again after being offline."""
+        return self.transport.breaker.recoveries
+
+    def _build_frame(
         self,
         gateway=1,
         controller=1,
@@ -127,7 +146,7 @@ class PTL_API:
         G=0,
         B=0,
     ):
-        cmd = [
+        return [
             2,  # STX
             gateway,  # host
             controller,  # shelf
@@ -141,10 +160,34 @@ class PTL_API:
             0,  # blink
             0,  # reserved
         ]
-        print("channel: ", channel)
-        print("lamp", led_C, led_D)
-        print("cmd: ", cmd)
-        print(
+
+    def _LED_strip_control(
+        self,
+        gateway=1,
+        controller=1,
+        command=11,
+        channel=0,
+        led_C=0,
+        led_D=0,
+        R=0,
+        G=0,
+        B=0,
+    ):
+        cmd = self._build_frame(
+            gateway=gateway,
+            controller=controller,
+            command=command,
+            channel=channel,
+            led_C=led_C,
+            led_D=led_D,
+            R=R,
+            G=G,
+            B=B,
+        )
+        logger.debug("channel: %s lamp: %s %s", channel, led_C, led_D)
+        logger.debug(
+            "cmd: %s %s",
+            cmd,
             [
                 "STX",
                 "GATEWAY",
@@ -158,48 +201,108 @@ class PTL_API:
                 "B",
                 "BLINK",
                 "RESERVED",
-            ]
+            ],
         )
 
         # Send command to Flask service instead of directly to serial port
         try:
-            response = requests.post(
-                f"{self.flask_url}/send_command",
+            response = self.transport.post(
+                "/send_command",
                 json={"command": cmd, "read_size": 5},
                 timeout=2,
             )
 
             if response.status_code == 200 and response.json()["success"]:
-                print("written bytes no: ", response.json()["written_bytes"])
-                print("res", response.json()["response"])
+                logger.debug(
+                    "written bytes: %s response: %s",
+                    response.json()["written_bytes"],
+                    response.json()["response"],
+                )
                 return response.json()["response"]
             else:
                 error_msg = response.json().get("message", "Unknown error")
-                print(f"Command failed: {error_msg}")
+                logger.warning("PTL command failed: %s", error_msg)
                 # Try to reconnect if connection issue
                 if "connection" in error_msg.lower():
                     self.connected = False
                 return None
         except requests.RequestException as e:
-            print(f"Error sending command to Flask service: {str(e)}")
+            logger.warning("PTL bridge %s not reachable: %s", self.flask_url, e)
             self.connected = False
             return None
 
+    def send_frames(self, frames):
+        """
+        Send many frames in one request to the bridge, which writes them back
+        to back over serial and returns all acks at once.
+
+        Falls back to one /send_command per frame if the bridge has no batch
+        endpoint.
+
+        Args:
+            frames: List of frames as built by _build_frame
+
+        Returns:
+            list: One ack per frame, None where the controller did not answer
+        """
+        if not frames:
+            return []
+        if not self.batch_supported:
+            return [self._send_frame(frame) for frame in frames]
+
+        logger.debug("sending %s frames", len(frames))
+        try:
+            response = self.transport.post(
+                "/send_commands",
+                json={"commands": frames, "read_size": 5},
+                timeout=(2, 2 + 0.05 * len(frames)),
+            )
+            if response.status_code == 404:
+                logger.warning(
+                    "PTL bridge has no batch endpoint, sending frames one by one"
+                )
+                self.batch_supported = False
+                return self.send_frames(frames)
+            if response.status_code == 200 and response.json()["success"]:
+                return response.json()["responses"]
+            error_msg = response.json().get("message", "Unknown error")
+            logger.warning("PTL batch command failed: %s", error_msg)
+            if "connection" in error_msg.lower():
+                self.connected = False
+        except requests.RequestException as e:
+            logger.warning("PTL bridge %s not reachable: %s", self.flask_url, e)
+            self.connected = False
+        return [None] * len(frames)
+
+    def _send_frame(self, frame):
+        gateway, controller, command, channel, led_C, led_D, R, G, B = frame[1:10]
+        return self._LED_strip_control(
+            gateway=gateway,
+            controller=controller,
+            command=command,
+            channel=channel,
+            led_C=led_C,
+            led_D=led_D,
+            R=R,
+            G=G,
+            B=B,
+        )
+
     # The rest of the methods remain unchanged as they call _LED_strip_control
     def LED_slot_control(
         self, gateway=1, controller=1, command=11, channel=1, LED=1, R=0, G=0, B=0
     ):
-        print(
-            f"LED_slot_control {gateway=} {controller=} {command=} {channel=} {LED=} {R=} {G=} {B=}"
+        logger.debug(
+            "LED_slot_control gateway=%s controller=%s command=%s channel=%s LED=%s"
+            " RGB=%s",
+            gateway,
+            controller,
+            command,
+            channel,
+            LED,
+            (R, G, B),
         )
-        if LED > len(self.slot_to_strip_map):
-            raise Exception(
-                f"Value {LED} for slot ID is out of range {len(self.slot_to_strip_map)}"
-            )
-
-        led = self.slot_to_strip_map[LED]
-        led_c = int(str(led).zfill(3)[0])  # hundred bit (123 -> 1)
-        led_d = int(str(led).zfill(3)[1:])  # decimal bit (123 -> 23)
+        led_c, led_d = self._strip_position(LED)
 
         self._LED_strip_control(
             gateway=gateway,
@@ -216,12 +319,18 @@ class PTL_API:
     def LED_slot_code_control(
         self, gateway=1, controller=1, command=11, code=1001, R=0, G=0, B=0
     ):
-        print(
-            f"LED_slot_code_control {gateway=} {controller=} {command=} {code=} {R=} {G=} {B=}"
+        logger.debug(
+            "LED_slot_code_control gateway=%s controller=%s command=%s code=%s"
+            " RGB=%s",
+            gateway,
+            controller,
+            command,
+            code,
+            (R, G, B),
         )
         row = int(str(code).zfill(4)[0])  # thousand bit (1234 -> 1)
         led = int(str(code).zfill(4)[1:])  # other bits (1234 -> 234)
-        print(f"channel: {row=}, {led=}")
+        logger.debug("channel: row=%s led=%s", row, led)
         self.LED_slot_control(
             gateway=gateway,
             controller=controller,
@@ -233,8 +342,35 @@ class PTL_API:
             B=B,
         )
 
-    def led_on(self, shelf=None, lamp=1, color="blue"):
-        print(f"LED ON {shelf=} {lamp=} {color=}")
+    def _strip_position(self, LED):
+        if LED > len(self.slot_to_strip_map):
+            raise Exception(
+                f"Value {LED} for slot ID is out of range {len(self.slot_to_strip_map)}"
+            )
+
+        led = self.slot_to_strip_map[LED]
+        led_c = int(str(led).zfill(3)[0])  # hundred bit (123 -> 1)
+        led_d = int(str(led).zfill(3)[1:])  # decimal bit (123 -> 23)
+        return led_c, led_d
+
+    def _slot_code_frame(self, controller, command, code, R=0, G=0, B=0):
+        row = int(str(code).zfill(4)[0])  # thousand bit (1234 -> 1)
+        led = int(str(code).zfill(4)[1:])  # other bits (1234 -> 234)
+        led_c, led_d = self._strip_position(led)
+        return self._build_frame(
+            gateway=1,
+            controller=controller,
+            command=command,
+            channel=row,
+            led_C=led_c,
+            led_D=led_d,
+            R=R,
+            G=G,
+            B=B,
+        )
+
+    @staticmethod
+    def _color_to_rgb(color):
         R = G = B = 0
         if color == "red":
             R = 255
@@ -245,6 +381,11 @@ class PTL_API:
         if color == "yellow":
             R = 255
             G = 255
+        return R, G, B
+
+    def led_on(self, shelf=None, lamp=1, color="blue"):
+        logger.debug("LED ON shelf=%s lamp=%s color=%s", shelf, lamp, color)
+        R, G, B = self._color_to_rgb(color)
 
         self.LED_slot_code_control(
             gateway=1, controller=shelf, command=11, code=lamp, R=R, G=G, B=B
@@ -253,6 +394,31 @@ class PTL_API:
     def led_off(self, shelf=1, lamp=1001):
         self.LED_slot_code_control(gateway=1, controller=shelf, command=21, code=lamp)
 
+    def leds_on(self, shelf=None, lamps=None):
+        """
+        Switch on many lamps with one bridge request.
+
+        Args:
+            shelf: Controller id of the shelf
+            lamps: Dict mapping lamp codes to colors
+        """
+        frames = [
+            self._slot_code_frame(shelf, 11, int(lamp), *self._color_to_rgb(color))
+            for lamp, color in (lamps or {}).items()
+        ]
+        return self.send_frames(frames)
+
+    def leds_off(self, shelf=1, lamps=None):
+        """
+        Switch off many lamps with one bridge request.
+
+        Args:
+            shelf: Controller id of the shelf
+            lamps: Iterable of lamp codes
+        """
+        frames = [self._slot_code_frame(shelf, 21, int(lamp)) for lamp in lamps or []]
+        return self.send_frames(frames)
+
     def reset_leds(self, working_light=None, controller=1):
         self._LED_strip_control(command=23, controller=controller)
 
@@ -0,0 +1,75 @@
+"""
+Pseudo terminal that behaves like an ATNPTL controller, for tests and
+benchmarks of the serial bridge without hardware (POSIX only).
+
+    device = FakePTLSerial(frame_delay=0.001)
+    device.start()
+    bridge.initialize(device.port)
+    ...
+    device.stop()
+"""
+
+import os
+import select
+import threading
+import time
+import tty
+
+FRAME_SIZE = 12
+ACK_SIZE = 5
+STX = 2
+ETX = 3
+
+
+class FakePTLSerial:
+    """
+    Answers every 12 byte frame written to port with a 5 byte ack
+    [STX, gateway, controller, command, ETX] after frame_delay seconds. While
+    silent is set frames are recorded but not answered, neither are the frames
+    whose index in frames is in skip.
+    """
+
+    def __init__(self, frame_delay=0.0):
+        self.frame_delay = frame_delay
+        self.silent = False
+        self.skip = set()
+        self.frames = []
+        self._master, self._slave = os.openpty()
+        # raw mode, the line discipline must neither echo nor translate bytes
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        os.close(self._master)
+        os.close(self._slave)
+
+    def _serve(self):
+        buffer = b""
+        while self._running:
+            readable, _, _ = select.select([self._master], [], [], 0.05)
+            if not readable:
+                continue
+            try:
+                buffer += os.read(self._master, 4096)
+            except OSError:
+                return
+            while len(buffer) >= FRAME_SIZE:
+                frame, buffer = buffer[:FRAME_SIZE], buffer[FRAME_SIZE:]
+                self.frames.append(list(frame))
+                if self.silent or len(self.frames) - 1 in self.skip:
+                    continue
+                if self.frame_delay:
+                    time.sleep(self.frame_delay)
+                os.write(self._master, bytes([STX, frame[1], frame[2], frame[3], ETX]))
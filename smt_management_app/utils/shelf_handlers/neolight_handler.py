@@ -1,9 +1,13 @@
-import requests
-from urllib.parse import urlunsplit, urljoin
+import logging
+from urllib.parse import urlunsplit
 from pprint import pprint as pp
 import time
 import random
 
+from .transport import get_transport
+
+logger = logging.getLogger(__name__)
+
 t = 0.25
 
 
@@ -17,17 +21,24 @@ class NeoLightAPI:
         tower_colors=["green", "yellow", "red"],
     ):
         self.__api_url = urlunsplit(["http", f"{ip}:{port}", "/", None, None])
+        # keep-alive session shared by all handlers of this controller
+        self.transport = get_transport(self.__api_url)
         self.led_colors = led_colors
         self.tower_colors = tower_colors
         self.all_leds = list(range(1, max_led_address + 1))
 
+    @property
+    def connection_epoch(self):
+        """Changes when the controller was reachable again after being offline."""
+        return self.transport.breaker.recoveries
+
     def _LED_On_Control(self, lights_dict):
         """
         lights_dict = {'status':{'A':'green','B':'yellow'}, 'lamps'={1:'red',2:'yellow',3:'green',4:'blue'}}
         lights_dict = {'status':{'A':'green'}}
         lights_dict = {'lamps'={1:'red',2:'yellow',3:'green',4:'blue'}}
         """
-        print(f"LIGHTS DICT {lights_dict}")
+        logger.debug("LIGHTS DICT %s", lights_dict)
         param_list = []
         for k in lights_dict.keys():
             if k == "status":
@@ -68,11 +79,7 @@ class NeoLightAPI:
         # print(f'PARAM STR : {param_string}')
         request_param_dict = {"params": param_string}
 
-        req = requests.post(
-            urljoin(self.__api_url, "/api/open"), json=request_param_dict
-        )
-        print(f"LEDCTRL:::{req.url}\n{req.request.body}\n{req}\n{req.content}")
-        return req
+        return self.transport.post("/api/open", json=request_param_dict)
 
     def _LED_Off_Control(self, lamps=[], statusA=False, statusB=False):
         if lamps:
@@ -88,15 +95,11 @@ class NeoLightAPI:
                 + (";" if statusA and statusB else "")
                 + ("statusB" if statusB else "")
             }
-        req = requests.post(
-            urljoin(self.__api_url, "api/close"), json=request_param_dict
-        )
-        return req
+        return self.transport.post("api/close", json=request_param_dict)
 
     def _LED_On_and_Off_Control(self, state="off"):
         request_param_dict = {"op": f"{state}"}
-        req = requests.post(urljoin(self.__api_url, "/opAll"), json=request_param_dict)
-        return req
+        return self.transport.post("/opAll", json=request_param_dict)
 
     def led_on(self, lamp, color):
         # print(f"in led_on lamp={lamp},color={color}")
@@ -120,10 +123,7 @@ class NeoLightAPI:
         Args:
             working_light: Currently unused but kept for compatibility
         """
-        reset_url = urljoin(self.__api_url, "/resetled")
-        req = requests.post(reset_url)
-        print(f"RESET_LEDS:::{req.url}\n{req}\n{req.content}")
-        return req
+        return self.transport.post("/resetled")
 
     def test(self, stop=200):
         IT = self
@@ -0,0 +1,236 @@
+"""
+HTTP to serial bridge for ATNPTL shelves.
+
+PTL_API talks to this service instead of opening the serial port itself:
+
+    /initialize     open the serial port {"port", "baudrate", "timeout"}
+    /send_command   write one frame and read its ack {"command", "read_size"}
+    /send_commands  write many frames back to back and return all acks
+                    {"commands", "read_size", "window"}
+
+Run it with
+    python -m smt_management_app.utils.shelf_handlers.ptl_bridge --port 5000
+"""
+
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import serial
+
+# frames written before their acks are read, keeps the controller input buffer small
+BATCH_WINDOW = 16
+
+STX = 2
+
+
+def match_acks(commands, acks):
+    """
+    Assign acks to the commands they answer.
+
+    An ack only echoes controller and command of its frame (bytes 2 and 3), e.g.
+    every frame of one leds_on call has the same echo. The controller answers in
+    write order, so the acks of one echo belong to the commands of that echo in
+    order, as long as every one of these commands got an ack. With fewer (or more)
+    acks than commands of an echo nobody can tell which frame was skipped, none of
+    these commands counts as acked.
+
+    Returns:
+        list: One ack per command, None for commands without a certain ack
+    """
+    indexes_by_echo = {}
+    for index, command in enumerate(commands):
+        indexes_by_echo.setdefault(tuple(command[2:4]), []).append(index)
+    acks_by_echo = {}
+    for ack in acks:
+        acks_by_echo.setdefault(tuple(ack[2:4]), []).append(ack)
+
+    responses = [None] * len(commands)
+    for echo, indexes in indexes_by_echo.items():
+        echo_acks = acks_by_echo.get(echo, [])
+        if len(echo_acks) == len(indexes):
+            for index, ack in zip(indexes, echo_acks):
+                responses[index] = ack
+    return responses
+
+
+class SerialBridge:
+    """Owns the serial port, one command or batch at a time."""
+
+    def __init__(self):
+        self.serial = None
+        self.lock = threading.Lock()
+
+    def initialize(self, port, baudrate=115200, timeout=0.4):
+        with self.lock:
+            if self.serial is not None and self.serial.is_open:
+                if self.serial.port == port:
+                    return "already connected"
+                self.serial.close()
+            self.serial = serial.serial_for_url(
+                port, baudrate=baudrate, timeout=timeout
+            )
+            return f"connected to {port}"
+
+    def send_command(self, command, read_size=5):
+        """
+        Write one frame and wait for its ack.
+
+        Returns:
+            tuple: (written bytes, ack as list of ints)
+        """
+        with self.lock:
+            self._check_connected()
+            written = self.serial.write(bytes(command))
+            return written, list(self.serial.read(read_size))
+
+    def send_commands(self, commands, read_size=5, window=BATCH_WINDOW):
+        """
+        Write frames back to back and collect their acks.
+
+        Up to window frames are written in one go before their acks are read,
+        so a batch costs one HTTP request and len(commands) / window serial
+        round trips instead of one of each per frame.
+
+        Args:
+            commands: List of frames, each a list of ints
+            read_size: Ack length of one frame
+            window: Frames in flight before reading acks
+
+        Returns:
+            tuple: (written bytes, list of acks, None for frames without an ack)
+        """
+        window = max(1, int(window))
+        written = 0
+        responses = []
+        with self.lock:
+            self._check_connected()
+            for start in range(0, len(commands), window):
+                chunk = commands[start : start + window]
+                written += self.serial.write(b"".join(bytes(cmd) for cmd in chunk))
+                acks = self._read_acks(len(chunk), read_size)
+                responses.extend(match_acks(chunk, acks))
+        return written, responses
+
+    def _read_acks(self, count, read_size):
+        """
+        Read up to count acks, skipping line noise up to the next STX. Stops early
+        once the serial read times out, e.g. a frame the controller did not answer.
+        """
+        data = b""
+        position = 0
+        acks = []
+        while len(acks) < count:
+            if len(data) - position < read_size:
+                missing = (count - len(acks)) * read_size - (len(data) - position)
+                received = self.serial.read(missing)
+                if not received:
+                    break
+                data += received
+                continue
+            if data[position] != STX:
+                position += 1
+                continue
+            acks.append(list(data[position : position + read_size]))
+            position += read_size
+        return acks
+
+    def _check_connected(self):
+        if self.serial is None or not self.serial.is_open:
+            raise serial.SerialException("no connection, call /initialize first")
+
+    def close(self):
+        with self.lock:
+            if self.serial is not None:
+                self.serial.close()
+                self.serial = None
+
+
+class BridgeRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, Nagle would delay every reply
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        bridge = self.server.bridge
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            data = json.loads(self.rfile.read(length) or b"{}")
+            match self.path:
+                case "/initialize":
+                    message = bridge.initialize(
+                        data["port"],
+                        baudrate=data.get("baudrate", 115200),
+                        timeout=data.get("timeout", 0.4),
+                    )
+                    self._reply(200, {"success": True, "message": message})
+                case "/send_command":
+                    written, response = bridge.send_command(
+                        data["command"], read_size=data.get("read_size", 5)
+                    )
+                    self._reply(
+                        200,
+                        {
+                            "success": True,
+                            "written_bytes": written,
+                            "response": response,
+                        },
+                    )
+                case "/send_commands":
+                    written, responses = bridge.send_commands(
+                        data["commands"],
+                        read_size=data.get("read_size", 5),
+                        window=data.get("window", BATCH_WINDOW),
+                    )
+                    self._reply(
+                        200,
+                        {
+                            "success": True,
+                            "written_bytes": written,
+                            "responses": responses,
+                        },
+                    )
+                case _:
+                    self._reply(404, {"success": False, "message": "unknown path"})
+        except serial.SerialException as e:
+            self._reply(
+                500, {"success": False, "message": f"serial connection error: {e}"}
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            self._reply(400, {"success": False, "message": f"bad request: {e}"})
+
+    def _reply(self, status, body):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_server(host="127.0.0.1", port=5000):
+    server = ThreadingHTTPServer((host, port), BridgeRequestHandler)
+    server.daemon_threads = True
+    server.bridge = SerialBridge()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ATNPTL HTTP to serial bridge")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port)
+    print(f"PTL bridge listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.bridge.close()
+        server.server_close()
@@ -0,0 +1,319 @@
+"""
+Direct serial transport for ATNPTL shelves.
+
+Talks to the controller in-process instead of going through the HTTP bridge
+(ptl_bridge.py). One asyncio loop per serial port runs in a daemon thread,
+frames are pipelined and every ack is matched to the pending frame of the same
+controller and command.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+
+from .PTL_handler import PTL_API
+
+logger = logging.getLogger(__name__)
+
+STX = 2
+ACK_SIZE = 5
+
+# frames in flight before the next write waits for an ack
+WINDOW = 16
+ACK_TIMEOUT = 1.0
+
+RECONNECT_BACKOFF = 0.5
+RECONNECT_BACKOFF_MAX = 5
+
+
+class AsyncSerialTransport:
+    """
+    Pipelined STX frame transport on one serial port.
+
+    send() may be called from any thread, it blocks until every frame of the
+    call got its ack or timed out. Port errors drop the connection, the next
+    send() reopens the port with a growing backoff.
+    """
+
+    def __init__(
+        self,
+        port,
+        baudrate=115200,
+        timeout=0.4,
+        window=WINDOW,
+        ack_timeout=ACK_TIMEOUT,
+    ):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.ack_timeout = ack_timeout
+        self.serial = None
+        # successful opens of the port, see PTL_SerialAPI.connection_epoch
+        self.connections = 0
+        self._read_task = None
+
+        # (controller, command, future) in write order
+        self._pending = deque()
+        self._window = asyncio.Semaphore(window)
+        self._connect_lock = asyncio.Lock()
+        self._backoff = RECONNECT_BACKOFF
+        self._retry_at = 0
+
+        # pyserial blocks, reads and writes run in their own threads
+        self._reader = ThreadPoolExecutor(1, thread_name_prefix="ptl-serial-read")
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="ptl-serial-write")
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name=f"ptl-serial-{port}", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    @property
+    def connected(self):
+        return self.serial is not None
+
+    def connect(self):
+        """Open the port if it is not open yet, returns whether it is."""
+        return self._run(self._ensure_connected())
+
+    def send(self, frames):
+        """
+        Write frames and wait for their acks.
+
+        Args:
+            frames: List of frames, each a list of ints
+
+        Returns:
+            list: One ack per frame, None where none arrived in time
+        """
+        if not frames:
+            return []
+        return self._run(self._send(frames))
+
+    def close(self):
+        self._run(self._close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=1)
+        self._reader.shutdown(wait=False)
+        self._writer.shutdown(wait=False)
+
+    async def _ensure_connected(self):
+        async with self._connect_lock:
+            if self.serial is not None:
+                return True
+            if time.monotonic() < self._retry_at:
+                return False
+
+            loop = asyncio.get_running_loop()
+            try:
+                ser = await loop.run_in_executor(
+                    self._writer,
+                    lambda: serial.serial_for_url(
+                        self.port, baudrate=self.baudrate, timeout=self.timeout
+                    ),
+                )
+            except (serial.SerialException, OSError) as e:
+                logger.warning("PTL serial %s not available: %s", self.port, e)
+                self._retry_at = time.monotonic() + self._backoff
+                self._backoff = min(self._backoff * 2, RECONNECT_BACKOFF_MAX)
+                return False
+
+            logger.info("PTL serial connected to %s", self.port)
+            self.serial = ser
+            self.connections += 1
+            self._backoff = RECONNECT_BACKOFF
+            self._read_task = loop.create_task(self._read_loop(ser))
+            return True
+
+    async def _send(self, frames):
+        if not await self._ensure_connected():
+            return [None] * len(frames)
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for frame in frames:
+            try:
+                await asyncio.wait_for(self._window.acquire(), self.ack_timeout)
+            except asyncio.TimeoutError:
+                # no ack for a whole timeout, the controller does not answer and
+                # the rest of the call is not written at all
+                logger.warning(
+                    "PTL serial %s does not answer, dropping frames", self.port
+                )
+                while self._pending:
+                    self._resolve(self._pending.popleft()[2], None)
+                break
+            future = loop.create_future()
+            future.add_done_callback(lambda _: self._window.release())
+            self._pending.append((frame[2], frame[3], future))
+            futures.append(future)
+
+            ser = self.serial
+            if ser is None:
+                # the connection broke while this call was writing
+                future.set_result(None)
+                continue
+            try:
+                await loop.run_in_executor(self._writer, ser.write, bytes(frame))
+            except (serial.SerialException, OSError) as e:
+                self._connection_lost(ser, e)
+
+        acks = []
+        for future in futures:
+            try:
+                acks.append(
+                    await asyncio.wait_for(asyncio.shield(future), self.ack_timeout)
+                )
+            except asyncio.TimeoutError:
+                self._resolve(future, None)
+                acks.append(None)
+        self._prune()
+        acks += [None] * (len(frames) - len(acks))
+        # frames with the same echo are only told apart by order, after a skipped
+        # one the later acks may have gone to the wrong frame, see _match
+        unanswered = {tuple(frame[2:4]) for frame, ack in zip(frames, acks) if not ack}
+        return [
+            None if tuple(frame[2:4]) in unanswered else ack
+            for frame, ack in zip(frames, acks)
+        ]
+
+    async def _read_loop(self, ser):
+        loop = asyncio.get_running_loop()
+        while self.serial is ser:
+            try:
+                ack = await loop.run_in_executor(self._reader, self._read_ack, ser)
+            except (serial.SerialException, OSError, TypeError) as e:
+                # TypeError: pyserial reading from a port closed by another thread
+                self._connection_lost(ser, e)
+                return
+            if ack is not None:
+                self._match(ack)
+
+    @staticmethod
+    def _read_ack(ser):
+        start = ser.read(1)
+        if not start or start[0] != STX:
+            # read timeout or line noise, resync on the next STX
+            return None
+        rest = ser.read(ACK_SIZE - 1)
+        if len(rest) < ACK_SIZE - 1:
+            return None
+        return list(start + rest)
+
+    def _match(self, ack):
+        """
+        Resolve the oldest pending frame for the controller and command the ack
+        echoes. Older frames were skipped by the controller and get None. Acks
+        that echo nothing known are assigned in write order.
+
+        A skipped frame followed by frames of the same echo takes the ack of the
+        next one, _send therefore drops every ack of an echo that has an
+        unanswered frame in the call.
+        """
+        self._prune()
+        if not self._pending:
+            logger.debug("unexpected ack %s", ack)
+            return
+
+        index = next(
+            (
+                i
+                for i, (controller, command, future) in enumerate(self._pending)
+                if (controller, command) == (ack[2], ack[3]) and not future.done()
+            ),
+            0,
+        )
+        for _ in range(index):
+            self._resolve(self._pending.popleft()[2], None)
+        self._resolve(self._pending.popleft()[2], ack)
+
+    def _prune(self):
+        # drop frames that already timed out
+        while self._pending and self._pending[0][2].done():
+            self._pending.popleft()
+
+    @staticmethod
+    def _resolve(future, value):
+        if not future.done():
+            future.set_result(value)
+
+    def _connection_lost(self, ser, error):
+        if self.serial is not ser:
+            return
+        logger.warning("PTL serial %s lost: %s", self.port, error)
+        self.serial = None
+        try:
+            ser.close()
+        except (serial.SerialException, OSError):
+            pass
+        while self._pending:
+            self._resolve(self._pending.popleft()[2], None)
+
+    async def _close(self):
+        if self.serial is not None:
+            self._connection_lost(self.serial, "closed")
+        if self._read_task is not None:
+            # the reader thread notices the closed port within one read timeout
+            await asyncio.wait([self._read_task], timeout=self.timeout + 1)
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_serial_transport(port, baudrate=115200, timeout=0.4):
+    """
+    Return the shared transport of a serial port. Shelves behind the same
+    gateway share one port and therefore one transport.
+    """
+    with _transports_lock:
+        transport = _transports.get(port)
+        if transport is None:
+            transport = AsyncSerialTransport(port, baudrate=baudrate, timeout=timeout)
+            _transports[port] = transport
+        return transport
+
+
+def close_serial_transports():
+    with _transports_lock:
+        for transport in _transports.values():
+            transport.close()
+        _transports.clear()
+
+
+class PTL_SerialAPI(PTL_API):
+    """
+    PTL_API that writes frames to the serial port itself, selected with
+    Storage.ATNPTL_transport = "serial".
+    """
+
+    def __init__(self, port, baudrate=115200, timeout=0.4):
+        self.port = str(port)
+        self.baudrate = baudrate or 115200
+        self.timeout = timeout or 0.4
+        self.transport = get_serial_transport(
+            self.port, baudrate=self.baudrate, timeout=self.timeout
+        )
+        self.connected = self.transport.connect()
+
+    @property
+    def connection_epoch(self):
+        return self.transport.connections
+
+    def _LED_strip_control(self, **frame):
+        return self.send_frames([self._build_frame(**frame)])[0]
+
+    def send_frames(self, frames):
+        logger.debug("sending %s frames to %s", len(frames), self.port)
+        acks = self.transport.send(frames)
+        self.connected = self.transport.connected
+        return acks
@@ -0,0 +1,187 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeouts in seconds, a dead controller must not block a worker
+CONNECT_TIMEOUT = 2
+READ_TIMEOUT = 5
+
+# idempotent commands are sent again after a connection error or timeout
+RETRIES = 2
+RETRY_BACKOFF = 0.1
+
+# consecutive failed commands that open the breaker and how long it stays open
+BREAKER_THRESHOLD = 3
+BREAKER_RESET_TIMEOUT = 10
+
+POOL_SIZE = 4
+
+
+class ShelfOfflineError(requests.ConnectionError):
+    """Raised without a network round trip while the breaker of a shelf is open."""
+
+
+class CircuitBreaker:
+    """
+    Fail fast while a controller is offline.
+
+    After BREAKER_THRESHOLD consecutive failures the breaker opens and rejects
+    calls. Once reset_timeout passed it lets a single trial call through, a
+    success closes it again, a failure keeps it open for another period.
+    """
+
+    def __init__(
+        self, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT
+    ):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        # times the breaker closed again, the controller may have rebooted meanwhile
+        self.recoveries = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial_running:
+                return False
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                self.recoveries += 1
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class HTTPTransport:
+    """
+    Keep-alive HTTP session to one shelf controller with bounded timeouts,
+    jittered retries and a circuit breaker.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        retries=RETRIES,
+        pool_size=POOL_SIZE,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.breaker = CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, path, json=None, idempotent=True, timeout=None, breaker=True):
+        """
+        Send a POST request to the controller.
+
+        Args:
+            path: URL path on the controller
+            json: Optional JSON body
+            idempotent: Whether the command may be sent again after a failure
+            timeout: Optional (connect, read) timeout overriding the default
+            breaker: Whether the request goes through the breaker, callers
+                with their own retry loop pass False
+
+        Returns:
+            requests.Response
+
+        Raises:
+            ShelfOfflineError: If the breaker of the controller is open
+            requests.RequestException: If the last attempt failed
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        if breaker and not self.breaker.allow():
+            raise ShelfOfflineError(f"{self.base_url} is offline, not sending {path}")
+
+        attempts = 1 + (self.retries if idempotent else 0)
+        healthy = False
+        try:
+            for attempt in range(attempts):
+                try:
+                    response = self.session.post(
+                        url, json=json, timeout=timeout or self.timeout
+                    )
+                except requests.RequestException as e:
+                    logger.debug("POST %s failed (attempt %s): %s", url, attempt + 1, e)
+                    # only a lost connection or a timeout may go through next time
+                    retriable = isinstance(
+                        e, (requests.ConnectionError, requests.Timeout)
+                    )
+                    if not retriable or attempt + 1 == attempts:
+                        raise
+                    time.sleep(RETRY_BACKOFF * 2**attempt * random.uniform(0.5, 1.5))
+                else:
+                    logger.debug(
+                        "POST %s %s -> %s %s",
+                        url,
+                        json,
+                        response.status_code,
+                        response.content,
+                    )
+                    # a controller answering with a server error counts as failed
+                    healthy = response.status_code < 500
+                    return response
+        finally:
+            # every way out settles the breaker, a half open trial included
+            if breaker and healthy:
+                self.breaker.record_success()
+            elif breaker:
+                self.breaker.record_failure()
+
+    def close(self):
+        self.session.close()
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(base_url):
+    """Return the shared transport of a controller, so its connections are reused."""
+    base_url = base_url.rstrip("/")
+    with _transports_lock:
+        transport = _transports.get(base_url)
+        if transport is None:
+            transport = HTTPTransport(base_url)
+            _transports[base_url] = transport
+        return transport
+
+
+def close_transports():
+    """Close all pooled sessions, e.g. in tests or on shutdown."""
+    with _transports_lock:
+        for transport in _transports.values():
+            transport.close()
+        _transports.clear()
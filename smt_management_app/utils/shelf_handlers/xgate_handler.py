@@ -3,8 +3,8 @@ import time
 import os
 import re
 
-print(os.getcwd())
-clr.AddReference(r"smt_management_app/utils/shelf_handlers/Ptl.Device")
+# loaded next to this module, not relative to the working directory
+clr.AddReference(os.path.join(os.path.dirname(os.path.abspath(__file__)), "Ptl.Device"))
 clr.AddReference(r"System.Collections")
 clr.AddReference(r"System")
 
@@ -133,37 +133,51 @@ ADDRESSES_CON = {
     "2": 2,
 }
 
+# bus addresses of the lamp rows, 7 per side of the shelf
+ROW_ADDRESSES = [1, 2, 3, 4, 5, 6, 7, 11, 12, 13, 14, 15, 16, 17]
+LAMPS_PER_ROW = 100
+
+# seconds to wait before displaying / clearing the next row, the waits of the
+# handler that shared one device for all rows. Whether the bus queues the commands
+# of several row devices without them is not confirmed on the hardware yet, lower
+# them with the XGATE_ROW_DELAY / XGATE_CLEAR_ROW_DELAY settings once it is.
+ROW_DELAY = 0.5
+CLEAR_ROW_DELAY = 0.2
+
 
 class XGateHandler:
-    def __init__(self, xgate_address, *args, **kwargs):
+    def __init__(
+        self, xgate_address, *args, row_delay=None, clear_row_delay=None, **kwargs
+    ):
+        from django.conf import settings
+
+        if row_delay is None:
+            row_delay = getattr(settings, "XGATE_ROW_DELAY", ROW_DELAY)
+        if clear_row_delay is None:
+            clear_row_delay = getattr(
+                settings, "XGATE_CLEAR_ROW_DELAY", CLEAR_ROW_DELAY
+            )
+        self.row_delay = row_delay
+        self.clear_row_delay = clear_row_delay
         self.xgate = XGate(xgate_address)  # "192.168.0.10"
-        self.ptltera = PtlTera()
+        # one device per row, rows are displayed without switching the Address of a
+        # shared device and waiting for its queued commands in between
+        self.row_devices = {}
+        for address in ROW_ADDRESSES:
+            device = PtlTera()
+            device.Address = address
+            self.xgate.Buses[0].Devices.AddOrUpdate(device)
+            device.IsLockedChanged += self.ptltera_islocked_changed
+            device.ExecuteProtocol += self.ptltera_excute_protocol
+            device.Error += self.ptltera_error
+            device.InErrorChanged += self.ptltera_error_changed
+            self.row_devices[address] = device
+        self.ptltera = self.row_devices[ROW_ADDRESSES[0]]
         self.PtlIBS = PtlIBS()
-        self.xgate.Buses[0].Devices.AddOrUpdate(self.ptltera)
         self.xgate.Buses[1].Devices.AddOrUpdate(self.PtlIBS)
         self.xgate.StartUnicastCommandQueue()
         # self.xgate.EnableLight = True
-        self.active_lights = {
-            1: [],
-            2: [],
-            3: [],
-            4: [],
-            5: [],
-            6: [],
-            7: [],
-            11: [],
-            12: [],
-            13: [],
-            14: [],
-            15: [],
-            16: [],
-            17: [],
-        }
-
-        self.ptltera.IsLockedChanged += self.ptltera_islocked_changed
-        self.ptltera.ExecuteProtocol += self.ptltera_excute_protocol
-        self.ptltera.Error += self.ptltera_error
-        self.ptltera.InErrorChanged += self.ptltera_error_changed
+        self._reset_frames()
         self.clear_all_lights()
         self.clear_lhs()
         self.light_house_on(mode="normal")
@@ -207,17 +221,58 @@ class XGateHandler:
     def initiate_storage(self):
         pass
 
+    def _reset_frames(self):
+        # lamp -> (color, blink) per row: what should be lit and what the row shows
+        self.desired_frames = {address: {} for address in ROW_ADDRESSES}
+        self.displayed_frames = {address: {} for address in ROW_ADDRESSES}
+
     def switch_lights(self, address, lamp, col, blink=True):
-        # self.clear_lhs()
-        if lamp in self.active_lights[address]:
-            self.active_lights[address].remove(lamp)
-        else:
-            self.active_lights[address].append(lamp)
+        """Set one lamp to col, "off" switches it off."""
+        self.set_lamps({(address, lamp): col}, blink=blink)
+
+    def set_lamps(self, lamps, blink=False):
+        """
+        Update the desired frames and display the rows that changed.
+
+        Args:
+            lamps: Dict mapping (address, lamp) to a color, "off" switches off
+            blink: Whether the lamps switched on blink
+
+        Returns:
+            list: Addresses of the rows that were sent
+        """
+        for (address, lamp), col in lamps.items():
+            if col == "off":
+                self.desired_frames[address].pop(lamp, None)
+            else:
+                self.desired_frames[address][lamp] = (col, blink)
+        return self.flush()
+
+    def flush(self):
+        """Display every row whose desired frame differs from what it shows."""
+        changed = [
+            address
+            for address in ROW_ADDRESSES
+            if self.desired_frames[address] != self.displayed_frames[address]
+        ]
+        for address in changed:
+            frame = dict(self.desired_frames[address])
+            self._display_row(address, frame)
+            self.displayed_frames[address] = frame
+        return changed
+
+    def _display_row(self, address, frame):
+        device = self.row_devices[address]
+        time.sleep(self.row_delay)
+        if not frame:
+            device.Clear()
+            return
 
         lightmodes = List[LightMode]()
-        for i in range(1, 101):
+        for i in range(1, LAMPS_PER_ROW + 1):
             lightmode = LightMode()
-            if i in self.active_lights[address]:
+            if i in frame:
+                col, blink = frame[i]
                 lightmode.Color = COLORS[col]
                 lightmode.Period = LIGHTONOFFPERIOD200
                 if blink:
@@ -227,61 +282,26 @@ class XGateHandler:
             else:
                 lightmode.Color = LIGHT_OFF
             lightmodes.Add(lightmode)
-        time.sleep(0.5)
-        self.ptltera.Address = address
-        self.ptltera.Display(lightmodes)
-
-        # time.sleep(0.1)
-        # self.PtlIBS.Address = 19
-        # for add in [1,2,11,12,3,4,5,6,7]:
-        #     if len (self.active_lights[add]) > 0:
-        #         #self.PtlIBS.Lighthouses[1].Display(LIGHTONOFFPERIOD200, LIGHTONOFFRATIOP1V1)
-        #         self.PtlIBS.Lighthouses[0].Display(LIGHTONOFFPERIOD200, LIGHTONOFFRATIOP1V1)
-        #         break
-
-        # time.sleep(0.1)
-        # self.PtlIBS.Address = 9
-        # for add in [1,2,11,12,13,14,15,16,17]:
-        #     if len (self.active_lights[add]) > 0:
-        #         #self.PtlIBS.Lighthouses[1].Display(LIGHTONOFFPERIOD200, LIGHTONOFFRATIOP1V1)
-        #         self.PtlIBS.Lighthouses[0].Display(LIGHTONOFFPERIOD200, LIGHTONOFFRATIOP1V1)
-        #         break
+        device.Display(lightmodes)
 
     def clear_all_lights(self):
         lightmodes = List[LightMode]()
-        for i in range(1, 101):
+        for i in range(1, LAMPS_PER_ROW + 1):
             lightmode = LightMode()
             lightmode.Color = LIGHT_OFF
             lightmodes.Add(lightmode)
-        for address in [1, 2, 3, 4, 5, 6, 7, 11, 12, 13, 14, 15, 16, 17]:
-            time.sleep(0.2)
-            self.ptltera.Address = address
-            self.ptltera.Clear()
-            self.ptltera.Display(lightmodes)
+        for address in ROW_ADDRESSES:
+            time.sleep(self.clear_row_delay)
+            self.row_devices[address].Clear()
+            self.row_devices[address].Display(lightmodes)
+        self._reset_frames()
 
     def clear_leds(self):
-        for address in [1, 2, 3, 4, 5, 6, 7, 11, 12, 13, 14, 15, 16, 17]:
-            if len(self.active_lights[address]) > 0:
-                time.sleep(0.2)
-                self.ptltera.Address = address
-                self.ptltera.Clear()
-
-        self.active_lights = {
-            1: [],
-            2: [],
-            3: [],
-            4: [],
-            5: [],
-            6: [],
-            7: [],
-            11: [],
-            12: [],
-            13: [],
-            14: [],
-            15: [],
-            16: [],
-            17: [],
-        }
+        for address in ROW_ADDRESSES:
+            if self.displayed_frames[address]:
+                time.sleep(self.clear_row_delay)
+                self.row_devices[address].Clear()
+        self._reset_frames()
 
     def light_house_on(self, mode="normal"):
         time.sleep(0.5)
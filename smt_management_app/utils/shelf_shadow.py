@@ -0,0 +1,93 @@
+"""
+Desired and acknowledged LED state of one shelf.
+
+The dispatcher writes what the shelf should show into the shadow and pushes only
+the difference to what the device last acknowledged, so switching a lamp that
+already shows the requested color costs no device call. The shadow is only used
+from the worker thread of its dispatcher.
+"""
+
+# the device state of a lamp is not known, e.g. before the first command or after
+# the controller reconnected
+UNKNOWN = "unknown"
+
+
+class ShelfShadow:
+    """
+    Colors by lamp name and by status light side ("A"/"B"), None means off.
+
+    desired holds what the shelf should show, acked what the device confirmed.
+    Lamps missing from acked are in the state given by baseline.
+    """
+
+    def __init__(self, desired=None, desired_status=None):
+        self.desired = dict(desired or {})
+        self.desired_status = dict(desired_status or {})
+        self.acked = {}
+        self.acked_status = {}
+        self.baseline = UNKNOWN
+
+    def copy(self):
+        """Shadow for a rebuilt dispatcher, the new device gets the full desired state."""
+        return ShelfShadow(self.desired, self.desired_status)
+
+    def set_lamps(self, lamp_colors):
+        for lamp, color in lamp_colors.items():
+            if color is None and self.acked.get(lamp, self.baseline) is None:
+                # already off
+                self.desired.pop(lamp, None)
+            else:
+                self.desired[lamp] = color
+
+    def set_status(self, side_colors):
+        self.desired_status.update(side_colors)
+
+    def diff(self):
+        """
+        Returns:
+            tuple: (lamps to switch on by color, lamps to switch off, status sides to
+            switch on by color, status sides to switch off)
+        """
+        lamps_on = {}
+        lamps_off = []
+        for lamp, color in self.desired.items():
+            if self.acked.get(lamp, self.baseline) != color:
+                if color:
+                    lamps_on[lamp] = color
+                else:
+                    lamps_off.append(lamp)
+        status_on = {}
+        status_off = []
+        for side, color in self.desired_status.items():
+            if self.acked_status.get(side, UNKNOWN) != color:
+                if color:
+                    status_on[side] = color
+                else:
+                    status_off.append(side)
+        return lamps_on, lamps_off, status_on, status_off
+
+    def acknowledge(self, lamps_on, lamps_off, status_on, status_off):
+        """Record a pushed diff as the device state."""
+        self.acked.update(lamps_on)
+        for lamp in lamps_off:
+            self.acked[lamp] = None
+            # off is the default, there is nothing to reapply after a reconnect
+            if self.desired.get(lamp, UNKNOWN) is None:
+                del self.desired[lamp]
+        self.acked_status.update(status_on)
+        self.acked_status.update({side: None for side in status_off})
+
+    def reset(self, status=False):
+        """The device switched every lamp off (and the status lights if status)."""
+        self.desired.clear()
+        self.acked.clear()
+        self.baseline = None
+        if status:
+            self.desired_status = {side: None for side in self.desired_status}
+            self.acked_status = dict(self.desired_status)
+
+    def resync(self):
+        """Forget the device state, the next diff contains the full desired state."""
+        self.acked.clear()
+        self.acked_status.clear()
+        self.baseline = UNKNOWN
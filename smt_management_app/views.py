@@ -79,6 +79,7 @@ from .collecting import (
     collect_carrier,
     collect_carrier_confirm,
     collect_carrier_cancel,
+    collect_carriers_confirm_batch,
     collect_carrier_by_article,
     collect_carrier_by_article_select,
     collect_carrier_by_article_confirm,
@@ -90,6 +91,7 @@ from .storing import (
     store_carrier,
     store_carrier_confirm,
     store_carrier_cancel,
+    store_carriers_batch,
     store_carrier_choose_slot,
     store_carrier_choose_slot_confirm,
     store_carrier_choose_slot_confirm_by_qr,
@@ -100,7 +102,12 @@ from .storing import (
     store_auto_with_storage_selection,
 )
 
-from .extra_shelf_interactions import test_leds, reset_leds, change_slot_color
+from .extra_shelf_interactions import (
+    test_leds,
+    reset_leds,
+    change_slot_color,
+    shelf_health,
+)
 
 
 # Functions moved to helpers.py
@@ -573,9 +580,26 @@ class ListStoragesAPI(generics.ListAPIView):
 
         # Get all slots with their carriers
         slots = StorageSlot.objects.filter(storage=storage_obj).select_related(
-            "carrier"
+            "carrier__article"
         )
 
+        def get_carrier_info(slot):
+            if hasattr(slot, "carrier") and slot.carrier:
+                return {
+                    "name": slot.carrier.name,
+                    "article": slot.carrier.article.name,
+                    "quantity": slot.carrier.quantity_current,
+                    "lot": slot.carrier.lot_number,
+                }
+            return None
+
+        # Carrier of each slot group, taken from the slots loaded above
+        group_carriers = {}
+        for slot in slots:
+            carrier_info = get_carrier_info(slot)
+            if slot.group_id and carrier_info:
+                group_carriers.setdefault(slot.group_id, carrier_info)
+
         # Build logical view of slots
         logical_slots = {}
         seen_names = set()
@@ -588,20 +612,10 @@ class ListStoragesAPI(generics.ListAPIView):
             seen_names.update(all_names)
 
             # Get carrier info if any slot in the group has one
-            carrier_info = None
-            for name in all_names:
-                try:
-                    check_slot = StorageSlot.objects.get(storage=storage_obj, name=name)
-                    if hasattr(check_slot, "carrier") and check_slot.carrier:
-                        carrier_info = {
-                            "name": check_slot.carrier.name,
-                            "article": check_slot.carrier.article.name,
-                            "quantity": check_slot.carrier.quantity_current,
-                            "lot": check_slot.carrier.lot_number,
-                        }
-                        break
-                except StorageSlot.DoesNotExist:
-                    continue
+            if slot.group_id:
+                carrier_info = group_carriers.get(slot.group_id)
+            else:
+                carrier_info = get_carrier_info(slot)
 
             logical_slots[str(slot.name)] = {
                 "name": slot.name,
@@ -995,8 +1009,8 @@ class StorageSlotViewSet(viewsets.ModelViewSet):
         if qr_code:
             # Search in both primary qr_value and qr_codes array
             queryset = queryset.filter(
-                Q(qr_value=qr_code) | Q(qr_codes__contains=qr_code)
-            )
+                Q(qr_value=qr_code) | Q(qr_code_entries__code=qr_code)
+            ).distinct()
 
         # Add filter for combined slots only
         combined_only = self.request.query_params.get("combined_only", None)